@@ -1,31 +1,87 @@
-from typing import Optional, List, Dict
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional, List, Dict, Sequence
 
-from langchain_chroma import Chroma
-from langchain_classic.chains.history_aware_retriever import create_history_aware_retriever
 from langchain_classic.retrievers import ContextualCompressionRetriever
 from langchain_classic.retrievers.document_compressors import LLMChainExtractor
-from langchain_community.embeddings import DashScopeEmbeddings
 
 from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
-from config.env_utils import ALi_API_KEY
+from RAG.ingestion import chunk_id
+from RAG.reranker import get_reranker
+from RAG.sparse_index import fuse_documents
+from RAG.vectorstore import get_vectorstore
+from config.env_utils import (RAG_DEFAULT_STRATEGY, RAG_MEDIUM_STRATEGY, HYBRID_CANDIDATE_FACTOR,
+                              RERANK_CANDIDATES, RERANK_TOP_N, CONDENSE_CACHE_SIZE)
 from config.llm_config import qwen
 
 
+def history_key(chat_history: Sequence[BaseMessage]) -> str:
+    """对话历史的内容摘要，用作改写缓存与答案缓存的作用域"""
+    if not chat_history:
+        return ""
+    digest = hashlib.sha1()
+    for message in chat_history:
+        digest.update(f"{message.type}\x1f{message.content}\x1e".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+
 class AdaptiveRetrieval:
-    def __init__(self, vectorstore_path: str):
-        self.embeddings=DashScopeEmbeddings(model="text-embedding-v4", dashscope_api_key=ALi_API_KEY)
-        self.vectorstore = Chroma(persist_directory=vectorstore_path, embedding_function=self.embeddings)
-        self.retriever=self.vectorstore.as_retriever(search_kwargs={"k": 5})
-        self.history_retriever=self.history_retriever()
+    def __init__(self, vectorstore_path: str, search_k: int = 5):
+        self.vectorstore_path = vectorstore_path
+        self.search_k = search_k
+        # 进程内共享的向量库门面：同一目录只有一个 Chroma 句柄，嵌入为带内容哈希缓存的共享实例
+        # 向量检索一律经门面，VECTOR_BACKEND 切换 Chroma / 紧凑存储时检索器无需改动
+        self.store = get_vectorstore(vectorstore_path)
+        self.embeddings = self.store.embeddings
+        # 实际生效的索引参数（HNSW 由 VECTOR_SPACE / HNSW_* 配置，紧凑存储由 VECTOR_QUANTIZATION 等配置）
+        self.index_config = self.store.index_config()
+        self.retriever=self.store.as_retriever(k=search_k)
+        self.condense_chain=self.condense_chain()
+        # （历史摘要, 问题）→ 独立问题；同一线程反复修改重跑时不再重复调用改写模型
+        self._condensed: "OrderedDict[tuple, str]" = OrderedDict()
+        self._condense_hits = 0
+        self._condense_misses = 0
         self.compress_retriever=ContextualCompressionRetriever(base_compressor=LLMChainExtractor.from_llm(qwen),
                                                                base_retriever=self.retriever)
-    def history_retriever(self):
+        # 门面上共享的 BM25 索引（与进程内挂载的 research 服务共用一份），首次使用时全量加载，之后增量同步
+        self.sparse_index = self.store.sparse_index
+        self.store.sync_sparse()
+        print(f"🔤 BM25 索引已加载 {len(self.sparse_index)} 个片段")
+    def condense_chain(self):
         prompt=ChatPromptTemplate.from_messages([('system','请你基于历史对话信息，重新组织生成一个独立的问题。'
                                                            '不要回答问题，只返回重新组织后的问题。'),
                                                  MessagesPlaceholder("chat_history"),('human','{input}')])
-        return create_history_aware_retriever(llm=qwen,retriever=self.retriever,prompt=prompt)
+        return prompt | qwen | StrOutputParser()
+
+    async def condense_question(self, query: str, chat_history: Optional[List[BaseMessage]] = None) -> str:
+        """结合对话历史把追问改写为独立问题；无历史时原样返回，结果按（历史, 问题）缓存"""
+        if not chat_history:
+            return query
+        key = (history_key(chat_history), query)
+        cached = self._condensed.get(key)
+        if cached is not None:
+            self._condensed.move_to_end(key)
+            self._condense_hits += 1
+            return cached
+        self._condense_misses += 1
+        standalone = (await self.condense_chain.ainvoke({"input": query, "chat_history": chat_history})).strip()
+        standalone = standalone or query
+        self._condensed[key] = standalone
+        if len(self._condensed) > CONDENSE_CACHE_SIZE:
+            self._condensed.popitem(last=False)
+        print(f"📝 历史改写: {query} → {standalone}")
+        return standalone
+
+    def condense_stats(self) -> dict:
+        total = self._condense_hits + self._condense_misses
+        return {"entries": len(self._condensed), "hits": self._condense_hits, "misses": self._condense_misses,
+                "hit_rate": round(self._condense_hits / total, 3) if total else None}
 
     def assess_query_complexity(self, query: str) -> str:
         """评估查询复杂度"""
@@ -39,40 +95,65 @@ class AdaptiveRetrieval:
         else:
             return "low"
 
+    async def hybrid_search(self, query: str, k: Optional[int] = None, where: Optional[dict] = None) -> List[Document]:
+        """BM25 与向量检索各取 k×倍率 个候选，用倒数排名融合后取前 k 个；where 同时作用于两路检索"""
+        k = k or self.search_k
+        candidates = k * HYBRID_CANDIDATE_FACTOR
+        # 向量库版本号变化（任意途径写入）后下一次检索即同步，保证写后可读
+        await asyncio.to_thread(self.store.sync_sparse)
+        dense_docs, sparse_hits = await asyncio.gather(
+            self.store.asimilarity_search(query, k=candidates, filter=where),
+            asyncio.to_thread(self.sparse_index.search, query, candidates, where),
+        )
+        return fuse_documents(dense_docs, sparse_hits, self.sparse_index, top_n=k)
+
+    async def rerank_search(self, query: str, candidate_k: int = RERANK_CANDIDATES,
+                            top_n: int = RERANK_TOP_N) -> List[Document]:
+        """混合检索多取 candidate_k 个候选，本地重排后保留 top_n 个（不调用大模型）"""
+        candidates = await self.hybrid_search(query, k=candidate_k)
+        return await get_reranker().arerank(query, candidates, top_n=top_n)
+
     async def adaptive_retrieve(
             self,query: str,chat_history: Optional[List] = None,strategy: str = "history_aware") -> List[Dict]:
-        """自适应检索策略"""
+        """自适应检索策略（全部使用异步检索，避免阻塞事件循环）"""
 
         if strategy == "simple":
             # 简单检索
-            docs = self.retriever.invoke(query)
+            docs = await self.retriever.ainvoke(query)
 
         elif strategy == "history_aware" and chat_history:
-            # 考虑历史
-            docs = self.history_retriever.invoke({
-                "input": query,
-                "chat_history": chat_history
-            })
+            # 考虑历史：先改写为独立问题，再按复杂度选择检索策略
+            standalone = await self.condense_question(query, chat_history)
+            return await self.adaptive_retrieve(standalone, strategy="auto")
         elif strategy=="compressed":
-            docs=self.compress_retriever.invoke(query)
+            docs=await self.compress_retriever.ainvoke(query)
+        elif strategy == "hybrid":
+            # 稀疏 + 稠密混合检索，精确词（型号、人名、数字）不再被漏召回
+            docs = await self.hybrid_search(query)
+        elif strategy == "rerank":
+            docs = await self.rerank_search(query)
         else:
             complexity = self.assess_query_complexity(query)
             if complexity == "high" and chat_history:
                 # 高度复杂查询
-                docs = self.history_retriever.invoke({
-                    "input": query,
-                    "chat_history": chat_history
-                })
+                standalone = await self.condense_question(query, chat_history)
+                docs = await self.retriever.ainvoke(standalone)
+            elif complexity == "medium" and RAG_MEDIUM_STRATEGY == "rerank":
+                # 中等复杂查询：默认本地重排序，RAG_MEDIUM_STRATEGY=compressed 时使用大模型压缩
+                docs = await self.rerank_search(query)
             elif complexity == "medium":
-                # 中等复杂查询
-                docs = self.compress_retriever.invoke(query)
+                docs = await self.compress_retriever.ainvoke(query)
+            elif RAG_DEFAULT_STRATEGY == "hybrid":
+                # 简单查询（默认混合检索，可通过 RAG_DEFAULT_STRATEGY=simple 退回纯向量检索）
+                docs = await self.hybrid_search(query)
             else:
-                # 简单查询
-                docs = self.retriever.invoke(query)
+                docs = await self.retriever.ainvoke(query)
         return [{"content": doc.page_content, "metadata": doc.metadata} for doc in docs]
     async  def add_to_knowlege(self,documents:List[str],metadata:Optional[Dict]=None):
         if metadata is None:
             metadata={}
-        self.vectorstore.add_documents(documents=[Document(page_content=doc,metadata=metadata) for doc in documents])
-        self.vectorstore.persist()
+        # 经共享门面写入：持有写锁并递增版本号
+        docs = [Document(page_content=doc, metadata=metadata) for doc in documents]
+        ids = [chunk_id(doc, metadata.get("source", "")) for doc in documents]
+        await asyncio.to_thread(self.store.add_documents, docs, ids)
         return f"成功添加 {len(documents)} 个文档到知识库"
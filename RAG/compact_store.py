@@ -0,0 +1,452 @@
+"""
+紧凑向量存储（VECTOR_BACKEND=compact）：知识库规模受检索主机内存限制时替代 Chroma 的 HNSW 索引
+- 原始 float32 向量按行追加写入磁盘文件，以内存映射方式读取，只有精排候选的行会被换入内存
+- 粗排使用压缩码：int8（每个向量一个缩放系数，约 1/4 大小）或乘积量化 PQ（每个子空间 1 字节）
+- 检索流程：压缩码扫描全部向量取 k×RESCORE_FACTOR 个候选 → 读取候选的原始向量精确打分 → 取前 k 个
+- Chroma 仍保存文档与元数据（只存 1 维占位向量），BM25 同步、来源索引、where 过滤与写锁/版本号逻辑全部沿用
+"""
+import json
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from RAG.vectorstore import SharedVectorStore, VECTOR_SPACES
+from config.env_utils import VECTOR_SPACE, VECTOR_QUANTIZATION, PQ_SUBSPACES, RESCORE_FACTOR
+
+QUANTIZATIONS = ("int8", "pq", "none")
+# 只在首次建库时生效的参数，已有存储沿用 meta.json 中的值
+CREATION_ONLY_KEYS = ("space", "quantization", "pq_subspaces")
+INDEX_DIR = "compact_vectors"
+DOCS_SUFFIX = "_compact"
+PLACEHOLDER = [0.0]
+SCAN_CHUNK = 4096  # 粗排每次扫描的行数：int8 解码出的 float32 中间结果保持在缓存可容纳的大小
+PQ_CENTROIDS = 256
+PQ_MIN_TRAIN = 4 * PQ_CENTROIDS  # 向量数达到该值才训练码本，之前直接精确扫描（数据量小，代价可忽略）
+PQ_TRAIN_SAMPLE = 10000
+PQ_RETRAIN_GROWTH = 4  # 训练样本不足 PQ_TRAIN_SAMPLE 时，向量数增长到上次训练的该倍数即重新训练
+PQ_ITERATIONS = 12
+
+
+class _RowFile:
+    """定长行的二进制文件：追加写入、按行覆盖、以内存映射方式读取"""
+
+    def __init__(self, path: str, dtype, width: Optional[int] = None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+
+    def _shape(self, rows: int) -> tuple:
+        return (rows,) if self.width is None else (rows, self.width)
+
+    def _row_bytes(self) -> int:
+        return self.dtype.itemsize * (self.width or 1)
+
+    def view(self, rows: int) -> np.ndarray:
+        if rows == 0 or not os.path.exists(self.path):
+            return np.zeros(self._shape(0), dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode="r", shape=self._shape(rows))
+
+    def append(self, rows: int, values: np.ndarray):
+        """在第 rows 行之后追加（先截掉上次中断写入留下的多余字节）"""
+        with open(self.path, "ab") as f:
+            f.truncate(rows * self._row_bytes())
+            f.write(np.ascontiguousarray(values, dtype=self.dtype).tobytes())
+
+    def overwrite(self, rows: int, positions: np.ndarray, values: np.ndarray):
+        array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=self._shape(rows))
+        array[positions] = values
+        array.flush()
+        del array
+
+    def nbytes(self, rows: int) -> int:
+        return rows * self._row_bytes()
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    distances = (centroids * centroids).sum(axis=1)[None, :] - 2 * data @ centroids.T
+    return distances.argmin(axis=1)
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0  # 空簇保留原中心
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class CompactVectorIndex:
+    """磁盘上的向量文件 + 压缩码；写入由调用方加锁（SharedVectorStore.write_lock），读取取快照不加锁"""
+
+    def __init__(self, path: str, space: str = VECTOR_SPACE, quantization: str = VECTOR_QUANTIZATION,
+                 pq_subspaces: int = PQ_SUBSPACES, rescore_factor: int = RESCORE_FACTOR):
+        if space not in VECTOR_SPACES:
+            raise ValueError(f"不支持的距离度量: {space}，可选: {', '.join(VECTOR_SPACES)}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"不支持的压缩方式: {quantization}，可选: {', '.join(QUANTIZATIONS)}")
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self.rescore_factor = max(1, rescore_factor)
+        self._meta_file = os.path.join(self.path, "meta.json")
+        self._ids_file = os.path.join(self.path, "ids.txt")
+        self._codebook_file = os.path.join(self.path, "codebook.npy")
+        self._lock = threading.RLock()
+        requested = {"space": space, "quantization": quantization, "pq_subspaces": pq_subspaces}
+        meta = self._read_meta()
+        if meta is None:
+            meta = {**requested, "dim": None, "rows": 0, "ids_bytes": 0, "pq_trained": False, "pq_trained_rows": 0}
+        else:
+            mismatched = {key: meta[key] for key in CREATION_ONLY_KEYS if meta.get(key) != requested[key]}
+            if mismatched:
+                print(f"⚠️ 紧凑向量存储已按 {mismatched} 创建，新的参数需删除 {self.path} 后重新入库生效", file=sys.stderr)
+        self.meta = meta
+        self.reload()
+
+    # ===== 持久化 =====
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(self._meta_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self):
+        tmp = f"{self._meta_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_file)
+
+    def _files(self) -> Dict[str, _RowFile]:
+        dim = self.meta["dim"]
+        files = {"vectors": _RowFile(os.path.join(self.path, "vectors.f32"), np.float32, dim),
+                 "norms": _RowFile(os.path.join(self.path, "norms.f32"), np.float32),
+                 "live": _RowFile(os.path.join(self.path, "live.u8"), np.uint8)}
+        if self.meta["quantization"] == "int8":
+            files["codes"] = _RowFile(os.path.join(self.path, "codes.i8"), np.int8, dim)
+            files["scales"] = _RowFile(os.path.join(self.path, "scales.f32"), np.float32)
+        elif self.meta["quantization"] == "pq":
+            files["codes"] = _RowFile(os.path.join(self.path, "codes.pq"), np.uint8, self.meta["pq_subspaces"])
+        return files
+
+    def reload(self):
+        """按 meta.json 重新读取 id 列表与删除标记（初始化，或其它进程写入后由门面按版本号触发）；
+        本进程的写入只增量更新内存状态，不走这里"""
+        with self._lock:
+            meta = self._read_meta() or self.meta
+            rows = meta["rows"]
+            ids: List[str] = []
+            if rows:
+                with open(self._ids_file, "rb") as f:
+                    ids = f.read(meta["ids_bytes"]).decode("utf-8").split("\n")[:rows]
+            self.meta = meta
+            self._ids = ids
+            self._live = np.zeros(max(2 * rows, 1024), dtype=bool)
+            if rows:
+                self._live[:rows] = np.asarray(self._files()["live"].view(rows), dtype=bool)
+            self._row_of = {doc_id: row for row, doc_id in enumerate(ids) if self._live[row]}
+            self._publish(np.load(self._codebook_file) if meta.get("pq_trained") else None)
+
+    def _publish(self, codebook: Optional[np.ndarray]):
+        """按当前行数重新映射文件并整体替换快照；读取方只引用自己取到的那一份，不需要加锁"""
+        rows = self.meta["rows"]
+        views = {name: file.view(rows) for name, file in self._files().items() if name != "live"} \
+            if self.meta["dim"] else {}
+        if self.meta["quantization"] == "pq" and not self.meta["pq_trained"]:
+            views.pop("codes", None)
+        # ids 与删除标记只在末尾追加、原位置零，旧快照按自己的行数读取不受影响
+        self._state = {"rows": rows, "ids": self._ids, "views": views, "codebook": codebook,
+                       "live": self._live[:rows], "dead": rows - len(self._row_of)}
+
+    def _append_live(self, count: int):
+        """删除标记预留容量，按倍数扩容，追加写入均摊 O(1)"""
+        rows = self.meta["rows"]
+        if rows + count > len(self._live):
+            grown = np.zeros(max(2 * len(self._live), rows + count), dtype=bool)
+            grown[:rows] = self._live[:rows]
+            self._live = grown
+        self._live[rows:rows + count] = True
+
+    # ===== 编码 =====
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.meta["space"] == "cosine":
+            norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        return vectors
+
+    @staticmethod
+    def _encode_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _encode_pq(self, vectors: np.ndarray, codebook: np.ndarray) -> np.ndarray:
+        m, _, sub_dim = codebook.shape
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for j in range(m):
+            codes[:, j] = _nearest(vectors[:, j * sub_dim:(j + 1) * sub_dim], codebook[j])
+        return codes
+
+    def _train_pq(self, files: Dict[str, _RowFile]) -> np.ndarray:
+        """在已有向量的抽样上逐子空间做 k-means 得到码本，再为全部向量编码；
+        新的码本与编码先写临时文件再原子替换，读取方仍映射着的旧文件不会被截断"""
+        dim, m, rows = self.meta["dim"], self.meta["pq_subspaces"], self.meta["rows"]
+        if dim % m:
+            raise ValueError(f"PQ 子空间数 {m} 需要整除向量维度 {dim}（调整 PQ_SUBSPACES）")
+        vectors = files["vectors"].view(rows)
+        live_rows = np.flatnonzero(np.asarray(files["live"].view(rows), dtype=bool))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live_rows, size=min(PQ_TRAIN_SAMPLE, len(live_rows)), replace=False))
+        data = np.asarray(vectors[sample])
+        sub_dim = dim // m
+        codebook = np.stack([_kmeans(data[:, j * sub_dim:(j + 1) * sub_dim], PQ_CENTROIDS, PQ_ITERATIONS, rng)
+                             for j in range(m)]).astype(np.float32)
+        codes = _RowFile(f"{files['codes'].path}.{os.getpid()}.tmp", np.uint8, m)
+        with open(codes.path, "wb"):
+            pass
+        for start in range(0, rows, SCAN_CHUNK):
+            chunk = np.asarray(vectors[start:start + SCAN_CHUNK])
+            codes.append(start, self._encode_pq(chunk, codebook))
+        codebook_tmp = f"{self._codebook_file}.{os.getpid()}.tmp"
+        with open(codebook_tmp, "wb") as f:
+            np.save(f, codebook)
+        os.replace(codes.path, files["codes"].path)
+        os.replace(codebook_tmp, self._codebook_file)
+        self.meta["pq_trained"] = True
+        self.meta["pq_trained_rows"] = rows
+        print(f"🧮 PQ 码本训练完成：{m} 个子空间 × {PQ_CENTROIDS} 个中心，已编码 {rows} 个向量", file=sys.stderr)
+        return codebook
+
+    def _needs_training(self) -> bool:
+        """首次达到 PQ_MIN_TRAIN 时训练；之后样本不足时随语料增长重训，码本不再停留在最早入库的少量片段上"""
+        if self.meta["quantization"] != "pq":
+            return False
+        rows, trained_rows = self.meta["rows"], self.meta.get("pq_trained_rows", 0)
+        if not self.meta["pq_trained"]:
+            return rows >= PQ_MIN_TRAIN
+        return trained_rows < PQ_TRAIN_SAMPLE and rows >= trained_rows * PQ_RETRAIN_GROWTH
+
+    # ===== 写入（调用方持有写锁） =====
+    def upsert(self, ids: Sequence[str], embeddings) -> int:
+        """写入或覆盖向量：已有 id 原位覆盖，新 id 追加到文件末尾；返回新增的行数"""
+        latest: Dict[str, int] = {}
+        for i, doc_id in enumerate(ids):
+            if "\n" in doc_id:
+                raise ValueError(f"片段 id 不能包含换行: {doc_id!r}")
+            latest[doc_id] = i  # 同一批内重复的 id 以最后一次为准
+        vectors = self._prepare(np.asarray(embeddings, dtype=np.float32)[list(latest.values())])
+        ids = list(latest)
+        with self._lock:
+            if self.meta["dim"] is None:
+                self.meta["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != self.meta["dim"]:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与已有向量维度 {self.meta['dim']} 不一致")
+            files = self._files()
+            columns = {"vectors": vectors, "norms": (vectors * vectors).sum(axis=1),
+                       "live": np.ones(len(vectors), dtype=np.uint8)}
+            if self.meta["quantization"] == "int8":
+                columns["codes"], columns["scales"] = self._encode_int8(vectors)
+            elif self.meta["pq_trained"]:
+                columns["codes"] = self._encode_pq(vectors, self._state["codebook"])
+
+            rows = self.meta["rows"]
+            positions = np.array([self._row_of.get(doc_id, -1) for doc_id in ids])
+            existing, new = np.flatnonzero(positions >= 0), np.flatnonzero(positions < 0)
+            for name, values in columns.items():
+                if len(existing):
+                    files[name].overwrite(rows, positions[existing], values[existing])
+                if len(new):
+                    files[name].append(rows, values[new])
+            if len(new):
+                encoded = "".join(f"{ids[i]}\n" for i in new).encode("utf-8")
+                with open(self._ids_file, "ab") as f:
+                    f.truncate(self.meta["ids_bytes"])
+                    f.write(encoded)
+                self._append_live(len(new))
+                self._ids.extend(ids[i] for i in new)
+                self._row_of.update((ids[i], rows + j) for j, i in enumerate(new))
+                self.meta["rows"] = rows + len(new)
+                self.meta["ids_bytes"] += len(encoded)
+            codebook = self._state["codebook"]
+            if self._needs_training():
+                codebook = self._train_pq(files)
+            self._write_meta()
+            self._publish(codebook)
+            return len(new)
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """只把行标记为已删除（不回收磁盘空间），返回实际删除数"""
+        with self._lock:
+            positions = np.array(sorted({self._row_of[i] for i in ids if i in self._row_of}), dtype=np.int64)
+            if len(positions):
+                self._files()["live"].overwrite(self.meta["rows"], positions, np.zeros(len(positions), np.uint8))
+                self._live[positions] = False
+                for doc_id in ids:
+                    self._row_of.pop(doc_id, None)
+                self._publish(self._state["codebook"])
+            return len(positions)
+
+    # ===== 检索 =====
+    def rows_for(self, ids: Sequence[str]) -> np.ndarray:
+        # 写入线程可能同时增删映射，只用单次 get 查找
+        rows = (self._row_of.get(i) for i in ids)
+        return np.array(sorted(row for row in rows if row is not None), dtype=np.int64)
+
+    def _scores(self, state: dict, query: np.ndarray, rows: Optional[np.ndarray], approximate: bool) -> np.ndarray:
+        """打分越大越相近（l2 为负的平方距离去掉查询项）；rows 为 None 时分块扫描全部行"""
+        views = state["views"]
+        if approximate and self.meta["quantization"] == "pq":
+            codebook = state["codebook"]
+            m, _, sub_dim = codebook.shape
+            table = np.einsum("mcd,md->mc", codebook, query.reshape(m, sub_dim))
+
+        def dots(selection) -> np.ndarray:
+            if not approximate:
+                return np.asarray(views["vectors"][selection]) @ query
+            if self.meta["quantization"] == "int8":
+                return (np.asarray(views["codes"][selection], dtype=np.float32) @ query) * views["scales"][selection]
+            return table[np.arange(m), np.asarray(views["codes"][selection])].sum(axis=1)
+
+        if rows is not None:
+            result = dots(rows)
+            norms = views["norms"][rows]
+        else:
+            result = np.concatenate([dots(slice(s, s + SCAN_CHUNK)) for s in range(0, state["rows"], SCAN_CHUNK)])
+            norms = views["norms"]
+        if self.meta["space"] == "l2":
+            result = 2 * result - norms
+        return result.astype(np.float32)
+
+    def search(self, embedding, k: int, rows: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """压缩码粗排取 k×rescore_factor 个候选，再用原始向量精排；rows 限定候选范围（元数据过滤）"""
+        state = self._state
+        if state["rows"] == 0 or k <= 0:
+            return []
+        query = self._prepare(np.asarray(embedding, dtype=np.float32))
+        if rows is None:
+            rows = np.flatnonzero(state["live"]) if state["dead"] else None
+        else:
+            rows = rows[state["live"][rows]]
+        total = state["rows"] if rows is None else len(rows)
+        if total == 0:
+            return []
+        approximate = "codes" in state["views"]
+        candidates = min(total, k * self.rescore_factor if approximate else k)
+        scores = self._scores(state, query, rows, approximate)
+        top = np.arange(total) if candidates == total else np.argpartition(-scores, candidates - 1)[:candidates]
+        top = np.sort(top)  # rows 有序，候选行也按顺序读取，内存映射按页顺序换入
+        top_rows = top if rows is None else rows[top]
+        exact = self._scores(state, query, top_rows, approximate=False) if approximate else scores[top]
+        order = np.argsort(-exact)[:k]
+        return [(state["ids"][top_rows[i]], float(exact[i])) for i in order]
+
+    def stats(self) -> dict:
+        rows = self.meta["rows"]
+        live = rows - self._state["dead"]
+        files = self._files() if self.meta["dim"] else {}
+        float_bytes = files["vectors"].nbytes(rows) if files else 0
+        # 粗排常驻内存：压缩码 + 范数 + 缩放系数 + 删除标记 + 码本；原始向量只按需换入
+        resident = sum(files[n].nbytes(rows) for n in files if n != "vectors")
+        if self._state["codebook"] is not None:
+            resident += self._state["codebook"].nbytes
+        if "codes" not in self._state["views"]:
+            resident += float_bytes  # 未压缩（none 或 PQ 尚未训练）时粗排直接扫描原始向量
+        return {"backend": "compact", "quantization": self.meta["quantization"], "space": self.meta["space"],
+                "dim": self.meta["dim"], "rows": rows, "live": live, "pq_trained": self.meta["pq_trained"],
+                "float_mb": round(float_bytes / 2 ** 20, 2), "resident_mb": round(resident / 2 ** 20, 2),
+                "saved_ratio": round(1 - resident / float_bytes, 3) if float_bytes else 0.0}
+
+
+class CompactVectorStore(SharedVectorStore):
+    """接口与 SharedVectorStore 一致；向量写入紧凑存储，文档与元数据写入 Chroma 集合 <collection_name>_compact"""
+
+    def __init__(self, path: str, embeddings: Optional[Embeddings] = None, collection_name: str = "langchain",
+                 space: str = VECTOR_SPACE, quantization: str = VECTOR_QUANTIZATION,
+                 pq_subspaces: int = PQ_SUBSPACES, rescore_factor: int = RESCORE_FACTOR):
+        self.index = CompactVectorIndex(os.path.join(os.path.abspath(path), INDEX_DIR), space=space,
+                                        quantization=quantization, pq_subspaces=pq_subspaces,
+                                        rescore_factor=rescore_factor)
+        super().__init__(path, embeddings=embeddings, index_config={"hnsw:space": "l2"},
+                         collection_name=f"{collection_name}{DOCS_SUFFIX}")
+        self._import_chroma_collection(collection_name)
+        stats = self.index.stats()
+        print(f"📦 紧凑向量存储（{stats['quantization']}）：{stats['live']} 个向量，"
+              f"原始 {stats['float_mb']} MB → 粗排常驻 {stats['resident_mb']} MB", file=sys.stderr)
+
+    def _check_index_config(self):
+        """占位集合不建向量索引，压缩参数由 CompactVectorIndex 按 meta.json 校验"""
+
+    def set_search_ef(self, search_ef: int):
+        print("⚠️ 紧凑向量存储没有 HNSW 索引，检索 ef 不适用（精排候选数由 RESCORE_FACTOR 控制）", file=sys.stderr)
+
+    def index_config(self) -> dict:
+        meta = self.index.meta
+        return {"backend": "compact", "space": meta["space"], "quantization": meta["quantization"],
+                "pq_subspaces": meta["pq_subspaces"] if meta["quantization"] == "pq" else None,
+                "rescore_factor": self.index.rescore_factor}
+
+    def _import_chroma_collection(self, name: str, batch_size: int = 1000):
+        """首次切换到紧凑存储时，把同目录下 Chroma 集合中已有的片段连同向量导入（不重新嵌入）"""
+        if self.count():
+            return
+        try:
+            source = self.chroma._client.get_collection(name)
+        except Exception:
+            return
+        total, offset = source.count(), 0
+        if not total:
+            return
+        with self.write_lock():
+            while offset < total:
+                batch = source.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    break
+                self._upsert_locked(batch["ids"], batch["documents"], batch["metadatas"], batch["embeddings"])
+                offset += len(batch["ids"])
+            self._bump_version()
+        print(f"📦 已从 Chroma 集合 {name} 导入 {offset} 个片段到紧凑向量存储", file=sys.stderr)
+
+    # ===== 版本同步 =====
+    def _reopen(self):
+        """其它进程经门面写入后（版本号变化）随 Chroma 客户端一起重新读取向量文件；
+        检索只在版本号变化时短暂持有进程内的锁，不取目录级文件锁，本进程写入后增量更新不触发"""
+        super()._reopen()
+        self.index.reload()
+
+    # ===== 写入 =====
+    def _upsert_locked(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings):
+        self.collection.upsert(ids=ids, embeddings=[PLACEHOLDER] * len(ids), documents=documents,
+                               metadatas=metadatas)
+        self.index.upsert(ids, embeddings)
+
+    def _delete_locked(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+        self.index.delete(ids)
+
+    # ===== 检索 =====
+    def search_by_vector(self, embedding, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        self._refresh()
+        rows = None
+        if filter:
+            rows = self.index.rows_for(self.collection.get(where=filter, include=[])["ids"])
+        hits = self.index.search(embedding, k, rows)
+        if not hits:
+            return []
+        found = self.collection.get(ids=[doc_id for doc_id, _ in hits], include=["documents", "metadatas"])
+        by_id = {doc_id: (text, metadata) for doc_id, text, metadata
+                 in zip(found["ids"], found["documents"], found["metadatas"])}
+        return [Document(id=doc_id, page_content=by_id[doc_id][0], metadata=by_id[doc_id][1] or {})
+                for doc_id, _ in hits if doc_id in by_id]
+
+    def stats(self) -> dict:
+        return {**super().stats(), "compact": self.index.stats()}
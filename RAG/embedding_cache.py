@@ -0,0 +1,249 @@
+"""
+嵌入缓存层：包在 DashScopeEmbeddings 外面，按内容哈希缓存查询/文档向量
+- 一级：进程内 LRU（OrderedDict）
+- 二级：向量库目录旁的 SQLite 文件，跨进程、跨重启共享
+- 缓存键包含模型名与嵌入类型（query/document），切换模型不会命中旧向量
+- 异步接口只在事件循环上查进程内 LRU，SQLite 读写放到线程池；磁盘命中的 last_used 攒批更新，不逐次提交
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Dict, Tuple
+
+from langchain_community.embeddings import DashScopeEmbeddings
+from langchain_core.embeddings import Embeddings
+
+from config.env_utils import (ALi_API_KEY, EMBEDDING_MODEL, EMBEDDING_CACHE_MEMORY_ITEMS,
+                              EMBEDDING_CACHE_DISK_ITEMS)
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array("d", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array("d")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+# 磁盘命中后的 last_used 更新攒够该条数或超过该秒数才写库（也会随下一次写入一起提交）
+TOUCH_BATCH = 256
+TOUCH_INTERVAL = 30.0
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying: Embeddings, namespace: str, db_path: Optional[str] = None,
+                 max_memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+                 max_disk_items: int = EMBEDDING_CACHE_DISK_ITEMS):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        # 内存 LRU 以 float32 紧凑数组保存（1024 维约 4KB/条），返回时再转为列表
+        self._memory: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserts_since_prune = 0
+        self._touched: Dict[str, float] = {}
+        self._last_touch_flush = time.monotonic()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._conn = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+            self._conn.commit()
+
+    # ===== 缓存读写 =====
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _lookup_memory(self, keys: List[str]) -> Dict[str, List[float]]:
+        """只查进程内 LRU，不做 I/O，可以直接在事件循环上调用"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector.tolist()
+                    self._counters["memory_hits"] += 1
+        return found
+
+    def _lookup_disk(self, keys: List[str]) -> Dict[str, List[float]]:
+        """查 SQLite（阻塞），未命中的计入 misses"""
+        found = {}
+        with self._lock:
+            if keys and self._conn is not None:
+                rows = []
+                # SQLite 参数个数有限制，分批查询
+                for i in range(0, len(keys), 500):
+                    batch = keys[i:i + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows.extend(self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall())
+                now = time.time()
+                for key, blob in rows:
+                    vector = _unpack(blob)
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self._touched[key] = now
+                    self._counters["disk_hits"] += 1
+                if len(self._touched) >= TOUCH_BATCH or time.monotonic() - self._last_touch_flush >= TOUCH_INTERVAL:
+                    self._flush_touched()
+                    self._conn.commit()
+            self._counters["misses"] += len(keys) - len(found)
+        return found
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = self._lookup_memory(keys)
+        found.update(self._lookup_disk([k for k in keys if k not in found]))
+        return found
+
+    def _flush_touched(self):
+        """写入攒下的 last_used（调用方持有锁并负责提交）"""
+        if self._touched:
+            self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                   [(ts, key) for key, ts in self._touched.items()])
+            self._touched = {}
+        self._last_touch_flush = time.monotonic()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = array("f", vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _store(self, items: List[Tuple[str, List[float]]]):
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+            if self._conn is None:
+                return
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, namespace, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, self.namespace, _pack(vector), now) for key, vector in items])
+            self._flush_touched()
+            self._conn.commit()
+            self._inserts_since_prune += len(items)
+            if self._inserts_since_prune >= 1000:
+                self._prune_disk()
+
+    def _prune_disk(self):
+        """磁盘缓存超过上限时按最近使用时间淘汰最旧的 10%"""
+        self._inserts_since_prune = 0
+        self._flush_touched()
+        total = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if total <= self.max_disk_items:
+            return
+        excess = total - self.max_disk_items + self.max_disk_items // 10
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,))
+        self._conn.commit()
+        self._counters["evictions"] += excess
+
+    # ===== 同步接口 =====
+    def _split(self, kind: str, texts: List[str]):
+        keys = [self._key(kind, t) for t in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+        # 同一批次内重复文本只请求一次
+        pending = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in found))
+        return keys, found, pending
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, pending = self._split("document", texts)
+        if pending:
+            vectors = self.underlying.embed_documents(pending)
+            new_items = [(self._key("document", t), v) for t, v in zip(pending, vectors)]
+            self._store(new_items)
+            found.update(new_items)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, pending = self._split("query", [text])
+        if pending:
+            vector = self.underlying.embed_query(text)
+            self._store([(keys[0], vector)])
+            return vector
+        return found[keys[0]]
+
+    # ===== 异步接口：SQLite 读写不占用事件循环 =====
+    async def _asplit(self, kind: str, texts: List[str]):
+        keys = [self._key(kind, t) for t in texts]
+        unique = list(dict.fromkeys(keys))
+        found = self._lookup_memory(unique)
+        missing = [k for k in unique if k not in found]
+        if missing:
+            found.update(await asyncio.to_thread(self._lookup_disk, missing))
+        pending = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in found))
+        return keys, found, pending
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, pending = await self._asplit("document", texts)
+        if pending:
+            vectors = await self.underlying.aembed_documents(pending)
+            new_items = [(self._key("document", t), v) for t, v in zip(pending, vectors)]
+            await asyncio.to_thread(self._store, new_items)
+            found.update(new_items)
+        return [found[k] for k in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, pending = await self._asplit("query", [text])
+        if pending:
+            vector = await self.underlying.aembed_query(text)
+            await asyncio.to_thread(self._store, [(keys[0], vector)])
+            return vector
+        return found[keys[0]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = sum(self._counters[k] for k in ("memory_hits", "disk_hits", "misses"))
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            disk_items = (self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                          if self._conn is not None else 0)
+            return {
+                "namespace": self.namespace,
+                **self._counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+                "memory_items": len(self._memory),
+                "disk_items": disk_items,
+                "db_path": self.db_path,
+            }
+
+
+_shared: Dict[Tuple[str, str], CachedEmbeddings] = {}
+_shared_lock = threading.Lock()
+
+
+def embedding_cache_path(vectorstore_path: str) -> str:
+    """磁盘缓存文件放在 Chroma 目录旁边"""
+    return os.path.abspath(vectorstore_path).rstrip(os.sep) + "_embedding_cache.sqlite"
+
+
+def get_cached_embeddings(vectorstore_path: str, model: str = EMBEDDING_MODEL) -> CachedEmbeddings:
+    """进程内按（向量库路径, 模型）共享同一个带缓存的嵌入对象"""
+    key = (os.path.abspath(vectorstore_path), model)
+    with _shared_lock:
+        if key not in _shared:
+            underlying = DashScopeEmbeddings(model=model, dashscope_api_key=ALi_API_KEY)
+            _shared[key] = CachedEmbeddings(underlying, namespace=model,
+                                            db_path=embedding_cache_path(vectorstore_path))
+        return _shared[key]
+
+
+def embedding_cache_stats() -> list:
+    return [cache.stats() for cache in list(_shared.values())]
@@ -0,0 +1,119 @@
+"""
+异步入库任务队列
+/upload 只负责落盘并入队，后台 worker 池按并发上限执行入库，客户端通过 job_id 轮询进度
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config.env_utils import INGEST_WORKERS, INGEST_JOB_HISTORY
+from RAG.ingestion import count_pages
+
+
+class IngestJob:
+    def __init__(self, file_path: Path, filename: str, source_name: Optional[str] = None, mode: str = "skip"):
+        self.id = uuid.uuid4().hex
+        self.file_path = Path(file_path)
+        self.filename = filename
+        self.source_name = source_name
+        self.mode = mode
+        self.status = "queued"  # queued / running / succeeded / failed
+        self.total_pages: Optional[int] = None
+        self.progress: Dict = {"pages_parsed": 0, "chunks_split": 0, "chunks_embedded": 0, "chunks_written": 0}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def update_progress(self, progress: dict):
+        self.progress.update(progress)
+
+    def _eta_seconds(self) -> Optional[float]:
+        pages_done = self.progress.get("pages_parsed", 0)
+        if self.status != "running" or not self.total_pages or not pages_done:
+            return None
+        elapsed = time.time() - self.started_at
+        return round(elapsed / pages_done * max(self.total_pages - pages_done, 0), 1)
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "source_name": self.source_name,
+            "mode": self.mode,
+            "status": self.status,
+            "total_pages": self.total_pages,
+            **self.progress,
+            "eta_seconds": self._eta_seconds(),
+            "elapsed_seconds": round(end - self.started_at, 1) if self.started_at else None,
+            "queued_seconds": round((self.started_at or end) - self.created_at, 1),
+            "error": self.error,
+        }
+
+
+class IngestJobQueue:
+    def __init__(self, run_job: Callable[[IngestJob], Awaitable[dict]], workers: int = INGEST_WORKERS,
+                 history: int = INGEST_JOB_HISTORY):
+        """run_job 负责真正的入库，需在过程中调用 job.update_progress"""
+        self.run_job = run_job
+        self.workers = workers
+        self.history = history
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    def submit(self, file_path: Path, filename: str, source_name: Optional[str] = None,
+               mode: str = "skip") -> IngestJob:
+        job = IngestJob(file_path, filename, source_name, mode)
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def _trim_history(self):
+        # 只淘汰已结束的任务，排队/运行中的任务始终可查询
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("succeeded", "failed")]
+        for job_id in finished[:max(len(self._jobs) - self.history, 0)]:
+            del self._jobs[job_id]
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.total_pages = await asyncio.to_thread(count_pages, job.file_path)
+                result = await self.run_job(job)
+                job.update_progress(result or {})
+                job.status = "succeeded"
+                print(f"📥 入库任务 {job.id} 完成: {job.progress}")
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                print(f"❌ 入库任务 {job.id} 失败: {e}")
+            finally:
+                job.finished_at = time.time()
+                if job.file_path.exists():
+                    job.file_path.unlink()
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        counts = {"queued": 0, "running": 0, "succeeded": 0, "failed": 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {"workers": self.workers, **counts}
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
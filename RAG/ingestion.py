@@ -0,0 +1,218 @@
+"""
+流式、分批的文档入库流水线
+逐页懒加载 → 按页切分 → 按批嵌入（有界并发）→ 经共享向量库门面（RAG.vectorstore）分批写入 → 结束时统一更新一次元数据文件
+内存占用只与批大小和并发数相关，与文档页数无关
+
+片段 id 由（来源 + 归一化内容）哈希得到：
+- skip：已存在的片段直接跳过，不再嵌入
+- upsert：已存在的片段只刷新元数据，入库结束后删除同一来源下本次未出现的旧片段
+"""
+import asyncio
+import hashlib
+import json
+import re
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional, List
+
+from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from RAG.metadata_index import index_fields
+from RAG.vectorstore import SharedVectorStore
+from config.env_utils import INGEST_BATCH_SIZE, INGEST_CONCURRENCY
+
+SUPPORTED_SUFFIXES = (".pdf", ".docx")
+INGEST_MODES = ("skip", "upsert")
+
+
+def get_loader(file_path: Path):
+    suffix = file_path.suffix.lower()
+    if suffix == ".pdf":
+        return PyPDFLoader(str(file_path))
+    elif suffix == ".docx":
+        return Docx2txtLoader(str(file_path))
+    raise ValueError("仅支持 .pdf 和 .docx 文件")
+
+
+def build_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=500, chunk_overlap=50,
+        separators=["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""]
+    )
+
+
+def update_kb_meta(metadata_file: Path, total_chunks: int):
+    """更新知识库元数据文件（最后更新时间、片段总数）"""
+    meta_data = {
+        "last_updated": datetime.now().isoformat(),
+        "total_chunks": total_chunks
+    }
+    with open(metadata_file, "w", encoding="utf-8") as f:
+        json.dump(meta_data, f, ensure_ascii=False, indent=2)
+
+
+def count_pages(file_path: Path) -> Optional[int]:
+    """尽力获取总页数（仅 PDF），用于估算入库剩余时间"""
+    if Path(file_path).suffix.lower() != ".pdf":
+        return None
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(str(file_path)).pages)
+    except Exception:
+        return None
+
+
+def _clean_metadata(metadata: dict) -> dict:
+    # Chroma 元数据只接受标量：先把时间/标签整理为可过滤字段，再丢弃 None 与复杂类型
+    return {k: v for k, v in index_fields(metadata).items() if isinstance(v, (str, int, float, bool))}
+
+
+def normalize_text(text: str) -> str:
+    """全角/半角统一、空白折叠，使排版差异不影响去重"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def chunk_id(text: str, source: str) -> str:
+    """内容寻址的确定性片段 id"""
+    return hashlib.sha256(f"{source}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def _write_batch(store: SharedVectorStore, ids: List[str], batch: List[Document], vectors: List[List[float]]):
+    # 使用 upsert：并发批次间即使出现相同 id 也不会重复写入
+    store.upsert(ids, [doc.page_content for doc in batch], [_clean_metadata(doc.metadata) for doc in batch],
+                 embeddings=vectors)
+
+
+def _refresh_metadata(store: SharedVectorStore, ids: List[str], batch: List[Document]):
+    store.update(ids, [_clean_metadata(doc.metadata) for doc in batch])
+
+
+async def _run_write(func, *args):
+    """写入在线程中执行、无法中途打断：所在任务被取消时先等这次写入结束再传播取消，
+    任务结束后不会再有写入落盘"""
+    write = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(write)
+    except asyncio.CancelledError:
+        await asyncio.wait([write])
+        raise
+
+
+def _remove_stale(store: SharedVectorStore, source: str, keep_ids: set) -> int:
+    """upsert 模式：删除同一来源下本次未出现的旧片段（文档内容已变化）"""
+    stored = store.get(where={"source": source}, include=[])["ids"]
+    return store.delete(ids=[i for i in stored if i not in keep_ids])
+
+
+async def ingest_file(file_path, store: SharedVectorStore, embeddings, source_name: Optional[str] = None,
+                      metadata_file: Optional[Path] = None, mode: str = "skip",
+                      batch_size: int = INGEST_BATCH_SIZE,
+                      concurrency: int = INGEST_CONCURRENCY,
+                      on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    流式解析并入库单个文件，返回进度统计
+    on_progress 在每页解析、每批嵌入/写入后回调一次，参数为当前进度字典
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"不支持的入库模式: {mode}")
+    file_path = Path(file_path).resolve()
+    if not file_path.exists():
+        raise FileNotFoundError("文件不存在")
+    loader = get_loader(file_path)
+    splitter = build_splitter()
+    base_metadata = {
+        "source": source_name or file_path.name,
+        "file_path": str(file_path),
+        "ingested_at": datetime.now().isoformat(),
+    }
+    source = base_metadata["source"]
+    progress = {"source": source, "mode": mode, "pages_parsed": 0, "chunks_split": 0,
+                "chunks_embedded": 0, "chunks_written": 0,
+                "chunks_new": 0, "chunks_deduplicated": 0, "chunks_updated": 0, "chunks_removed": 0}
+    seen_ids = set()
+
+    def notify():
+        if on_progress is not None:
+            on_progress(dict(progress))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    in_flight = set()
+
+    async def embed_and_write(batch: List[Document]):
+        async with semaphore:
+            # 批内/跨批重复的片段只保留第一次出现
+            ids, unique = [], []
+            for doc in batch:
+                cid = chunk_id(doc.page_content, source)
+                if cid in seen_ids:
+                    progress["chunks_deduplicated"] += 1
+                    continue
+                seen_ids.add(cid)
+                ids.append(cid)
+                unique.append(doc)
+            present = await asyncio.to_thread(store.existing_ids, ids)
+            if present:
+                kept = [(i, d) for i, d in zip(ids, unique) if i in present]
+                progress["chunks_deduplicated"] += len(kept)
+                if mode == "upsert":
+                    await _run_write(_refresh_metadata, store, [i for i, _ in kept], [d for _, d in kept])
+                    progress["chunks_updated"] += len(kept)
+            new = [(i, d) for i, d in zip(ids, unique) if i not in present]
+            if new:
+                new_ids, new_docs = [i for i, _ in new], [d for _, d in new]
+                vectors = await embeddings.aembed_documents([doc.page_content for doc in new_docs])
+                progress["chunks_embedded"] += len(new_docs)
+                notify()
+                await _run_write(_write_batch, store, new_ids, new_docs, vectors)
+                progress["chunks_written"] += len(new_docs)
+                progress["chunks_new"] += len(new_docs)
+            notify()
+
+    async def submit(batch: List[Document]):
+        # 在途批次过多时先等待，保证内存有界
+        while len(in_flight) >= concurrency * 2:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                in_flight.discard(task)
+                task.result()
+        in_flight.add(asyncio.create_task(embed_and_write(batch)))
+
+    pages = loader.lazy_load()
+    buffer: List[Document] = []
+    try:
+        while True:
+            # PDF 解析是同步 CPU 操作，逐页放到线程中执行
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                break
+            progress["pages_parsed"] += 1
+            chunks = splitter.split_documents([page])
+            for chunk in chunks:
+                chunk.metadata.update(base_metadata)
+            progress["chunks_split"] += len(chunks)
+            buffer.extend(chunks)
+            while len(buffer) >= batch_size:
+                await submit(buffer[:batch_size])
+                buffer = buffer[batch_size:]
+            notify()
+        if buffer:
+            await submit(buffer)
+        await asyncio.gather(*in_flight)
+    except BaseException:
+        for task in in_flight:
+            task.cancel()
+        # 等在途批次真正结束并取回它们的异常，任务被标记为失败之后不会再有写入落盘
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        raise
+
+    if mode == "upsert":
+        progress["chunks_removed"] = await asyncio.to_thread(_remove_stale, store, source, seen_ids)
+
+    if metadata_file is not None:
+        total = await asyncio.to_thread(store.count)
+        update_kb_meta(metadata_file, total)
+    notify()
+    return progress
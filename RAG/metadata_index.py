@@ -0,0 +1,221 @@
+"""
+片段元数据的过滤与索引
+- 入库时把可过滤字段整理为 Chroma 支持的标量：时间 → 数值时间戳 added_ts，标签列表 → 布尔键 "tag:<名称>"
+- 检索参数（来源/类别/标签/日期范围）转换为 Chroma where 子句，向量检索与 BM25 检索共用同一个过滤条件
+- 来源索引：按来源聚合片段数、类别、标签与时间范围，知识库未变化时列出来源不再扫描集合
+"""
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+TAG_PREFIX = "tag:"
+TIME_FIELDS = ("added_at", "ingested_at", "date")
+_PARTIAL_DATE = re.compile(r"^(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?$")
+
+
+def tag_key(tag: str) -> str:
+    return f"{TAG_PREFIX}{tag.strip().lower()}"
+
+
+def _split_tags(tags) -> List[str]:
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return [t.strip() for t in tags or [] if t and t.strip()]
+
+
+def to_timestamp(value) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def index_fields(metadata: dict) -> dict:
+    """补齐可过滤字段：added_ts（取 added_at / ingested_at / date 中第一个可解析的时间）、tags 字符串与 tag:* 布尔键"""
+    result = dict(metadata)
+    if "added_ts" not in result:
+        for field in TIME_FIELDS:
+            ts = to_timestamp(result.get(field))
+            if ts is not None:
+                result["added_ts"] = ts
+                break
+    if "tags" in result and not isinstance(result["tags"], (bool, int, float)):
+        tags = _split_tags(result["tags"])
+        result["tags"] = ",".join(tags)
+        for tag in tags:
+            result[tag_key(tag)] = True
+    return result
+
+
+def _date_bound(text: str, end: bool) -> Tuple[float, str]:
+    """日期参数 → （时间戳, 比较符）；只给到年/月/日时按整段区间处理，例如 date_to="2024" 包含 2024 全年"""
+    match = _PARTIAL_DATE.match(text.strip())
+    if match is None:
+        try:
+            return datetime.fromisoformat(text.strip()).timestamp(), "$lte" if end else "$gte"
+        except ValueError:
+            raise ValueError(f"无法解析的日期: {text}（支持 2024、2024-05、2024-05-01 或 ISO 时间）")
+    year, month, day = int(match.group(1)), match.group(2), match.group(3)
+    start = datetime(year, int(month or 1), int(day or 1))
+    if not end:
+        return start.timestamp(), "$gte"
+    if day:
+        stop = start + timedelta(days=1)
+    elif month:
+        stop = datetime(year + start.month // 12, start.month % 12 + 1, 1)
+    else:
+        stop = datetime(year + 1, 1, 1)
+    return stop.timestamp(), "$lt"
+
+
+def _one_or_many(field: str, value: Union[str, List[str]]) -> dict:
+    if isinstance(value, str):
+        return {field: value}
+    values = list(value)
+    return {field: values[0]} if len(values) == 1 else {field: {"$in": values}}
+
+
+def build_where(source: Union[str, List[str], None] = None, category: Union[str, List[str], None] = None,
+                tags: Union[str, List[str], None] = None, date_from: Optional[str] = None,
+                date_to: Optional[str] = None) -> Optional[dict]:
+    """检索过滤参数 → Chroma where 子句；多个标签需同时命中，全部为空时返回 None"""
+    clauses = []
+    if source:
+        clauses.append(_one_or_many("source", source))
+    if category:
+        clauses.append(_one_or_many("category", category))
+    for tag in _split_tags(tags):
+        clauses.append({tag_key(tag): True})
+    if date_from:
+        ts, op = _date_bound(date_from, end=False)
+        clauses.append({"added_ts": {op: ts}})
+    if date_to:
+        ts, op = _date_bound(date_to, end=True)
+        clauses.append({"added_ts": {op: ts}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+_COMPARATORS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches(metadata: Dict[str, Any], where: Optional[dict]) -> bool:
+    """在内存中按 Chroma where 语义判断元数据是否命中（供 BM25 索引过滤使用）"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op not in _COMPARATORS:
+                    raise ValueError(f"不支持的过滤运算符: {op}")
+                try:
+                    if not _COMPARATORS[op](value, operand):
+                        return False
+                except TypeError:  # 类型不可比较（如字符串与数字）视为不命中
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _iter_metadatas(collection, batch_size: int) -> Iterable[Tuple[str, dict]]:
+    offset = 0
+    while True:
+        batch = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield from zip(batch["ids"], batch["metadatas"])
+        offset += len(batch["ids"])
+
+
+def backfill_index_fields(store, batch_size: int = 500) -> int:
+    """为旧片段补齐 added_ts 与 tag:* 字段（经 RAG.vectorstore 门面只更新元数据，不重新嵌入），返回更新的片段数"""
+    pending_ids, pending_metas, updated = [], [], 0
+    for doc_id, metadata in list(_iter_metadatas(store.collection, batch_size)):
+        indexed = index_fields(metadata or {})
+        if indexed != (metadata or {}):
+            pending_ids.append(doc_id)
+            pending_metas.append(indexed)
+        if len(pending_ids) >= batch_size:
+            store.update(pending_ids, pending_metas)
+            updated += len(pending_ids)
+            pending_ids, pending_metas = [], []
+    if pending_ids:
+        store.update(pending_ids, pending_metas)
+        updated += len(pending_ids)
+    return updated
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts is not None else None
+
+
+class SourceIndex:
+    """来源 → 聚合信息；向量库版本号变化时才重新扫描集合元数据"""
+
+    def __init__(self):
+        self._sources: Dict[str, dict] = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def rebuild(self, collection, batch_size: int = 1000):
+        sources: Dict[str, dict] = {}
+        for _, metadata in _iter_metadatas(collection, batch_size):
+            metadata = index_fields(metadata or {})
+            source = metadata.get("source", "未知来源")
+            entry = sources.setdefault(source, {"chunks": 0, "categories": set(), "tags": set(),
+                                                "min_ts": None, "max_ts": None, "file_path": None})
+            entry["chunks"] += 1
+            if metadata.get("category"):
+                entry["categories"].add(metadata["category"])
+            entry["tags"].update(_split_tags(metadata.get("tags")))
+            ts = metadata.get("added_ts")
+            if ts is not None:
+                entry["min_ts"] = ts if entry["min_ts"] is None else min(entry["min_ts"], ts)
+                entry["max_ts"] = ts if entry["max_ts"] is None else max(entry["max_ts"], ts)
+            entry["file_path"] = entry["file_path"] or metadata.get("file_path")
+        self._sources = sources
+
+    def maybe_sync(self, collection, version) -> bool:
+        with self._lock:
+            if version == self._version:
+                return False
+            self.rebuild(collection)
+            self._version = version
+            return True
+
+    def list(self, category: Optional[str] = None, tag: Optional[str] = None) -> List[dict]:
+        tag = tag.strip().lower() if tag else None
+        result = []
+        for source, entry in sorted(self._sources.items()):
+            if category and category not in entry["categories"]:
+                continue
+            if tag and tag not in {t.lower() for t in entry["tags"]}:
+                continue
+            result.append({"source": source, "chunks": entry["chunks"],
+                           "categories": sorted(entry["categories"]), "tags": sorted(entry["tags"]),
+                           "first_added": _iso(entry["min_ts"]), "last_added": _iso(entry["max_ts"]),
+                           "file_path": entry["file_path"]})
+        return result
@@ -0,0 +1,91 @@
+"""
+本地重排序：先多取候选，再在本地重新打分并截断，替代逐篇调用大模型的 LLMChainExtractor
+- lexical：查询词在候选片段中的 idf 加权覆盖率 + 原检索名次先验，纯 CPU、无依赖
+- cross_encoder：sentence-transformers 交叉编码器（可选依赖，未安装时退回 lexical）
+"""
+import asyncio
+import math
+import threading
+from collections import Counter
+from typing import Dict, List
+
+from langchain_core.documents import Document
+
+from RAG.sparse_index import tokenize
+from config.env_utils import RERANKER_BACKEND, RERANKER_MODEL, RERANK_TOP_N
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # 未安装 sentence-transformers 时只能使用 lexical 重排
+    CrossEncoder = None
+
+
+def _with_score(doc: Document, score: float) -> Document:
+    return Document(page_content=doc.page_content, id=doc.id,
+                    metadata={**doc.metadata, "rerank_score": round(float(score), 6)})
+
+
+class LexicalReranker:
+    name = "lexical"
+
+    def __init__(self, rank_prior: float = 0.1):
+        # 原检索名次的先验权重：覆盖率相同时保留原有顺序
+        self.rank_prior = rank_prior
+
+    def score(self, query: str, docs: List[Document]) -> List[float]:
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return [self.rank_prior / (1 + i) for i in range(len(docs))]
+        doc_terms = [Counter(tokenize(doc.page_content)) for doc in docs]
+        # idf 只在候选集合内统计：所有候选都包含的词区分度低
+        df = Counter(term for terms in doc_terms for term in query_terms if term in terms)
+        n = len(docs)
+        idf = {term: math.log(1 + (n + 1) / (df.get(term, 0) + 0.5)) for term in query_terms}
+        total = sum(idf.values())
+        scores = []
+        for rank, terms in enumerate(doc_terms):
+            coverage = sum(idf[t] for t in query_terms if t in terms) / total
+            scores.append(coverage + self.rank_prior / (1 + rank))
+        return scores
+
+    async def arerank(self, query: str, docs: List[Document], top_n: int = RERANK_TOP_N) -> List[Document]:
+        if not docs:
+            return []
+        scores = self.score(query, docs)
+        ranked = sorted(zip(docs, scores), key=lambda item: item[1], reverse=True)[:top_n]
+        return [_with_score(doc, score) for doc, score in ranked]
+
+
+class CrossEncoderReranker:
+    name = "cross_encoder"
+
+    def __init__(self, model_name: str = RERANKER_MODEL):
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name)
+
+    async def arerank(self, query: str, docs: List[Document], top_n: int = RERANK_TOP_N) -> List[Document]:
+        if not docs:
+            return []
+        # 模型推理是同步 CPU 计算，放到线程中执行
+        scores = await asyncio.to_thread(self.model.predict, [(query, doc.page_content) for doc in docs])
+        ranked = sorted(zip(docs, scores), key=lambda item: item[1], reverse=True)[:top_n]
+        return [_with_score(doc, score) for doc, score in ranked]
+
+
+_rerankers: Dict[str, object] = {}
+_rerankers_lock = threading.Lock()
+
+
+def get_reranker(backend: str = RERANKER_BACKEND):
+    """进程内共享重排器（交叉编码器模型只加载一次）"""
+    with _rerankers_lock:
+        if backend not in _rerankers:
+            if backend == "cross_encoder" and CrossEncoder is not None:
+                _rerankers[backend] = CrossEncoderReranker()
+            else:
+                if backend == "cross_encoder":
+                    print("⚠️ 未安装 sentence-transformers，重排序退回 lexical")
+                elif backend != "lexical":
+                    raise ValueError(f"不支持的重排后端: {backend}")
+                _rerankers[backend] = LexicalReranker()
+        return _rerankers[backend]
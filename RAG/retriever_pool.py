@@ -0,0 +1,79 @@
+"""
+进程级 AdaptiveRetrieval 注册表
+同一向量库路径 + 配置只构建一次（嵌入客户端、Chroma 句柄、历史感知/压缩链），供所有并发请求共享
+"""
+import threading
+import time
+from typing import Dict, Tuple, Any
+
+from RAG.adaptive_retrival import AdaptiveRetrieval
+
+
+class RetrieverPool:
+    def __init__(self):
+        self._retrievers: Dict[Tuple, AdaptiveRetrieval] = {}
+        self._lock = threading.Lock()
+        # 每个 key 的冷构建耗时 / 热获取次数与累计耗时
+        self._cold_build_ms: Dict[Tuple, float] = {}
+        self._warm_hits: Dict[Tuple, int] = {}
+        self._warm_total_us: Dict[Tuple, float] = {}
+
+    @staticmethod
+    def _make_key(vectorstore_path: str, config: Dict[str, Any]) -> Tuple:
+        return vectorstore_path, tuple(sorted(config.items()))
+
+    def get(self, vectorstore_path: str, **config) -> AdaptiveRetrieval:
+        """获取（必要时构建）共享的检索器实例，config 透传给 AdaptiveRetrieval"""
+        start = time.perf_counter()
+        key = self._make_key(vectorstore_path, config)
+        retriever = self._retrievers.get(key)
+        if retriever is not None:
+            self._warm_hits[key] += 1
+            self._warm_total_us[key] += (time.perf_counter() - start) * 1e6
+            return retriever
+
+        with self._lock:
+            # 双重检查：并发冷启动时只构建一次
+            retriever = self._retrievers.get(key)
+            if retriever is None:
+                build_start = time.perf_counter()
+                retriever = AdaptiveRetrieval(vectorstore_path=vectorstore_path, **config)
+                self._cold_build_ms[key] = (time.perf_counter() - build_start) * 1000
+                self._warm_hits[key] = 0
+                self._warm_total_us[key] = 0.0
+                self._retrievers[key] = retriever
+                print(f"🔧 构建检索器 {vectorstore_path} {config}，耗时 {self._cold_build_ms[key]:.1f} ms")
+        return retriever
+
+    def warm(self, vectorstore_path: str, **config) -> float:
+        """在 lifespan 启动阶段预热，返回冷构建耗时（毫秒）"""
+        self.get(vectorstore_path, **config)
+        return self._cold_build_ms[self._make_key(vectorstore_path, config)]
+
+    def stats(self) -> list:
+        """各检索器的冷/热构建耗时，用于证明单次查询不再承担初始化成本"""
+        result = []
+        for key in list(self._retrievers):
+            path, config = key
+            hits = self._warm_hits.get(key, 0)
+            result.append({
+                "vectorstore_path": path,
+                "config": dict(config),
+                "cold_build_ms": round(self._cold_build_ms.get(key, 0.0), 2),
+                "warm_hits": hits,
+                "avg_warm_get_us": round(self._warm_total_us.get(key, 0.0) / hits, 2) if hits else None,
+                "sparse_index": self._retrievers[key].sparse_index.stats(),
+                "condense_cache": self._retrievers[key].condense_stats(),
+            })
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._retrievers.clear()
+            self._cold_build_ms.clear()
+            self._warm_hits.clear()
+            self._warm_total_us.clear()
+
+
+# 未显式注入时使用的进程级默认池
+default_pool = RetrieverPool()
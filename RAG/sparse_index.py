@@ -0,0 +1,179 @@
+"""
+进程内 BM25 稀疏索引，与 Chroma 集合保持同步
+- 分词：ASCII 词/数字整体保留（型号、编号、金额不被拆开），连续中文按二元组（单字成段时保留单字）
+- 增量同步：只拉取集合中新增的片段、删除已不存在的片段（片段 id 为内容哈希，内容变化即 id 变化）；
+  传入向量库版本号时按版本号判断是否需要同步
+- 与稠密检索结果用倒数排名融合（RRF）合并
+"""
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from RAG.metadata_index import matches
+from config.env_utils import SPARSE_SYNC_INTERVAL, HYBRID_RRF_K
+
+ASCII_TOKEN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+CJK_RUN = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+TOKEN_PATTERN = re.compile(rf"{ASCII_TOKEN.pattern}|{CJK_RUN.pattern}")
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        if piece[0].isascii():
+            tokens.append(piece)
+            # 带连接符的编号额外拆出各部分，"gpt-4o" 既能整体命中也能部分命中
+            if len(piece) > 1 and re.search(r"[._\-/]", piece):
+                tokens.extend(p for p in re.split(r"[._\-/]", piece) if p)
+        elif len(piece) == 1:
+            tokens.append(piece)
+        else:
+            tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._doc_len: Dict[str, int] = {}
+        self._doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self._docs: Dict[str, Tuple[str, dict]] = {}
+        self._total_len = 0
+        self._lock = threading.RLock()
+        self._last_sync = 0.0
+        self._synced_version = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], metadatas: Optional[Sequence[dict]] = None):
+        metadatas = metadatas or [{}] * len(ids)
+        with self._lock:
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                if doc_id in self._docs:
+                    self._remove_one(doc_id)
+                counts = Counter(tokenize(text or ""))
+                for term, tf in counts.items():
+                    self._postings[term][doc_id] = tf
+                length = sum(counts.values())
+                self._doc_len[doc_id] = length
+                self._doc_terms[doc_id] = tuple(counts)
+                self._docs[doc_id] = (text, metadata or {})
+                self._total_len += length
+
+    def _remove_one(self, doc_id: str):
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+        self._docs.pop(doc_id, None)
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove_one(doc_id)
+
+    def search(self, query: str, k: int = 5, where: Optional[dict] = None) -> List[Tuple[str, float]]:
+        """返回 [(片段 id, BM25 分数)]；where 与 Chroma where 子句语义相同"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            avg_len = self._total_len / n or 1.0
+            scores: Dict[str, float] = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            if where:
+                scores = {d: s for d, s in scores.items() if matches(self._docs[d][1], where)}
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def get(self, doc_id: str) -> Optional[Tuple[str, dict]]:
+        return self._docs.get(doc_id)
+
+    # ===== 与 Chroma 集合同步 =====
+    def sync(self, collection, batch_size: int = 500, version: Optional[int] = None) -> dict:
+        """对比 id 集合，只拉取新增片段的文本/元数据，删除集合中已不存在的片段；version 为同步前读取的版本号"""
+        with self._lock:
+            stored = set(collection.get(include=[])["ids"])
+            known = set(self._docs)
+            added, removed = list(stored - known), known - stored
+            self.remove(removed)
+            for i in range(0, len(added), batch_size):
+                batch = collection.get(ids=added[i:i + batch_size], include=["documents", "metadatas"])
+                self.add(batch["ids"], batch["documents"], batch["metadatas"])
+            self._last_sync = time.time()
+            self._synced_version = version
+            return {"added": len(added), "removed": len(removed), "total": len(self._docs)}
+
+    def maybe_sync(self, collection, interval: float = SPARSE_SYNC_INTERVAL,
+                   version: Optional[int] = None) -> Optional[dict]:
+        """传入版本号时仅在版本变化后同步（写入后下一次检索即可见）；
+        否则距上次同步超过 interval，或片段数与集合不一致时才同步"""
+        if version is not None:
+            if version == self._synced_version:
+                return None
+            return self.sync(collection, version=version)
+        if time.time() - self._last_sync < interval and collection.count() == len(self._docs):
+            return None
+        return self.sync(collection)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._docs), "terms": len(self._postings),
+                    "avg_doc_len": round(self._total_len / len(self._docs), 1) if self._docs else 0,
+                    "last_sync": self._last_sync, "synced_version": self._synced_version}
+
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = HYBRID_RRF_K,
+             top_n: Optional[int] = None) -> List[Tuple[str, float]]:
+    """倒数排名融合：score(d) = Σ 1 / (k + rank)，rank 从 1 开始"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return fused[:top_n] if top_n else fused
+
+
+def fuse_documents(dense_docs: List[Document], sparse_hits: List[Tuple[str, float]], index: BM25Index,
+                   top_n: int, k: int = HYBRID_RRF_K) -> List[Document]:
+    """融合稠密检索文档与 BM25 命中；稠密结果不带 id 时（旧版向量库封装）按正文对齐"""
+    use_ids = all(doc.id for doc in dense_docs)
+
+    by_key = {(doc.id if use_ids else doc.page_content): doc for doc in dense_docs}
+    sparse_keys = {}
+    for doc_id, _ in sparse_hits:
+        entry = index.get(doc_id)
+        if entry is not None:  # 检索与融合之间可能被并发同步删除
+            sparse_keys[doc_id if use_ids else entry[0]] = doc_id
+    results = []
+    for key, score in rrf_fuse([list(by_key), list(sparse_keys)], k=k, top_n=top_n):
+        doc = by_key.get(key)
+        if doc is None:
+            doc_id = sparse_keys[key]
+            text, metadata = index.get(doc_id)
+            doc = Document(page_content=text, metadata=metadata, id=doc_id)
+        results.append(Document(page_content=doc.page_content, id=doc.id,
+                                metadata={**doc.metadata, "rrf_score": round(score, 6)}))
+    return results
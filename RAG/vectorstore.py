@@ -0,0 +1,296 @@
+"""
+进程内共享的向量库门面
+- 同一持久化目录在进程内只打开一个 Chroma 句柄：检索器、后台入库任务、进程内挂载的 research 服务共用，
+  写入后同一句柄上的读取立即可见
+- 所有写操作经过门面：进程内线程锁 + 目录级文件锁（stdio 模式下 research 子进程与 FastAPI 进程的写入互斥）
+- 每次写入后递增持久化的版本号，BM25 索引、来源索引、答案缓存按版本号判断是否需要刷新（跨进程同样可见）
+- BM25 稀疏索引挂在门面上，同一目录在进程内只有一份：检索器与进程内挂载的 research 服务共用，片段文本只在内存中保存一次
+- 进程已加载的 HNSW 索引看不到其它进程追加的向量：版本号被其它进程推进后，向量检索与写入前先重新打开 Chroma 客户端，
+  stdio 模式下两个进程都能读到对方的写入
+- 集合级 HNSW 索引参数（距离度量 / M / 构建 ef / 检索 ef）由环境变量配置，创建集合时写入集合元数据
+- VECTOR_BACKEND=compact 时改用 RAG.compact_store 的紧凑向量存储，对外接口不变
+- 提示信息写到 stderr：门面也运行在 stdio 模式的 research 子进程中，那里的 stdout 是 JSON-RPC 通道
+"""
+import asyncio
+import os
+import re
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import chromadb
+from langchain_chroma import Chroma
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from RAG.embedding_cache import get_cached_embeddings
+from RAG.sparse_index import BM25Index
+from config.env_utils import VECTOR_SPACE, HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF, VECTOR_BACKEND
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只做进程内互斥
+    fcntl = None
+
+VERSION_FILE = "store_version"
+LOCK_FILE = ".write.lock"
+VECTOR_SPACES = ("l2", "cosine", "ip")
+# 只在创建集合时生效的参数：集合元数据键 → index_config() 中的名称
+CREATION_ONLY_KEYS = {"hnsw:space": "space", "hnsw:M": "M", "hnsw:construction_ef": "construction_ef"}
+# 客户端的 clear_system_cache() 自 chromadb 0.4 起提供，更早的版本无法在进程内重新加载索引
+CHROMA_CAN_REOPEN = tuple(int(x) for x in re.findall(r"\d+", chromadb.__version__)[:2]) >= (0, 4)
+
+
+def hnsw_metadata(space: str = VECTOR_SPACE, m: int = HNSW_M, construction_ef: int = HNSW_CONSTRUCTION_EF,
+                  search_ef: int = HNSW_SEARCH_EF) -> dict:
+    """Chroma 集合元数据形式的 HNSW 参数（新旧版本 chromadb 都识别）"""
+    if space not in VECTOR_SPACES:
+        raise ValueError(f"不支持的距离度量: {space}，可选: {', '.join(VECTOR_SPACES)}")
+    return {"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef}
+
+
+class StoreRetriever(BaseRetriever):
+    """经门面检索的 LangChain 检索器：门面重新打开 Chroma 客户端后仍然有效（Chroma.as_retriever 会绑定旧句柄）"""
+    store: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.store.similarity_search(query, k=self.k)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        return await self.store.asimilarity_search(query, k=self.k)
+
+
+class SharedVectorStore:
+    def __init__(self, path: str, embeddings: Optional[Embeddings] = None, index_config: Optional[dict] = None,
+                 collection_name: str = "langchain"):
+        self.path = os.path.abspath(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.embeddings = embeddings or get_cached_embeddings(path)
+        self.requested_index = index_config or hnsw_metadata()
+        self.collection_name = collection_name
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._version_file = os.path.join(self.path, VERSION_FILE)
+        self._lock_file = os.path.join(self.path, LOCK_FILE)
+        self._seen_version = self.version()
+        self.chroma = self._open_chroma()
+        self._check_index_config()
+        self.writes = 0
+        self.sparse_index = BM25Index()
+
+    def sync_sparse(self) -> Optional[dict]:
+        """BM25 索引首次使用时全量加载，之后仅在版本号变化时增量同步"""
+        return self.sparse_index.maybe_sync(self.collection, version=self.version())
+
+    @property
+    def collection(self):
+        return self.chroma._collection
+
+    def _open_chroma(self) -> Chroma:
+        return Chroma(collection_name=self.collection_name, persist_directory=self.path,
+                      embedding_function=self.embeddings, collection_metadata=self.requested_index)
+
+    # ===== 跨进程一致性 =====
+    def _refresh(self):
+        """版本号被其它进程推进后重新打开 Chroma 客户端（get/count 直接读 SQLite，不受影响）"""
+        if self.version() == self._seen_version:
+            return
+        with self._lock:
+            version = self.version()
+            if version != self._seen_version:
+                self._reopen()
+                self._seen_version = version
+
+    def _reopen(self):
+        if not CHROMA_CAN_REOPEN:
+            print(f"⚠️ chromadb {chromadb.__version__} 不支持重新加载索引，其它进程新增的向量在重启后才能检索到", file=sys.stderr)
+            return
+        # 清空共享 System 缓存后新建的客户端会重新加载 HNSW 索引；已打开的客户端仍持有各自的 System，
+        # 旧句柄上进行中的检索照常完成，随垃圾回收释放
+        self.chroma._client.clear_system_cache()
+        self.chroma = self._open_chroma()
+        print(f"🔄 向量库 {self.path} 已被其它进程更新，重新打开 Chroma 客户端", file=sys.stderr)
+
+    # ===== 索引参数 =====
+    def _check_index_config(self):
+        """已有集合沿用创建时的参数：创建期参数不一致时提示重建，检索 ef 直接更新"""
+        effective = self.index_config()
+        mismatched = {name: effective[name] for key, name in CREATION_ONLY_KEYS.items()
+                      if effective.get(name) is not None and key in self.requested_index
+                      and effective[name] != self.requested_index[key]}
+        if mismatched:
+            print(f"⚠️ 集合 {self.collection.name} 已按 {mismatched} 创建，新的索引参数需重建集合后生效", file=sys.stderr)
+        search_ef = self.requested_index.get("hnsw:search_ef")
+        if search_ef is not None and effective.get("search_ef") != search_ef:
+            self.set_search_ef(search_ef)
+
+    def set_search_ef(self, search_ef: int):
+        """调整检索 ef（召回率 / 延迟的权衡），无需重建索引；在索引下次加载时生效（启动时调用即对本进程生效），
+        旧版 chromadb 不支持时保持原值"""
+        try:
+            self.collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+        except Exception as e:
+            print(f"⚠️ 无法更新检索 ef: {e}", file=sys.stderr)
+
+    def index_config(self) -> dict:
+        """集合实际生效的索引参数"""
+        configuration = getattr(self.collection, "configuration", None) or {}
+        hnsw = configuration.get("hnsw") if isinstance(configuration, dict) else None
+        if hnsw:
+            return {"space": hnsw.get("space"), "M": hnsw.get("max_neighbors"),
+                    "construction_ef": hnsw.get("ef_construction"), "search_ef": hnsw.get("ef_search")}
+        metadata = self.collection.metadata or {}
+        return {"space": metadata.get("hnsw:space", "l2"), "M": metadata.get("hnsw:M"),
+                "construction_ef": metadata.get("hnsw:construction_ef"),
+                "search_ef": metadata.get("hnsw:search_ef")}
+
+    # ===== 写入协调 =====
+    @contextmanager
+    def write_lock(self):
+        """可重入的写锁；最外层同时持有目录级文件锁"""
+        with self._lock:
+            self._lock_depth += 1
+            handle = None
+            try:
+                if self._lock_depth == 1 and fcntl is not None:
+                    handle = open(self._lock_file, "a")
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                if self._lock_depth == 1:
+                    self._refresh()  # 不在过期的索引上写入，否则落盘的 HNSW 会丢掉其它进程的向量
+                yield
+            finally:
+                self._lock_depth -= 1
+                if handle is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+                    handle.close()
+
+    def version(self) -> int:
+        """持久化的变更版本号：任意进程经门面写入后都会递增"""
+        try:
+            with open(self._version_file, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _bump_version(self) -> int:
+        version = self.version() + 1
+        tmp = f"{self._version_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(version))
+        os.replace(tmp, self._version_file)
+        self._seen_version = version
+        self.writes += 1
+        return version
+
+    # ===== 读取 =====
+    def count(self) -> int:
+        return self.collection.count()
+
+    def existing_ids(self, ids: Sequence[str]) -> set:
+        if not ids:
+            return set()
+        return set(self.collection.get(ids=list(ids), include=[])["ids"])
+
+    def get(self, **kwargs) -> dict:
+        return self.collection.get(**kwargs)
+
+    def get_all(self, include: Sequence[str] = ("documents", "metadatas"), where: Optional[dict] = None,
+                batch_size: int = 1000) -> Dict[str, list]:
+        """分页读取全部片段，避免一次性拉取超大集合"""
+        result: Dict[str, list] = {"ids": [], **{key: [] for key in include}}
+        offset = 0
+        while True:
+            batch = self.collection.get(include=list(include), where=where, limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                return result
+            result["ids"].extend(batch["ids"])
+            for key in include:
+                result[key].extend(batch[key])
+            offset += len(batch["ids"])
+
+    def search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        self._refresh()
+        return self.chroma.similarity_search_by_vector(embedding, k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        return self.search_by_vector(self.embeddings.embed_query(query), k=k, filter=filter)
+
+    async def asimilarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        embedding = await self.embeddings.aembed_query(query)
+        return await asyncio.to_thread(self.search_by_vector, embedding, k, filter)
+
+    def as_retriever(self, k: int = 4) -> StoreRetriever:
+        return StoreRetriever(store=self, k=k)
+
+    # ===== 写入（全部递增版本号） =====
+    def upsert(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[dict],
+               embeddings: Optional[List[List[float]]] = None) -> int:
+        """写入或覆盖片段；未传入向量时在锁外先计算嵌入，锁内只做写库"""
+        if not ids:
+            return self.version()
+        if embeddings is None:
+            embeddings = self.embeddings.embed_documents(list(documents))
+        with self.write_lock():
+            self._upsert_locked(list(ids), list(documents), list(metadatas), embeddings)
+            return self._bump_version()
+
+    def add_documents(self, documents: Sequence[Document], ids: Sequence[str]) -> int:
+        return self.upsert(ids, [d.page_content for d in documents], [d.metadata for d in documents])
+
+    def update(self, ids: Sequence[str], metadatas: Sequence[dict]) -> int:
+        """只更新元数据（内容未变，无需重新嵌入）"""
+        if not ids:
+            return self.version()
+        with self.write_lock():
+            self.collection.update(ids=list(ids), metadatas=list(metadatas))
+            return self._bump_version()
+
+    def delete(self, ids: Optional[Iterable[str]] = None, where: Optional[dict] = None) -> int:
+        """按 id 或 where 条件删除，返回删除的片段数"""
+        if ids is None and where is None:
+            raise ValueError("删除片段需要指定 ids 或 where")
+        with self.write_lock():
+            ids = list(ids) if ids is not None else self.collection.get(where=where, include=[])["ids"]
+            if not ids:
+                return 0
+            self._delete_locked(ids)
+            self._bump_version()
+            return len(ids)
+
+    def _upsert_locked(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def _delete_locked(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def stats(self) -> dict:
+        return {"path": self.path, "count": self.count(), "version": self.version(), "writes": self.writes,
+                "index": self.index_config()}
+
+
+_stores: Dict[str, SharedVectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_vectorstore(path: str) -> SharedVectorStore:
+    """进程内按持久化目录共享同一个向量库门面（同一目录只打开一个 Chroma 客户端）"""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        if key not in _stores:
+            if VECTOR_BACKEND == "compact":
+                from RAG.compact_store import CompactVectorStore  # 延迟导入，避免循环依赖
+                _stores[key] = CompactVectorStore(key)
+            elif VECTOR_BACKEND == "chroma":
+                _stores[key] = SharedVectorStore(key)
+            else:
+                raise ValueError(f"不支持的向量存储后端: {VECTOR_BACKEND}，可选: chroma、compact")
+        return _stores[key]
+
+
+def vectorstore_stats() -> list:
+    return [store.stats() for store in list(_stores.values())]
@@ -0,0 +1,144 @@
+"""
+跨线程答案缓存
+- 精确匹配：归一化后的问题文本
+- 语义匹配（可选，仅 research）：问题向量余弦相似度超过阈值；分析 / 网络搜索 / 整合的问题只差一个数字、城市或日期时
+  向量仍然非常接近，答案却不同，只做精确匹配
+- 各路由独立 TTL：网络搜索很快过期，研究/分析结果可以保留更久
+- 依赖知识库的条目（research / integrate）在知识库版本变化后自动失效
+"""
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+from config.env_utils import (ANSWER_CACHE_TTL_RESEARCH, ANSWER_CACHE_TTL_ANALYSIS, ANSWER_CACHE_TTL_WEB_SEARCH,
+                              ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_MAX_ENTRIES)
+
+DEFAULT_TTLS = {
+    "research": ANSWER_CACHE_TTL_RESEARCH,
+    "analysis": ANSWER_CACHE_TTL_ANALYSIS,
+    "web_search": ANSWER_CACHE_TTL_WEB_SEARCH,
+}
+# 结果依赖知识库内容的路由
+KB_DEPENDENT_ROUTES = ("research", "integrate")
+# 允许语义匹配的路由
+SEMANTIC_ROUTES = ("research",)
+
+
+def normalize_query(query: str) -> str:
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?？!！。.")
+
+
+class _Entry:
+    __slots__ = ("value", "created_at", "ttl", "kb_version", "vector")
+
+    def __init__(self, value, ttl: float, kb_version, vector: Optional[np.ndarray]):
+        self.value = value
+        self.created_at = time.time()
+        self.ttl = ttl
+        self.kb_version = kb_version
+        self.vector = vector
+
+
+class AnswerCache:
+    def __init__(self, embeddings=None, similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+                 ttls: Dict[str, float] = None, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 kb_version_fn: Optional[Callable[[], Any]] = None):
+        self.embeddings = embeddings if similarity_threshold > 0 else None
+        self.similarity_threshold = similarity_threshold
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.kb_version_fn = kb_version_fn or (lambda: None)
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def ttl_for(self, routes: List[str]) -> float:
+        """多路结果整合后的答案，取各路由中最短的 TTL"""
+        return min((self.ttls.get(r, ANSWER_CACHE_TTL_RESEARCH) for r in routes), default=ANSWER_CACHE_TTL_RESEARCH)
+
+    def _count(self, route: str, key: str):
+        counters = self._counters.setdefault(route, {"hits": 0, "semantic_hits": 0, "misses": 0, "expired": 0})
+        counters[key] += 1
+
+    def _valid(self, route: str, entry: _Entry, kb_version) -> bool:
+        if time.time() - entry.created_at > entry.ttl:
+            return False
+        if route in KB_DEPENDENT_ROUTES and entry.kb_version != kb_version:
+            return False
+        return True
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        if self.embeddings is None:
+            return None
+        try:
+            vector = np.asarray(await self.embeddings.aembed_query(text), dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ 答案缓存嵌入失败，退回精确匹配: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def aget(self, route: str, query: str, scope: str = ""):
+        """scope 用于区分同一问题的不同上下文（如 integrate 的路由组合）"""
+        key = (route, f"{scope}|{normalize_query(query)}")
+        kb_version = self.kb_version_fn() if route in KB_DEPENDENT_ROUTES else None
+        entry = self._entries.get(key)
+        if entry is not None:
+            if self._valid(route, entry, kb_version):
+                self._entries.move_to_end(key)
+                self._count(route, "hits")
+                return entry.value
+            del self._entries[key]
+            self._count(route, "expired")
+
+        if self.embeddings is not None and route in SEMANTIC_ROUTES:
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if k[0] == route and k[1].startswith(f"{scope}|") and e.vector is not None
+                          and self._valid(route, e, kb_version)]
+            if candidates:
+                vector = await self._embed(query)
+                if vector is not None:
+                    matrix = np.stack([e.vector for _, e in candidates])
+                    scores = matrix @ vector
+                    best = int(np.argmax(scores))
+                    best_key = candidates[best][0]
+                    # 嵌入期间条目可能已被淘汰或因知识库版本变化失效，重新查一次，不在了就按未命中处理
+                    entry = self._entries.get(best_key)
+                    if scores[best] >= self.similarity_threshold and entry is not None and self._valid(
+                            route, entry, self.kb_version_fn() if route in KB_DEPENDENT_ROUTES else None):
+                        self._entries.move_to_end(best_key)
+                        self._count(route, "semantic_hits")
+                        return entry.value
+
+        self._count(route, "misses")
+        return None
+
+    async def aput(self, route: str, query: str, value, scope: str = "", ttl: Optional[float] = None):
+        key = (route, f"{scope}|{normalize_query(query)}")
+        kb_version = self.kb_version_fn() if route in KB_DEPENDENT_ROUTES else None
+        vector = await self._embed(query) if route in SEMANTIC_ROUTES else None
+        self._entries[key] = _Entry(value, ttl if ttl is not None else self.ttls.get(route, 0), kb_version, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, routes: Optional[List[str]] = None) -> int:
+        """按路由失效（None 表示全部），返回清除的条目数"""
+        keys = [k for k in self._entries if routes is None or k[0] in routes]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> dict:
+        per_route = {}
+        for route, c in self._counters.items():
+            lookups = c["hits"] + c["semantic_hits"] + c["misses"]
+            per_route[route] = {**c, "hit_rate": round((c["hits"] + c["semantic_hits"]) / lookups, 4)
+                                if lookups else None}
+        return {"entries": len(self._entries), "similarity_threshold": self.similarity_threshold,
+                "routes": per_route}
@@ -0,0 +1,146 @@
+"""
+分析类问题的确定性快速通道
+对可直接执行的请求（算式、科学函数、数值列表统计、单位换算）直接调用计算器工具，
+跳过 ReAct 智能体的多轮大模型调用；解析失败或工具报错时返回 None，由调用方回退到智能体
+"""
+import json
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.tools import BaseTool
+
+from mcp_tools.unit_engine import EXACT_ALIASES, conversion
+
+ALLOWED_EXPR_CHARS = set("0123456789+-*/().^ ")
+EXPR_PREFIX = re.compile(r"^(请)?(帮我)?(计算|算一下|算算|求)(一下)?[:：]?\s*")
+EXPR_SUFFIX = re.compile(r"\s*(=|等于)?\s*(多少|几)?\s*[?？]?$")
+
+SCIENTIFIC_PATTERN = re.compile(
+    r"^(sin|cos|tan|log|ln|exp|sqrt)\s*\(?\s*(-?\d+(?:\.\d+)?)\s*(度|°)?\s*\)?\s*(度|°)?$")
+
+STAT_KEYWORDS = {
+    "平均": "mean", "均值": "mean", "中位数": "median", "标准差": "std", "方差": "variance",
+    "统计": "all", "描述统计": "all",
+}
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+# 统计请求只接受显式的数值列表：去掉关键词与以下客套/说明词后，只剩分隔符隔开的数字
+STAT_FILLER = re.compile(r"请|帮我|帮忙|计算|算一下|算算|求|一下|这组|这些|以下|下列|如下|数据|数字|数|的|值|是|多少|[:：?？=]")
+NUMBER_LIST = re.compile(r"^-?\d+(?:\.\d+)?(?:\s*[,，、;；\s]\s*-?\d+(?:\.\d+)?)+$")
+# 日期、年份：“12/25”“2024-05-01”“2023年”不能当作算式或数据
+DATE_PATTERN = re.compile(r"^\d{1,2}/\d{1,2}(?:/\d{2,4})?$|^\d{4}[-/.]\d{1,2}(?:[-/.]\d{1,2})?$")
+YEAR_PATTERN = re.compile(r"\d{4}\s*年")
+
+# 长的别名优先匹配（“千米”先于“米”、“平方米”先于“米”）
+_UNIT_ALT = "|".join(re.escape(u) for u in sorted(EXACT_ALIASES, key=len, reverse=True))
+UNIT_PATTERN = re.compile(
+    rf"^(?:把|将)?\s*(-?\d+(?:\.\d+)?)\s*({_UNIT_ALT})\s*"
+    rf"(?:等于|是|合|换算成|换算为|转换成|转换为|转成|转为|to|in|=)\s*(?:多少)?\s*({_UNIT_ALT})\s*(?:是多少|多少)?\s*[?？]?$",
+    re.IGNORECASE,
+)
+
+
+def _normalize(query: str) -> str:
+    text = unicodedata.normalize("NFKC", query).strip()
+    return text.replace("×", "*").replace("÷", "/").rstrip("。.")
+
+
+def looks_like_date(query: str) -> bool:
+    """没有“计算/等于”等明确说法的“12/25”更可能是日期；路由规则与快速通道共用这一判断"""
+    text = _normalize(query)
+    without_prefix = EXPR_PREFIX.sub("", text)
+    expr = EXPR_SUFFIX.sub("", without_prefix)
+    return bool(DATE_PATTERN.match(expr)) and without_prefix == text and expr == text
+
+
+def parse_analysis_request(query: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """识别可直接执行的分析请求，返回（工具名, 参数）；无法确定时返回 None"""
+    text = _normalize(query)
+
+    match = UNIT_PATTERN.match(text)
+    if match:
+        value, src, dst = match.groups()
+        try:
+            category, from_unit, to_unit, _, _ = conversion(src, dst)
+        except ValueError:
+            return None
+        return "unit_converter", {"value": float(value), "from_unit": from_unit, "to_unit": to_unit,
+                                  "category": category}
+
+    if YEAR_PATTERN.search(text) or looks_like_date(text):
+        return None
+    expr = EXPR_SUFFIX.sub("", EXPR_PREFIX.sub("", text))
+    match = SCIENTIFIC_PATTERN.match(expr.lower())
+    if match:
+        function, value, unit_a, unit_b = match.groups()
+        return "scientific_calculator", {"function": function, "value": float(value),
+                                         "angle_unit": "degrees" if (unit_a or unit_b) else "radians"}
+    if expr and all(c in ALLOWED_EXPR_CHARS for c in expr) and re.search(r"\d", expr) \
+            and re.search(r"[\d)]\s*[+\-*/^]", expr):
+        return "basic_calculator", {"expression": expr}
+
+    keyword = next((kw for kw in sorted(STAT_KEYWORDS, key=len, reverse=True) if kw in text), None)
+    if keyword is not None:
+        analysis_type = STAT_KEYWORDS[keyword]
+        listed = STAT_FILLER.sub(" ", text.replace(keyword, " ")).strip(" ,，、;；")
+        if not NUMBER_LIST.match(listed):
+            return None
+        numbers = [float(n) for n in NUMBER_PATTERN.findall(listed)]
+        if all(n.is_integer() and 1900 <= n <= 2100 for n in numbers):  # 全是年份，多半不是要统计的数据
+            return None
+        # 泛泛的“统计”容易误伤，要求更多数据点
+        if len(numbers) >= (3 if analysis_type == "all" else 2):
+            return "statistical_analysis", {"data": numbers, "analysis_type": analysis_type}
+    return None
+
+
+def _parse_tool_output(output) -> Optional[dict]:
+    """MCP 工具返回可能是 dict、JSON 字符串或内容块列表"""
+    if isinstance(output, tuple):  # content_and_artifact
+        output = output[0]
+    if isinstance(output, list):
+        output = "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in output)
+    if isinstance(output, str):
+        try:
+            output = json.loads(output)
+        except json.JSONDecodeError:
+            return None
+    return output if isinstance(output, dict) else None
+
+
+def _format_answer(tool_name: str, args: dict, result: dict) -> str:
+    if tool_name == "basic_calculator":
+        return f"{args['expression']} = {result.get('formatted_result', result['result'])}"
+    if tool_name == "scientific_calculator":
+        unit = "（角度制）" if args["angle_unit"] == "degrees" else ""
+        return f"{args['function']}({args['value']:g}){unit} = {result['result']:.10g}"
+    if tool_name == "unit_converter":
+        return f"{args['value']:g} {args['from_unit']} = {result['converted_value']:.10g} {args['to_unit']}"
+    stats = "，".join(f"{k}: {v:.10g}" if isinstance(v, float) else f"{k}: {v}"
+                     for k, v in result["results"].items())
+    return f"对 {result['data_count']} 个数据的统计结果：{stats}"
+
+
+async def try_fast_path(query: str, tools: List[BaseTool]) -> Optional[dict]:
+    """命中时返回与 AgentResponse 同结构的字典，否则返回 None"""
+    parsed = parse_analysis_request(query)
+    if parsed is None:
+        return None
+    tool_name, args = parsed
+    tool = next((t for t in tools if t.name == tool_name), None)
+    if tool is None:
+        return None
+    try:
+        result = _parse_tool_output(await tool.ainvoke(args))
+    except Exception as e:
+        print(f"⚠️ 分析快速通道调用 {tool_name} 失败，回退智能体: {e}")
+        return None
+    if not result or not result.get("success"):
+        return None
+    return {
+        "answer": _format_answer(tool_name, args, result),
+        "reasoning": f"问题可直接执行，调用 {tool_name}，参数 {json.dumps(args, ensure_ascii=False)}",
+        "tools_used": [tool_name],
+        "citations": [],
+        "fast_path": True,
+    }
@@ -1,34 +1,81 @@
 #多智能体状态共享
+import asyncio
 import operator
 from typing import TypedDict, Annotated, Literal, List, Any
 
-from langchain_core.messages import AIMessage, AnyMessage
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, RemoveMessage
 from langgraph.graph import add_messages
 from pydantic import Field
 
-from RAG.adaptive_retrival import AdaptiveRetrieval
+from RAG.adaptive_retrival import history_key
+from RAG.retriever_pool import RetrieverPool, default_pool
+from agents.answer_cache import AnswerCache
+from agents.fast_path import try_fast_path
+from agents.router import LocalRouter
+from config.env_utils import VECTORSTORE_PATH, MULTI_ROUTE, BRANCH_TIMEOUT_SECONDS, HISTORY_MAX_TURNS
 from config.llm_config import moon
 
+# 可并行执行的专家分支
+SPECIALIST_ROUTES = ("research", "analysis", "web_search")
+
+
+def _keep_last(old, new):
+    """并行分支同一步写入同一字段时，保留最后一次写入"""
+    return new
+
+
 class AgentState(TypedDict):
     messages: Annotated[list[AnyMessage],add_messages]
     query: Annotated[str, Field(description="当前问题")]
     query_type: Literal["research", "analysis", "web_search"]  # 查询类型
+    query_types: List[str]  # 多路并行模式下选中的专家集合
     skip_tool: bool
     research_result: dict
     analysis_result: dict
     web_search_result: dict
     final_answer: str
-    current_agent:  str
+    current_agent:  Annotated[str, _keep_last]
     user_feedback: str
     loop_step: Annotated[int, operator.add]
+def _current_turn(state: AgentState):
+    """当前轮次的用户消息（/query 写入），没有时返回 None"""
+    return next((m for m in reversed(state.get("messages") or []) if isinstance(m, HumanMessage)), None)
+
+
+def _prior_history(state: AgentState) -> List[AnyMessage]:
+    """当前轮之前的对话历史；同一轮内的修改重跑看到的历史不变，改写结果可以复用缓存"""
+    messages = state.get("messages") or []
+    turn = _current_turn(state)
+    if turn is None:
+        return list(messages)
+    index = next(i for i, m in enumerate(messages) if m.id == turn.id)
+    return list(messages[:index])
+
+
+def _trim_history(messages: List[AnyMessage], max_turns: int = HISTORY_MAX_TURNS) -> List[RemoveMessage]:
+    """只保留最近 max_turns 轮（每轮以一条用户消息开头），更早的消息从检查点中删除"""
+    starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if len(starts) <= max_turns:
+        return []
+    return [RemoveMessage(id=m.id) for m in messages[:starts[-max_turns]]]
+
+
 #创建节点
-def analysis_query(state: AgentState):
+async def analysis_query(state: AgentState, router: LocalRouter = None):
     query = state["query"]
     feedback = state.get("user_feedback", "").strip()
 
+    # 明显可判定的问题由本地路由直接决定；带修改意见的重新调度必须交给大模型
+    if router is not None and (not feedback or feedback == "同意"):
+        decision = router.route(query)
+        if decision is not None:
+            print(f"⚡ 本地路由命中: {decision}")
+            return {"query_type": decision.routes[0], "query_types": decision.routes, "skip_tools": False,
+                    "loop_step": 1, "current_agent": "analyzer"}
+
     # 💡 无论是否是迭代，都使用结构化的指令来约束模型
     role_instruction = """
-    你是一个任务调度专家。你的任务是分析用户问题，并从以下工具中选择最合适的一个。
+    你是一个任务调度专家。你的任务是分析用户问题，并从以下工具中选择最合适的{pick}。
     严禁输出任何关于问题的回答、建议或攻略。
 
     可选工具：
@@ -36,10 +83,12 @@ def analysis_query(state: AgentState):
     2. analysis: 适合逻辑推理、数学计算、单位转换。
     3. web_search: 适合实时信息、天气、最新新闻、具体地点推荐。
     4. integrate: 仅在不需要任何工具、直接整合现有信息时使用。
-    """
+    """.format(pick="一个或多个（复合问题可同时选择多个专家并行处理）" if MULTI_ROUTE else "一个")
+    example = "analysis,web_search" if MULTI_ROUTE else "web_search"
+    tool_hint = "工具名称，多个用英文逗号分隔" if MULTI_ROUTE else "工具名称"
 
     if not feedback or feedback == "同意":
-        prompt_content = f"{role_instruction}\n\n用户原始问题：{query}\n\n请只输出工具名称（例如：web_search）。"
+        prompt_content = f"{role_instruction}\n\n用户原始问题：{query}\n\n请只输出{tool_hint}（例如：{example}）。"
     else:
         prompt_content = f"""
         {role_instruction}
@@ -50,38 +99,58 @@ def analysis_query(state: AgentState):
 
         ### 输出要求 🧠
         请结合反馈，严格按照以下格式回复：
-        TOOL: [工具名称]
+        TOOL: [{tool_hint}]
         REASON: [简短理由]
         """
 
-    response = moon.invoke(prompt_content)
+    response = await moon.ainvoke(prompt_content)
     raw_output = response.content.strip().lower()
     print(f"LLM 原始输出: {raw_output}")
 
-    # 防御性清洗逻辑保持不变
-    if "web_search" in raw_output or "web" in raw_output:
-        query_type = "web_search"
-    elif "research" in raw_output:
-        query_type = "research"
-    elif "analysis" in raw_output:
-        query_type = "analysis"
-    else:
-        query_type = "integrate"
+    query_types = _parse_routes(raw_output)
+    query_type = query_types[0] if query_types else "integrate"
+    if router is not None:
+        router.record_llm_call()
+        if not feedback or feedback == "同意":
+            router.remember(query, query_types or [query_type])
 
-    print(f"校准后的路由目标: {query_type}")
-    return {"query_type": query_type, "skip_tools": False, "loop_step": 1, "current_agent": "analyzer"}
+    print(f"校准后的路由目标: {query_types or [query_type]}")
+    return {"query_type": query_type, "query_types": query_types, "skip_tools": False, "loop_step": 1,
+            "current_agent": "analyzer"}
 
-async def execute_research_agent(state: AgentState, research_agent=None):
+
+def _parse_routes(raw_output: str) -> List[str]:
+    """从调度模型输出中解析专家列表；单路模式下只取优先级最高的一个"""
+    # 带 TOOL:/REASON: 格式时只解析 TOOL 行，避免理由中的字眼误触发路由
+    for line in raw_output.splitlines():
+        if line.strip().startswith("tool:"):
+            raw_output = line
+            break
+    # 防御性清洗逻辑保持不变：web_search > research > analysis
+    matched = []
+    if "web_search" in raw_output or "web" in raw_output:
+        matched.append("web_search")
+    if "research" in raw_output:
+        matched.append("research")
+    if "analysis" in raw_output:
+        matched.append("analysis")
+    return matched if MULTI_ROUTE else matched[:1]
+
+async def execute_research_agent(state: AgentState, research_agent=None, retriever_pool: RetrieverPool = None):
     query = state["query"]
 
-    # 初始化 AdaptiveRetrieval（指向同一个 Chroma 库）
-    retriever = AdaptiveRetrieval(vectorstore_path="/root/autodl-tmp/research_vectorstore")
+    # 从进程级检索器池获取共享的 AdaptiveRetrieval（指向同一个 Chroma 库），不再每次查询重建
+    retriever = (retriever_pool or default_pool).get(VECTORSTORE_PATH)
+
+    # 有历史时先把追问改写为独立问题（按历史缓存），检索与回答都使用改写后的问题
+    chat_history = _prior_history(state)
+    if chat_history:
+        query = await retriever.condense_question(query, chat_history)
 
     # 执行自适应检索（自动选择策略）
     retrieved_docs = await retriever.adaptive_retrieve(
         query=query,
-        chat_history=[],
-        strategy="history_aware"
+        strategy="auto"
     )
     print(retrieved_docs)
     # 构建回答
@@ -99,7 +168,7 @@ async def execute_research_agent(state: AgentState, research_agent=None):
         sources = []
 
     # 调用大模型生成最终回答
-    response = moon.invoke(prompt)
+    response = await moon.ainvoke(prompt)
     answer = response.content.strip()
 
     # 返回结构化结果
@@ -115,37 +184,94 @@ async def execute_research_agent(state: AgentState, research_agent=None):
     }
 
 
-async def execute_analysis_agent(state: AgentState, analysis_agent):
-    result=await analysis_agent.ainvoke({'messages':[{'role':'user','content':state['query']}]})
-    return {"analysis_result": result["structured_response"],
-            "current_agent": "analyst"}
-async def execute_web_search_agent(state: AgentState, web_search_agent):
-    result=await web_search_agent.ainvoke({'messages':[{'role':'user','content':state['query']}]})
-    structured=result["structured_response"]
+def _structured_to_dict(structured) -> dict:
     # ✅ 关键：将 AgentResponse 转为 dict
     if hasattr(structured, "model_dump"):  # Pydantic v2
-        web_result = structured.model_dump()
+        return structured.model_dump()
     elif hasattr(structured, "__dict__"):  # dataclass 或普通对象
-        web_result = structured.__dict__
+        return structured.__dict__
     else:
-        web_result = {"answer": str(structured)}  # 保底方案
+        return {"answer": str(structured)}  # 保底方案
+
+async def execute_analysis_agent(state: AgentState, analysis_agent, tools: List[Any] = None):
+    # 算式/统计/单位换算等可直接执行的请求绕过 ReAct 智能体
+    if tools:
+        fast_result = await try_fast_path(state['query'], tools)
+        if fast_result is not None:
+            print(f"⚡ 分析快速通道: {fast_result['tools_used']}")
+            return {"analysis_result": fast_result, "current_agent": "analyst"}
+    result=await analysis_agent.ainvoke({'messages':[{'role':'user','content':state['query']}]})
+    return {"analysis_result": _structured_to_dict(result["structured_response"]),
+            "current_agent": "analyst"}
+async def execute_web_search_agent(state: AgentState, web_search_agent):
+    result=await web_search_agent.ainvoke({'messages':[{'role':'user','content':state['query']}]})
+    web_result = _structured_to_dict(result["structured_response"])
     return {"web_search_result": web_result,
             "current_agent": "web_searcher"}
 
-async def run_web_search_node(state: AgentState, agent: Any) -> dict:
-    result = await execute_web_search_agent(state, agent)
+async def _run_with_timeout(coro, result_key: str, agent_name: str, timeout: float) -> dict:
+    """单个专家分支超时保护：超时后返回占位结果，不拖住整轮并行执行"""
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"⏰ {agent_name} 执行超过 {timeout}s，已放弃该分支")
+        message = f"{agent_name} 执行超时（{timeout}s），该部分结果缺失"
+        return {result_key: {"answer": message, "error": message, "timed_out": True},
+                "current_agent": agent_name}
+
+def _has_feedback(state: AgentState) -> bool:
+    feedback = state.get("user_feedback", "").strip()
+    return bool(feedback) and feedback != "同意"
+
+async def _run_cached(state: AgentState, answer_cache: AnswerCache, route: str, result_key: str,
+                      agent_name: str, make_coro, timeout: float, scope: str = "") -> dict:
+    """先查跨线程答案缓存；用户提出修改意见时必须重新执行，失败/超时的结果不写入缓存"""
+    use_cache = answer_cache is not None and not _has_feedback(state)
+    if use_cache:
+        cached = await answer_cache.aget(route, state["query"], scope=scope)
+        if cached is not None:
+            print(f"⚡ {agent_name} 命中答案缓存")
+            return {result_key: {**cached, "cached": True}, "current_agent": agent_name}
+    result = await _run_with_timeout(make_coro(), result_key, agent_name, timeout)
+    value = result.get(result_key) or {}
+    if use_cache and not value.get("error"):
+        await answer_cache.aput(route, state["query"], value, scope=scope)
+    return result
+
+async def run_web_search_node(state: AgentState, agent: Any, timeout: float = BRANCH_TIMEOUT_SECONDS,
+                              answer_cache: AnswerCache = None) -> dict:
+    result = await _run_cached(state, answer_cache, "web_search", "web_search_result", "web_searcher",
+                               lambda: execute_web_search_agent(state, agent), timeout)
     return result  # 必须是 dict！
 
-async def run_research_node(state: AgentState, agent: Any) -> dict:
-    result = await execute_research_agent(state, agent)
+async def run_research_node(state: AgentState, agent: Any, retriever_pool: RetrieverPool = None,
+                            timeout: float = BRANCH_TIMEOUT_SECONDS, answer_cache: AnswerCache = None) -> dict:
+    # 追问的含义取决于历史，缓存作用域带上历史摘要（首轮问题仍可跨线程共享）
+    result = await _run_cached(state, answer_cache, "research", "research_result", "researcher",
+                               lambda: execute_research_agent(state, agent, retriever_pool=retriever_pool), timeout,
+                               scope=history_key(_prior_history(state)))
     return result
 
-async def run_analysis_node(state: AgentState, agent: Any) -> dict:
-    result = await execute_analysis_agent(state, agent)
+async def run_analysis_node(state: AgentState, agent: Any, timeout: float = BRANCH_TIMEOUT_SECONDS,
+                            answer_cache: AnswerCache = None, tools: List[Any] = None) -> dict:
+    result = await _run_cached(state, answer_cache, "analysis", "analysis_result", "analyst",
+                               lambda: execute_analysis_agent(state, agent, tools=tools), timeout)
     return result
-def integrate_results(state: AgentState):
+async def integrate_results(state: AgentState, answer_cache: AnswerCache = None):
     print('进入最后回答整合阶段')
 
+    # 整合结果按（问题, 路由组合）缓存，TTL 取所选路由中最短的
+    routes = sorted(state.get("query_types") or [state.get("query_type", "integrate")])
+    scope = ",".join(routes)
+    if "research" in routes:
+        scope = f"{scope}|{history_key(_prior_history(state))}"
+    use_cache = answer_cache is not None and not _has_feedback(state)
+    if use_cache:
+        cached = await answer_cache.aget("integrate", state["query"], scope=scope)
+        if cached is not None:
+            print("⚡ integrator 命中答案缓存")
+            return _integrate_output(state, cached)
+
     # 获取原始素材
     research = state.get("research_result", {}).get("answer", "")
     analysis = state.get("analysis_result", {}).get("answer", "")
@@ -174,5 +300,21 @@ def integrate_results(state: AgentState):
     注意：如果背景素材中缺少用户反馈所需的信息，请诚实说明，不要虚构数据。
     """
 
-    response = moon.invoke(final_prompt)
-    return {"final_answer": response.content, "current_agent": "integrator"}
\ No newline at end of file
+    response = await moon.ainvoke(final_prompt)
+    branch_failed = any(state.get(k, {}).get("error") for k in
+                        ("research_result", "analysis_result", "web_search_result"))
+    if use_cache and not branch_failed:
+        await answer_cache.aput("integrate", state["query"], response.content, scope=scope,
+                                ttl=answer_cache.ttl_for(routes))
+    return _integrate_output(state, response.content)
+
+
+def _integrate_output(state: AgentState, answer: str) -> dict:
+    """最终答案写入对话历史：每轮答案使用固定 id，修改重跑时覆盖而不是追加；超出轮数上限的旧消息被删除"""
+    turn = _current_turn(state)
+    if turn is None:
+        return {"final_answer": answer, "current_agent": "integrator"}
+    reply = AIMessage(content=answer, id=f"{turn.id}-answer")
+    messages = [m for m in state.get("messages") or [] if m.id != reply.id] + [reply]
+    return {"final_answer": answer, "current_agent": "integrator",
+            "messages": _trim_history(messages) + [reply]}
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+分层路由：本地规则 / 关键词打分先判，置信度不足才调用调度大模型
+1. 规则：纯算式（不含快速通道视为日期的“12/25”）、单位换算 → analysis；天气/新闻/今天等实时类 → web_search
+   其它路由的关键词也有得分时规则不生效（可能是复合问题），交给打分 / 大模型
+2. 关键词加权打分：最高分路由占比超过阈值时直接采用
+3. 决策缓存：同一（归一化）问题不重复判定，大模型的判定结果也会被缓存
+"""
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from agents.answer_cache import normalize_query
+from agents.fast_path import looks_like_date
+from mcp_tools.unit_engine import EXACT_ALIASES
+from config.env_utils import ROUTER_CONFIDENCE, ROUTER_CACHE_SIZE, MULTI_ROUTE
+
+# 纯算式：数字、运算符、括号、常见数学函数，允许结尾的“=?”“等于多少”
+ARITHMETIC_PATTERN = re.compile(
+    r"^(计算|算一下|求)?\s*[\d\s\.\+\-\*/\^%()（）×÷]+(sqrt|sin|cos|tan|log|exp)?[\d\s\.\+\-\*/\^%()（）×÷]*"
+    r"\s*(=|＝)?\s*(\?|？|多少|等于多少|是多少)?$"
+)
+# 单位词取自单位换算引擎的别名表，以下别名在普通问句里太常见，不参与规则匹配：
+# 单字母缩写（m、g、s…）、单个汉字（年、月、位、两、里…）、时间单位（“2024年”“15天”）
+_CJK_CHAR = re.compile(r"^[\u4e00-\u9fff]$")
+UNIT_WORDS = sorted((alias for alias, (category, _) in EXACT_ALIASES.items()
+                     if category != "time" and not (len(alias) == 1 and alias.isascii())
+                     and not _CJK_CHAR.match(alias)),
+                    key=len, reverse=True)
+# 换算目标紧跟在换算标记之后，可以放宽到单个汉字（“2公斤是多少磅”），时间单位仍然排除
+TARGET_UNIT_WORDS = sorted((alias for alias, (category, _) in EXACT_ALIASES.items()
+                            if category != "time" and not (len(alias) == 1 and alias.isascii())),
+                           key=len, reverse=True)
+
+
+def _alternation(words: List[str]) -> str:
+    return "(?:" + "|".join(re.escape(w) for w in words) + r")(?![A-Za-z])"
+
+
+# “数字 + 单位 … 换算标记 + 另一个单位”，例如“5英里等于多少公里”“100 kg to lbs”
+UNIT_CONVERSION_PATTERN = re.compile(
+    r"\d+(\.\d+)?\s*" + _alternation(UNIT_WORDS) + r".*?"
+    r"(换算成|换算为|换算|转换成|转换为|转换|转成|转为|等于多少|等于|是多少|合多少|\bto\b|\bin\b)\s*(多少|几)?\s*"
+    + _alternation(TARGET_UNIT_WORDS),
+    re.IGNORECASE,
+)
+REALTIME_KEYWORDS = ("天气", "新闻", "今天", "今日", "明天", "最新", "实时", "股价", "汇率", "热搜", "比分")
+
+# 关键词权重：只用于规则未命中时的兜底打分
+ROUTE_KEYWORDS: Dict[str, Dict[str, float]] = {
+    "web_search": {"天气": 3, "气温": 2, "新闻": 3, "最新": 2.5, "今天": 2, "实时": 3, "推荐": 1.5, "附近": 2, "价格": 1.5,
+                   "近期": 2, "刚刚": 2, "餐厅": 1.5, "景点": 1.5, "排行": 1, "官网": 1.5},
+    "analysis": {"计算": 3, "分析": 2, "趋势": 2, "换算": 3, "转换": 2, "平均": 2, "方差": 3, "标准差": 3, "中位数": 3, "百分比": 2,
+                 "增长率": 2, "概率": 2, "求解": 2, "统计": 2, "推理": 1.5, "对比": 1},
+    "research": {"什么是": 2.5, "定义": 3, "原理": 3, "概念": 2.5, "介绍": 1.5, "历史": 1.5, "区别": 1.5,
+                 "论文": 2, "知识库": 3, "文档": 2, "资料": 2, "为什么": 1.5, "机制": 2},
+}
+# 最高分低于该值视为信息不足，交给大模型
+MIN_KEYWORD_SCORE = 2.0
+
+
+class RouteDecision:
+    __slots__ = ("routes", "source", "confidence")
+
+    def __init__(self, routes: List[str], source: str, confidence: float):
+        self.routes = routes
+        self.source = source  # rule / keywords / cache
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"RouteDecision({self.routes}, source={self.source}, confidence={self.confidence:.2f})"
+
+
+class LocalRouter:
+    def __init__(self, confidence_threshold: float = ROUTER_CONFIDENCE, cache_size: int = ROUTER_CACHE_SIZE):
+        self.confidence_threshold = confidence_threshold
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._counters = {"rule": 0, "keywords": 0, "cache": 0, "llm_calls": 0}
+
+    def _classify_by_rules(self, query: str, text: str, scores: Dict[str, float]) -> Optional[str]:
+        route = None
+        # 快速通道当作日期拒绝的“12/25”，规则也不认作算式
+        if ARITHMETIC_PATTERN.match(text) and re.search(r"\d", text) and not looks_like_date(query):
+            route = "analysis"
+        elif UNIT_CONVERSION_PATTERN.search(text):
+            route = "analysis"
+        elif any(kw in text for kw in REALTIME_KEYWORDS):
+            route = "web_search"
+        # “查找新闻并分析趋势”这类问题同时命中其它路由的关键词，不能只派给一个智能体
+        if route is not None and any(r != route and s > 0 for r, s in scores.items()):
+            return None
+        return route
+
+    def _score(self, text: str) -> Dict[str, float]:
+        return {route: sum(w for kw, w in keywords.items() if kw in text)
+                for route, keywords in ROUTE_KEYWORDS.items()}
+
+    def route(self, query: str) -> Optional[RouteDecision]:
+        """返回本地判定结果；无法确定时返回 None，由调用方回退到大模型"""
+        key = normalize_query(query)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self._counters["cache"] += 1
+            return RouteDecision(cached, "cache", 1.0)
+
+        scores = self._score(key)
+        route = self._classify_by_rules(query, key, scores)
+        if route is not None:
+            self._counters["rule"] += 1
+            self.remember(query, [route])
+            return RouteDecision([route], "rule", 1.0)
+
+        total = sum(scores.values())
+        best = max(scores, key=scores.get)
+        if scores[best] < MIN_KEYWORD_SCORE:
+            return None
+        confidence = scores[best] / total
+        if confidence < self.confidence_threshold:
+            return None
+        # 多路模式下第二名也有明显得分，说明可能是复合问题，交给大模型拆分
+        if MULTI_ROUTE and any(r != best and s >= MIN_KEYWORD_SCORE for r, s in scores.items()):
+            return None
+        self._counters["keywords"] += 1
+        self.remember(query, [best])
+        return RouteDecision([best], "keywords", confidence)
+
+    def remember(self, query: str, routes: List[str]):
+        """缓存一次路由决策（包括大模型给出的决策）"""
+        key = normalize_query(query)
+        self._cache[key] = list(routes)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def record_llm_call(self):
+        self._counters["llm_calls"] += 1
+
+    def stats(self) -> dict:
+        saved = self._counters["rule"] + self._counters["keywords"] + self._counters["cache"]
+        total = saved + self._counters["llm_calls"]
+        return {**self._counters, "llm_calls_saved": saved,
+                "saved_rate": round(saved / total, 4) if total else None,
+                "cached_decisions": len(self._cache)}
@@ -0,0 +1,150 @@
+"""
+向量索引规模基准：语料从数千增长到百万片段时，HNSW 检索延迟与召回率如何变化
+- 语料为确定性本地生成的向量（benchmarks/fake_embeddings.clustered_vectors），不需要 API Key
+- 通过 RAG.vectorstore.SharedVectorStore 建库，索引参数与线上一致（VECTOR_SPACE / HNSW_* 或命令行覆盖）
+- 报告：构建耗时、磁盘/内存占用、各检索 ef 下的 p50/p95 查询延迟与相对暴力检索的 recall@k
+运行：python benchmarks/bench_ann_index.py --sizes 1000,10000,100000 --dim 1024 --ef-search 10,50,100
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import numpy as np
+from chromadb.api.client import SharedSystemClient
+
+from benchmarks.fake_embeddings import HashingEmbeddings, clustered_vectors, perturbed_queries
+from RAG.vectorstore import SharedVectorStore, hnsw_metadata
+from config.env_utils import VECTOR_SPACE, HNSW_M, HNSW_CONSTRUCTION_EF
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB），仅 Linux 可用，其余平台返回 0"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return 0.0
+
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / 2 ** 20
+
+
+def scores(batch: np.ndarray, queries: np.ndarray, space: str) -> np.ndarray:
+    """越大越相近：l2 取负的平方距离，cosine / ip 取内积（语料与查询均已归一化）"""
+    dots = queries @ batch.T
+    if space == "l2":
+        return 2 * dots - (batch * batch).sum(axis=1)[None, :]
+    return dots
+
+
+def exact_topk(batches, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """流式暴力检索：逐批合并每个查询的 top-k，语料不必整体驻留内存；返回语料下标"""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    offset = 0
+    for batch in batches:
+        batch_scores = scores(batch, queries, space)
+        merged_scores = np.concatenate([best_scores, batch_scores], axis=1)
+        merged_ids = np.concatenate([best_ids, np.arange(offset, offset + len(batch))[None, :].repeat(len(queries), 0)],
+                                    axis=1)
+        top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best_ids = np.take_along_axis(merged_ids, top, axis=1)
+        offset += len(batch)
+    return best_ids
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_size(n: int, args, index_config: dict):
+    path = tempfile.mkdtemp(prefix=f"bench_ann_{n}_")
+    try:
+        rss_before = rss_mb()
+        store = SharedVectorStore(path, embeddings=HashingEmbeddings(), index_config=index_config,
+                                  collection_name="bench_ann")
+        batch_size = min(args.batch, store.chroma._client.get_max_batch_size())
+        rng = np.random.default_rng(args.seed + 1)
+        query_rows = set(rng.choice(n, size=min(args.queries, n), replace=False).tolist())
+        sampled = []
+
+        # 第一遍：建库，同时收集用作查询的语料向量
+        start = time.perf_counter()
+        offset = 0
+        for batch in clustered_vectors(n, args.dim, seed=args.seed, batch_size=batch_size):
+            ids = [str(i) for i in range(offset, offset + len(batch))]
+            store.collection.upsert(ids=ids, embeddings=batch, documents=[""] * len(batch))
+            sampled.extend(batch[i - offset] for i in range(offset, offset + len(batch)) if i in query_rows)
+            offset += len(batch)
+        build_s = time.perf_counter() - start
+        queries = perturbed_queries(np.stack(sampled), noise=args.noise, seed=args.seed + 2)
+
+        # 第二遍：相同种子重新生成语料，流式暴力检索得到真实 top-k
+        truth = exact_topk(clustered_vectors(n, args.dim, seed=args.seed, batch_size=batch_size),
+                           queries, args.k, index_config["hnsw:space"])
+        truth_sets = [set(map(str, row)) for row in truth]
+
+        for ef in args.ef_search:
+            # 检索 ef 在索引加载时生效：清空 chromadb 进程内缓存，按新参数重新打开同一目录
+            SharedSystemClient.clear_system_cache()
+            store = SharedVectorStore(path, embeddings=HashingEmbeddings(),
+                                      index_config={**index_config, "hnsw:search_ef": ef}, collection_name="bench_ann")
+            for q in queries[:5]:  # 预热：首次查询会加载索引
+                store.collection.query(query_embeddings=[q], n_results=args.k, include=[])
+            latencies, hits = [], 0
+            for q, expected in zip(queries, truth_sets):
+                t = time.perf_counter()
+                result = store.collection.query(query_embeddings=[q], n_results=args.k, include=[])
+                latencies.append((time.perf_counter() - t) * 1000)
+                hits += len(expected & set(result["ids"][0]))
+            print(f"{n:>9} {build_s:>8.1f} {dir_size_mb(path):>9.1f} {rss_mb() - rss_before:>8.1f} "
+                  f"{ef:>5} {statistics.median(latencies):>8.2f} {percentile(latencies, 0.95):>8.2f} "
+                  f"{hits / (len(queries) * args.k):>9.3f}")
+    finally:
+        if args.keep:
+            print(f"  保留测试库: {path}")
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000", help="逗号分隔的语料规模，例如 1000,10000,1000000")
+    parser.add_argument("--dim", type=int, default=1024, help="向量维度（text-embedding-v4 默认 1024）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--space", default=VECTOR_SPACE)
+    parser.add_argument("--m", type=int, default=HNSW_M)
+    parser.add_argument("--construction-ef", type=int, default=HNSW_CONSTRUCTION_EF)
+    parser.add_argument("--ef-search", default="10,50,100", help="逗号分隔的检索 ef，同一份索引上依次测试")
+    parser.add_argument("--noise", type=float, default=0.3, help="查询相对语料向量的噪声强度")
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="保留生成的测试库目录")
+    args = parser.parse_args()
+    args.ef_search = [int(x) for x in args.ef_search.split(",")]
+
+    index_config = hnsw_metadata(args.space, args.m, args.construction_ef, args.ef_search[0])
+    print(f"索引参数: {index_config}，维度 {args.dim}，查询 {args.queries} 条，k={args.k}")
+    print(f"{'片段数':>6} {'构建(s)':>6} {'磁盘(MB)':>7} {'内存(MB)':>6} {'ef':>5} "
+          f"{'p50(ms)':>8} {'p95(ms)':>8} {'recall@k':>9}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        run_size(n, args, index_config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+并发 /query 基准：用固定延迟的桩模型替换 moon，验证 N 个并发请求的总耗时约等于单个请求
+运行：python benchmarks/bench_concurrent_query.py --concurrency 10 --delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import httpx
+from langchain_core.messages import AIMessage
+
+import agents.nodes as nodes
+import main
+from orchestration.workflow import build_agent_workflow
+
+
+class SlowFakeModel:
+    """模拟远程 LLM：每次调用异步等待固定时长，路由阶段固定返回 research"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        return AIMessage(content="research")
+
+    def invoke(self, prompt, *args, **kwargs):
+        time.sleep(self.delay)
+        return AIMessage(content="research")
+
+
+class FakeRetriever:
+    async def adaptive_retrieve(self, query, chat_history=None, strategy="history_aware"):
+        return [{"content": f"关于 {query} 的资料", "metadata": {"source": "bench"}}]
+
+
+class FakeRetrieverPool:
+    def get(self, vectorstore_path, **config):
+        return FakeRetriever()
+
+
+async def run(concurrency: int, delay: float):
+    nodes.moon = SlowFakeModel(delay)
+    main.WORKFLOW_GRAPH = build_agent_workflow(None, None, None, retriever_pool=FakeRetrieverPool())
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i: int):
+            resp = await client.post("/query", json={"query": f"问题 {i}", "thread_id": f"bench-{i}-{time.time()}"})
+            resp.raise_for_status()
+
+        start = time.perf_counter()
+        await one(-1)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(concurrency)))
+        parallel = time.perf_counter() - start
+
+    print(f"单个请求耗时: {single:.2f}s")
+    print(f"{concurrency} 个并发请求总耗时: {parallel:.2f}s（串行预期 {single * concurrency:.2f}s）")
+    print(f"并发加速比: {single * concurrency / parallel:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.5, help="桩模型单次调用延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.delay))
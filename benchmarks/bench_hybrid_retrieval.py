@@ -0,0 +1,106 @@
+"""
+混合检索基准：纯向量检索 vs BM25 + 向量 RRF 融合 vs 融合后本地重排序
+合成语料：同一模板的产品说明只在型号/数值上不同，查询点名具体型号，相关片段唯一
+使用确定性本地嵌入（benchmarks/fake_embeddings.py），不需要 API Key
+运行：python benchmarks/bench_hybrid_retrieval.py --docs 2000 --queries 200 --k 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from langchain_chroma import Chroma
+
+from benchmarks.fake_embeddings import HashingEmbeddings
+from RAG.reranker import LexicalReranker
+from RAG.sparse_index import BM25Index, fuse_documents
+from config.env_utils import HYBRID_CANDIDATE_FACTOR, RERANK_CANDIDATES
+
+TEMPLATES = [
+    "型号 {code} 的工业电机额定功率为 {value} 千瓦，适用于风机和水泵，防护等级 IP55。",
+    "{code} 系列变频器支持 {value} 伏输入电压，内置制动单元，适合起重设备。",
+    "服务器 {code} 配置 {value} 核处理器，支持热插拔硬盘与冗余电源。",
+    "传感器 {code} 的测量范围为 0 到 {value} 摄氏度，输出 4-20mA 信号。",
+]
+QUERIES = [
+    "{code} 的额定功率是多少",
+    "{code} 支持什么输入电压",
+    "{code} 配置了多少核处理器",
+    "{code} 的测量范围是多少",
+]
+
+
+def build_corpus(n_docs: int, seed: int):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        template = i % len(TEMPLATES)
+        code = f"{rng.choice('ABCDEFGHJK')}{rng.choice('XYZ')}-{rng.randint(1000, 9999)}"
+        docs.append((f"doc-{i}", TEMPLATES[template].format(code=code, value=rng.randint(5, 500)), template, code))
+    return docs
+
+
+async def run(n_docs: int, n_queries: int, k: int, seed: int):
+    docs = build_corpus(n_docs, seed)
+    embeddings = HashingEmbeddings()
+    vectorstore = Chroma(collection_name=f"bench_hybrid_{seed}", embedding_function=embeddings)
+    vectorstore.add_texts([d[1] for d in docs], metadatas=[{"source": d[0]} for d in docs], ids=[d[0] for d in docs])
+    index = BM25Index()
+    start = time.perf_counter()
+    index.sync(vectorstore._collection)
+    sync_ms = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(seed + 1)
+    sample = rng.sample(docs, min(n_queries, len(docs)))
+    results = {"dense": ([], []), "hybrid": ([], []), "rerank": ([], [])}
+    reranker = LexicalReranker()
+
+    async def hybrid_search(query: str, top_n: int):
+        candidates = top_n * HYBRID_CANDIDATE_FACTOR
+        dense_docs, sparse_hits = await asyncio.gather(
+            asyncio.to_thread(vectorstore.similarity_search, query, k=candidates),
+            asyncio.to_thread(index.search, query, candidates),
+        )
+        return fuse_documents(dense_docs, sparse_hits, index, top_n=top_n)
+
+    for doc_id, _, template, code in sample:
+        query = QUERIES[template].format(code=code)
+
+        start = time.perf_counter()
+        dense = await asyncio.to_thread(vectorstore.similarity_search, query, k=k)
+        results["dense"][1].append((time.perf_counter() - start) * 1000)
+        results["dense"][0].append(any(d.id == doc_id for d in dense))
+
+        start = time.perf_counter()
+        hybrid = await hybrid_search(query, k)
+        results["hybrid"][1].append((time.perf_counter() - start) * 1000)
+        results["hybrid"][0].append(any(d.id == doc_id for d in hybrid))
+
+        start = time.perf_counter()
+        reranked = await reranker.arerank(query, await hybrid_search(query, RERANK_CANDIDATES), top_n=k)
+        results["rerank"][1].append((time.perf_counter() - start) * 1000)
+        results["rerank"][0].append(any(d.id == doc_id for d in reranked))
+
+    print(f"语料 {n_docs} 条，查询 {len(sample)} 条，k={k}，BM25 全量同步 {sync_ms:.1f} ms")
+    for name, (hits, latencies) in results.items():
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+        print(f"{name:>6}: recall@{k}={sum(hits) / len(hits):.3f}  "
+              f"p50={statistics.median(latencies):.2f} ms  p95={p95:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args.docs, args.queries, args.k, args.seed))
@@ -0,0 +1,88 @@
+"""
+MCP 传输方式基准：stdio 子进程 vs 进程内内存传输，测量单次工具调用的额外开销
+使用 calculator_server 的 basic_calculator（纯本地计算，不需要 API Key），并以直接调用计算函数作为下限
+并发测试一次性提交全部调用，延迟包含排队时间，以吞吐为准
+运行：python benchmarks/bench_mcp_transport.py --calls 500 --concurrency 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from mcp_tools.calculator_server import safe_eval_expr
+from mcp_tools.mcp_integration import MCPSessionPool, MCP_SERVER_CONFIGS
+
+SERVER = "calculator_server"
+EXPRESSION = "sqrt(x) * 2 + sin(y) / 3"
+
+
+def _summary(name: str, latencies: list, wall: float):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    print(f"{name:>9}: p50={statistics.median(latencies) * 1000:.3f} ms  p95={p95 * 1000:.3f} ms  "
+          f"吞吐={len(latencies) / wall:.0f} 次/秒")
+
+
+async def bench_direct(calls: int):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(calls):
+        t = time.perf_counter()
+        safe_eval_expr(EXPRESSION, {"x": float(i), "y": 1.0})
+        latencies.append(time.perf_counter() - t)
+    _summary("direct", latencies, time.perf_counter() - start)
+
+
+async def bench_transport(transport: str, calls: int, concurrency: int):
+    pool = MCPSessionPool(configs={SERVER: MCP_SERVER_CONFIGS[SERVER]}, max_concurrency=concurrency,
+                          health_interval=3600, transport=transport)
+    start = time.perf_counter()
+    await pool.start()
+    startup_ms = (time.perf_counter() - start) * 1000
+    tool = next(t for t in pool.get_tools() if t.name == "basic_calculator")
+    try:
+        # 预热：首次调用包含 schema 校验等一次性开销
+        await tool.ainvoke({"expression": EXPRESSION, "variables": {"x": 1.0, "y": 1.0}})
+        print(f"[{transport}] 启动耗时 {startup_ms:.1f} ms")
+
+        latencies = []
+        start = time.perf_counter()
+        for i in range(calls):
+            t = time.perf_counter()
+            await tool.ainvoke({"expression": EXPRESSION, "variables": {"x": float(i), "y": 1.0}})
+            latencies.append(time.perf_counter() - t)
+        _summary(transport, latencies, time.perf_counter() - start)
+
+        latencies = []
+
+        async def one(i: int):
+            t = time.perf_counter()
+            await tool.ainvoke({"expression": EXPRESSION, "variables": {"x": float(i), "y": 1.0}})
+            latencies.append(time.perf_counter() - t)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(calls)))
+        _summary(f"{transport}×{concurrency}", latencies, time.perf_counter() - start)
+    finally:
+        await pool.close()
+
+
+async def run(calls: int, concurrency: int):
+    print(f"每种方式 {calls} 次调用，表达式: {EXPRESSION}")
+    await bench_direct(calls)
+    for transport in ("stdio", "inprocess"):
+        await bench_transport(transport, calls, concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4, help="并发测试时服务级并发上限")
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.concurrency))
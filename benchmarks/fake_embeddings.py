@@ -0,0 +1,64 @@
+"""
+基准用的确定性本地嵌入：不走网络，结果可复现
+- HashingEmbeddings：把中文二元组与英文单词哈希到固定维度并归一化。数字与编号被有意忽略，
+  用来模拟真实稠密模型对型号、编号、金额等精确词不敏感的特点
+- clustered_vectors / perturbed_queries：直接生成大规模语料向量（带主题簇结构）与查询向量，
+  供索引规模类基准使用，百万级语料不必逐条走文本嵌入
+"""
+import hashlib
+import math
+import re
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_CJK = re.compile(r"[一-鿿]+")
+_WORD = re.compile(r"[a-zA-Z]+")
+
+
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        features = [w.lower() for w in _WORD.findall(text)]
+        for run in _CJK.findall(text):
+            features.extend(run[i:i + 2] for i in range(max(len(run) - 1, 1)))
+        return features
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for feature in self._features(text):
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def clustered_vectors(n: int, dim: int = 1024, n_clusters: int = 256, spread: float = 0.6,
+                      seed: int = 42, batch_size: int = 100_000):
+    """按批生成归一化的 float32 语料向量：簇中心 + 高斯噪声，模拟真实语料的主题聚集"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    for start in range(0, n, batch_size):
+        size = min(batch_size, n - start)
+        batch = centers[rng.integers(0, n_clusters, size)]
+        batch += rng.standard_normal((size, dim), dtype=np.float32) * (spread / np.sqrt(dim))
+        batch /= np.linalg.norm(batch, axis=1, keepdims=True)
+        yield batch
+
+
+def perturbed_queries(rows: np.ndarray, noise: float = 0.3, seed: int = 7) -> np.ndarray:
+    """给抽样得到的语料向量加噪声作为查询（查询与某些片段相近，但不完全相同）"""
+    rng = np.random.default_rng(seed)
+    queries = rows + rng.standard_normal(rows.shape, dtype=np.float32) * (noise / np.sqrt(rows.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
@@ -14,4 +14,73 @@ K2_BASE_URL=os.getenv("MOONSHINE_BASE_URL")
 ALi_API_KEY=os.getenv("ALI_API_KEY")
 ALi_BASE_URL=os.getenv("ALI_BASE_URL")
 FIRECRAWL_API_KEY=os.getenv("FIRECRAWL_API_KEY")
-FIRECRAWL_BASE_URL=os.getenv("FIRECRAWL_BASE_URL")
\ No newline at end of file
+FIRECRAWL_BASE_URL=os.getenv("FIRECRAWL_BASE_URL")
+# 研究知识库（Chroma）持久化目录，FastAPI 进程与 research MCP 服务共用
+VECTORSTORE_PATH=os.getenv("VECTORSTORE_PATH","/root/autodl-tmp/research_vectorstore")
+# MCP 会话池：每个服务的最大并发工具调用数、健康检查间隔（秒）
+MCP_MAX_CONCURRENCY=int(os.getenv("MCP_MAX_CONCURRENCY","4"))
+MCP_HEALTH_INTERVAL=float(os.getenv("MCP_HEALTH_INTERVAL","30"))
+# MCP 传输方式：stdio（独立子进程）或 inprocess（在 FastAPI 进程内通过内存传输挂载 FastMCP 服务）
+MCP_TRANSPORT=os.getenv("MCP_TRANSPORT","stdio").lower()
+# 多路并行模式：分析器可一次选择多个专家智能体并发执行；单个分支超时时间（秒）
+MULTI_ROUTE=os.getenv("MULTI_ROUTE","false").lower() in ("1","true","yes")
+BRANCH_TIMEOUT_SECONDS=float(os.getenv("BRANCH_TIMEOUT_SECONDS","90"))
+# 图状态检查点：后端（sqlite / memory）、SQLite 文件路径、TTL 淘汰与压缩策略
+CHECKPOINT_BACKEND=os.getenv("CHECKPOINT_BACKEND","sqlite")
+CHECKPOINT_DB_PATH=os.getenv("CHECKPOINT_DB_PATH","checkpoints.sqlite")
+CHECKPOINT_FINISHED_TTL=float(os.getenv("CHECKPOINT_FINISHED_TTL",str(24*3600)))
+CHECKPOINT_ABANDONED_TTL=float(os.getenv("CHECKPOINT_ABANDONED_TTL",str(7*24*3600)))
+CHECKPOINT_KEEP_PER_THREAD=int(os.getenv("CHECKPOINT_KEEP_PER_THREAD","5"))
+CHECKPOINT_MAINTENANCE_INTERVAL=float(os.getenv("CHECKPOINT_MAINTENANCE_INTERVAL","600"))
+# 嵌入模型与嵌入缓存（内存 LRU + 向量库旁的 SQLite 磁盘缓存）容量；内存条目按 float32 保存，1024 维 20000 条约 80MB
+EMBEDDING_MODEL=os.getenv("EMBEDDING_MODEL","text-embedding-v4")
+EMBEDDING_CACHE_MEMORY_ITEMS=int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS","20000"))
+EMBEDDING_CACHE_DISK_ITEMS=int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS","1000000"))
+# 文档入库流水线：每批嵌入/写入的片段数、并发嵌入批次数；上传落盘分块大小（字节）
+INGEST_BATCH_SIZE=int(os.getenv("INGEST_BATCH_SIZE","64"))
+INGEST_CONCURRENCY=int(os.getenv("INGEST_CONCURRENCY","4"))
+UPLOAD_CHUNK_SIZE=int(os.getenv("UPLOAD_CHUNK_SIZE",str(1024*1024)))
+# 异步入库任务：后台 worker 数量、保留的已结束任务数
+INGEST_WORKERS=int(os.getenv("INGEST_WORKERS","2"))
+INGEST_JOB_HISTORY=int(os.getenv("INGEST_JOB_HISTORY","1000"))
+# 跨线程答案缓存：开关、各路由 TTL（秒）、语义相似度阈值（默认 0 仅精确匹配；语义匹配只用于 research）、最大条目数
+ANSWER_CACHE_ENABLED=os.getenv("ANSWER_CACHE_ENABLED","true").lower() in ("1","true","yes")
+ANSWER_CACHE_TTL_RESEARCH=float(os.getenv("ANSWER_CACHE_TTL_RESEARCH",str(6*3600)))
+ANSWER_CACHE_TTL_ANALYSIS=float(os.getenv("ANSWER_CACHE_TTL_ANALYSIS",str(24*3600)))
+ANSWER_CACHE_TTL_WEB_SEARCH=float(os.getenv("ANSWER_CACHE_TTL_WEB_SEARCH","300"))
+ANSWER_CACHE_SIMILARITY=float(os.getenv("ANSWER_CACHE_SIMILARITY","0"))
+ANSWER_CACHE_MAX_ENTRIES=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES","2000"))
+# 本地快速路由：开关、关键词打分置信度阈值、路由决策缓存条数
+ROUTER_LOCAL_ENABLED=os.getenv("ROUTER_LOCAL_ENABLED","true").lower() in ("1","true","yes")
+ROUTER_CONFIDENCE=float(os.getenv("ROUTER_CONFIDENCE","0.75"))
+ROUTER_CACHE_SIZE=int(os.getenv("ROUTER_CACHE_SIZE","5000"))
+# 流式统计会话：空闲过期时间（秒）、分位数草图精度参数 k、文件模式每块行数
+STATS_SESSION_TTL=float(os.getenv("STATS_SESSION_TTL","1800"))
+STATS_SKETCH_K=int(os.getenv("STATS_SKETCH_K","1000"))
+STATS_FILE_CHUNK_ROWS=int(os.getenv("STATS_FILE_CHUNK_ROWS","100000"))
+# 混合检索：自动策略下简单查询使用的策略、BM25 与集合的同步间隔（秒）、RRF 常数、每路候选数倍率
+RAG_DEFAULT_STRATEGY=os.getenv("RAG_DEFAULT_STRATEGY","hybrid")
+SPARSE_SYNC_INTERVAL=float(os.getenv("SPARSE_SYNC_INTERVAL","30"))
+HYBRID_RRF_K=int(os.getenv("HYBRID_RRF_K","60"))
+HYBRID_CANDIDATE_FACTOR=int(os.getenv("HYBRID_CANDIDATE_FACTOR","4"))
+# 重排序：中等复杂度查询的检索策略（rerank / compressed）、重排后端（lexical / cross_encoder）、交叉编码器模型、候选数与输出数
+RAG_MEDIUM_STRATEGY=os.getenv("RAG_MEDIUM_STRATEGY","rerank")
+RERANKER_BACKEND=os.getenv("RERANKER_BACKEND","lexical")
+RERANKER_MODEL=os.getenv("RERANKER_MODEL","BAAI/bge-reranker-base")
+RERANK_CANDIDATES=int(os.getenv("RERANK_CANDIDATES","20"))
+RERANK_TOP_N=int(os.getenv("RERANK_TOP_N","5"))
+# 会话历史：每个线程保留的最近对话轮数、历史改写后独立问题的缓存条数
+HISTORY_MAX_TURNS=int(os.getenv("HISTORY_MAX_TURNS","5"))
+CONDENSE_CACHE_SIZE=int(os.getenv("CONDENSE_CACHE_SIZE","1024"))
+# 向量索引（HNSW）：距离度量（l2 / cosine / ip）、每个节点的邻居数 M、构建 ef、检索 ef
+# 前三项只在创建集合时生效（修改需重建集合），检索 ef 对已有集合也会更新
+VECTOR_SPACE=os.getenv("VECTOR_SPACE","l2")
+HNSW_M=int(os.getenv("HNSW_M","16"))
+HNSW_CONSTRUCTION_EF=int(os.getenv("HNSW_CONSTRUCTION_EF","100"))
+HNSW_SEARCH_EF=int(os.getenv("HNSW_SEARCH_EF","100"))
+# 向量存储后端：chroma（HNSW 索引）/ compact（内存映射原始向量 + 压缩码粗排、原始向量精排）
+# 紧凑存储的压缩方式（int8 / pq / none）、PQ 子空间数（需整除向量维度）、精排候选数相对 k 的倍率（PQ 粗排误差大，建议 32 以上）
+VECTOR_BACKEND=os.getenv("VECTOR_BACKEND","chroma")
+VECTOR_QUANTIZATION=os.getenv("VECTOR_QUANTIZATION","int8")
+PQ_SUBSPACES=int(os.getenv("PQ_SUBSPACES","64"))
+RESCORE_FACTOR=int(os.getenv("RESCORE_FACTOR","8"))
@@ -4,7 +4,11 @@ import gradio as gr
 import requests
 import json
 import os
+import time
 BASE_URL = "http://localhost:8000"
+# 入库进度轮询间隔与总时限（秒）
+UPLOAD_POLL_INTERVAL = 1
+UPLOAD_POLL_TIMEOUT = 30 * 60
 
 def submit_query(query: str, thread_id: str):
     if not query.strip():
@@ -24,6 +28,70 @@ def submit_query(query: str, thread_id: str):
     except Exception as e:
         return ("", "", "", "", f"❌ 请求异常: {str(e)}", thread_id)
 
+def _iter_sse(resp):
+    """解析 Server-Sent Events 流，逐条产出 (event, data)"""
+    event, data_lines = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
+NODE_LABELS = {
+    "analyze": "🧭 调度专家分析问题",
+    "research": "📚 研究智能体检索知识库",
+    "analysis": "📊 分析智能体计算",
+    "web_search": "🌐 网络搜索智能体查询",
+    "integrate": "✍️ 整合器生成回答",
+}
+
+
+def submit_query_stream(query: str, thread_id: str):
+    """调用 /query/stream，按节点进度与 token 增量逐步刷新界面"""
+    if not query.strip():
+        yield ("", "", "", "", "请输入问题", thread_id)
+        return
+    research, analysis, web, draft, status = "", "", "", "", "⏳ 已提交，等待调度..."
+    try:
+        with requests.post(f"{BASE_URL}/query/stream", json={"query": query, "thread_id": thread_id},
+                           stream=True, timeout=(10, 300)) as resp:
+            if resp.status_code != 200:
+                err = resp.json().get("detail", "未知错误")
+                yield ("", "", "", "", f"❌ 提交失败: {err}", thread_id)
+                return
+            for event, data in _iter_sse(resp):
+                if event == "start":
+                    thread_id = data.get("thread_id", thread_id)
+                elif event == "node_start":
+                    status = f"⏳ {NODE_LABELS.get(data['node'], data['node'])}..."
+                elif event == "node_end":
+                    output = data.get("output") or {}
+                    if "research_result" in output:
+                        research = _format_result(output["research_result"])
+                    if "analysis_result" in output:
+                        analysis = _format_result(output["analysis_result"])
+                    if "web_search_result" in output:
+                        web = _format_result(output["web_search_result"])
+                    if data["node"] == "analyze" and output.get("query_types"):
+                        status = f"🧭 已选择智能体: {', '.join(output['query_types'])}"
+                elif event == "token":
+                    draft += data.get("delta", "")
+                elif event == "waiting_for_approval":
+                    status = data.get("message", "查询已完成")
+                    draft = data.get("final_answer") or draft
+                elif event == "error":
+                    status = f"❌ {data.get('detail', '执行失败')}"
+                yield (research, analysis, web, draft, status, thread_id)
+    except Exception as e:
+        yield (research, analysis, web, draft, f"❌ 请求异常: {str(e)}", thread_id)
+
 def approve_and_get_answer(thread_id: str,feedback: str):
     if not thread_id.strip():
         return "", "请输入有效的 Thread ID"
@@ -69,10 +137,21 @@ def _format_result(result):
         else:
             return json.dumps(result, ensure_ascii=False, indent=2)
     return str(result)
+def _format_job(job: dict) -> str:
+    total = job.get("total_pages")
+    pages = f"{job.get('pages_parsed', 0)}/{total}" if total else str(job.get("pages_parsed", 0))
+    eta = job.get("eta_seconds")
+    return (f"状态: {job.get('status')}\n"
+            f"已解析页数: {pages} | 已嵌入片段: {job.get('chunks_embedded', 0)} | "
+            f"已写入片段: {job.get('chunks_written', 0)} | 去重跳过: {job.get('chunks_deduplicated', 0)}"
+            + (f" | 预计剩余: {eta:.0f}s" if eta is not None else ""))
+
+
 def handle_upload(file_obj, source_name: str):
-    """处理文档上传到 /upload 接口"""
+    """上传文档到 /upload 入队，随后轮询 /upload/{job_id} 刷新入库进度"""
     if not file_obj:
-        return "❌ 请先选择一个文件"
+        yield "❌ 请先选择一个文件"
+        return
     try:
         with open(file_obj.name, "rb") as f:
             files = {"file": (os.path.basename(file_obj.name), f, "application/octet-stream")}
@@ -87,14 +166,35 @@ def handle_upload(file_obj, source_name: str):
                 timeout=120
             )
 
-        if resp.status_code == 200:
-            result = resp.json().get("message", "上传成功")
-            return f"✅ 摄入成功！\n{result}"
-        else:
+        if resp.status_code != 200:
             error_detail = resp.json().get("detail", resp.text)
-            return f"❌ 上传失败 ({resp.status_code}): {error_detail}"
+            yield f"❌ 上传失败 ({resp.status_code}): {error_detail}"
+            return
+
+        job_id = resp.json()["job_id"]
+        yield f"📤 已上传，入库任务 {job_id} 排队中..."
+        deadline = time.time() + UPLOAD_POLL_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(UPLOAD_POLL_INTERVAL)
+            resp = requests.get(f"{BASE_URL}/upload/{job_id}", timeout=10)
+            if resp.status_code == 404:
+                # 任务队列只在内存中：服务重启或任务被移出历史记录后查询不到
+                yield f"❌ 找不到入库任务 {job_id}（服务可能已重启或任务记录已过期），请到知识库状态中确认是否已入库"
+                return
+            if resp.status_code != 200:
+                yield f"❌ 查询入库进度失败 ({resp.status_code}): {resp.text}"
+                return
+            job = resp.json()
+            if job.get("status") == "succeeded":
+                yield f"✅ 摄入成功！\n{_format_job(job)}"
+                return
+            if job.get("status") == "failed":
+                yield f"❌ 摄入失败: {job.get('error')}\n{_format_job(job)}"
+                return
+            yield f"⏳ 入库中（任务 {job_id}）\n{_format_job(job)}"
+        yield f"⌛ 超过 {UPLOAD_POLL_TIMEOUT // 60} 分钟仍未完成，已停止刷新；任务 {job_id} 仍在后台执行"
     except Exception as e:
-        return f"❌ 请求异常: {str(e)}"
+        yield f"❌ 请求异常: {str(e)}"
 # ===== Gradio UI =====
 with gr.Blocks(title="多智能体协作与决策系统") as demo:
     gr.Markdown("# 🤖 智能体协作与决策系统")
@@ -177,7 +277,7 @@ with gr.Blocks(title="多智能体协作与决策系统") as demo:
         outputs=[
             status_output, research_output, analysis_output, web_output, final_output]
     ).then(
-        fn=submit_query,
+        fn=submit_query_stream,
         inputs=[query_input, thread_id_input],
         outputs=[
             research_output, analysis_output, web_output,
@@ -1,5 +1,6 @@
 # main.py
 import asyncio
+import json
 import os
 import sys
 from contextlib import asynccontextmanager
@@ -8,13 +9,24 @@ from typing import List, Optional
 from uuid import uuid4
 
 from fastapi import FastAPI, HTTPException, File, Form, UploadFile
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from langchain_core.messages import HumanMessage
 from langchain_core.tools import BaseTool
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, StreamingResponse
 
 from agents.base_agent import create_specialist_agent
+from agents.answer_cache import AnswerCache
 from agents.nodes import AgentState
-from mcp_tools.mcp_integration import get_tools
+from agents.router import LocalRouter
+from RAG.embedding_cache import embedding_cache_stats, get_cached_embeddings
+from RAG.ingest_jobs import IngestJob, IngestJobQueue
+from RAG.ingestion import ingest_file, SUPPORTED_SUFFIXES, INGEST_MODES
+from RAG.retriever_pool import RetrieverPool
+from RAG.vectorstore import get_vectorstore, vectorstore_stats
+from config.env_utils import VECTORSTORE_PATH, UPLOAD_CHUNK_SIZE, ANSWER_CACHE_ENABLED, ROUTER_LOCAL_ENABLED
+from mcp_tools.mcp_integration import MCPSessionPool
+from orchestration.checkpoint import open_checkpointer, run_maintenance_loop
 from orchestration.workflow import build_agent_workflow
 
 # 自定义模块
@@ -23,25 +35,38 @@ from orchestration.workflow import build_agent_workflow
 # 全局变量
 WORKFLOW_GRAPH = None
 ResearchTools = []
+RETRIEVER_POOL: Optional[RetrieverPool] = None
+MCP_POOL: Optional[MCPSessionPool] = None
+CHECKPOINTER = None
+INGEST_QUEUE: Optional[IngestJobQueue] = None
+ANSWER_CACHE: Optional[AnswerCache] = None
+ROUTER: Optional[LocalRouter] = None
+KB_META_FILE = Path(VECTORSTORE_PATH) / "knowledge_meta.json"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global WORKFLOW_GRAPH
+    global WORKFLOW_GRAPH, RETRIEVER_POOL, MCP_POOL, CHECKPOINTER, INGEST_QUEUE, ANSWER_CACHE, ROUTER
+    maintenance_task = None
     print("🚀 正在加载 MCP 工具...")
 
     try:
-        # 获取所有 MCP 工具
-        all_tools: List[BaseTool] = await get_tools()
+        # 启动常驻 MCP 会话池，获取所有 MCP 工具（子进程只拉起一次）
+        MCP_POOL = MCPSessionPool()
+        await MCP_POOL.start()
+        all_tools: List[BaseTool] = MCP_POOL.get_tools()
         if not all_tools:
             raise RuntimeError("❌ 未加载到任何工具，请确保 MCP 服务已启动")
 
         # 分类工具
         research_tools = [t for t in all_tools if t.name in ("add_to_knowledge_base","semantic_search",
-                                                             "list_knowledge_base_stats","ingest_document")]
+                                                             "list_knowledge_base_stats","ingest_document",
+                                                             "list_sources")]
         global ResearchTools
         ResearchTools=research_tools
         analysis_tools = [t for t in all_tools if t.name in (
-            "basic_calculator", "scientific_calculator", "statistical_analysis", "unit_converter"
+            "basic_calculator", "batch_calculator", "scientific_calculator", "statistical_analysis",
+            "unit_converter", "list_units",
+            "stats_session_start", "stats_session_push", "stats_session_result", "statistical_analysis_file"
         )]
         web_search_tools = [t for t in all_tools if t.name == "zhiputool"]
 
@@ -54,17 +79,54 @@ async def lifespan(app: FastAPI):
         analyst = create_specialist_agent(analysis_tools, "AnalysisAgent", "数据分析师")
         web_searcher = create_specialist_agent(web_search_tools, "WebSearchAgent", "网络搜索专家")
 
+        # 预热进程级检索器池（嵌入客户端 / Chroma / 检索链只构建一次）
+        RETRIEVER_POOL = RetrieverPool()
+        cold_ms = RETRIEVER_POOL.warm(VECTORSTORE_PATH)
+        print(f"🔎 检索器预热完成，冷构建耗时 {cold_ms:.1f} ms")
+
+        # 后台入库任务队列
+        INGEST_QUEUE = IngestJobQueue(_run_ingest_job)
+        await INGEST_QUEUE.start()
+
+        # 持久化、有界的检查点（TTL 淘汰 + 压缩在后台定期执行）
+        CHECKPOINTER = await open_checkpointer()
+        maintenance_task = asyncio.create_task(run_maintenance_loop(CHECKPOINTER))
+
+        # 跨线程答案缓存：向量库变更版本号递增（任意进程经共享门面写入）即视为知识库版本变化
+        if ANSWER_CACHE_ENABLED:
+            ANSWER_CACHE = AnswerCache(embeddings=get_cached_embeddings(VECTORSTORE_PATH),
+                                       kb_version_fn=get_vectorstore(VECTORSTORE_PATH).version)
+
+        # 本地快速路由：规则/关键词可判定的问题不再调用调度大模型
+        if ROUTER_LOCAL_ENABLED:
+            ROUTER = LocalRouter()
+
         # 构建工作流
-        global WORKFLOW_GRAPH
-        WORKFLOW_GRAPH = build_agent_workflow(researcher, analyst, web_searcher)
+        WORKFLOW_GRAPH = build_agent_workflow(researcher, analyst, web_searcher, retriever_pool=RETRIEVER_POOL,
+                                              checkpointer=CHECKPOINTER, answer_cache=ANSWER_CACHE,
+                                              router=ROUTER, analysis_tools=analysis_tools)
         print("✅ 多智能体系统启动完成！")
 
-        yield  # 启动完成，服务运行中
-
     except Exception as e:
         print(f"💥 启动失败: {e}")
         raise
 
+    yield  # 启动完成，服务运行中
+
+    # 关闭阶段：停止入库 worker，释放共享检索器，关闭 MCP 会话与子进程
+    if INGEST_QUEUE is not None:
+        await INGEST_QUEUE.close()
+    if RETRIEVER_POOL is not None:
+        RETRIEVER_POOL.clear()
+    if MCP_POOL is not None:
+        await MCP_POOL.close()
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+        # 等维护任务真正退出（可能正在执行 amaintain）后再关闭连接
+        await asyncio.gather(maintenance_task, return_exceptions=True)
+    if CHECKPOINTER is not None:
+        await CHECKPOINTER.aclose()
+
 
 # 创建 FastAPI 应用，传入 lifespan
 app = FastAPI(
@@ -92,7 +154,21 @@ class ApprovalRequest(BaseModel):
     feedback: str = "同意"  # 默认值为“同意”，如果用户不写意见则默认通过
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "ready": WORKFLOW_GRAPH is not None}
+    # 嵌入缓存的 SQLite COUNT(*) 与 Chroma count() 都是阻塞 I/O，放到线程中执行
+    embedding_cache, vectorstore = await asyncio.gather(asyncio.to_thread(embedding_cache_stats),
+                                                        asyncio.to_thread(vectorstore_stats))
+    return {
+        "status": "ok",
+        "ready": WORKFLOW_GRAPH is not None,
+        "retriever_pool": RETRIEVER_POOL.stats() if RETRIEVER_POOL else [],
+        "mcp_servers": MCP_POOL.stats() if MCP_POOL else [],
+        "checkpointer": await CHECKPOINTER.astats() if CHECKPOINTER else None,
+        "embedding_cache": embedding_cache,
+        "vectorstore": vectorstore,
+        "ingest_jobs": INGEST_QUEUE.stats() if INGEST_QUEUE else None,
+        "answer_cache": ANSWER_CACHE.stats() if ANSWER_CACHE else None,
+        "router": ROUTER.stats() if ROUTER else None,
+    }
 
 @app.get("/kb/stats")
 async def get_knowledge_base_stats():
@@ -107,21 +183,16 @@ async def get_knowledge_base_stats():
         return {"error": str(e)}
 @app.get("/tools")
 async def list_tools():
-    tools = await get_tools()
+    if MCP_POOL is None:
+        raise HTTPException(status_code=503, detail="系统尚未初始化完成")
+    tools = MCP_POOL.get_tools()
     return [{"name": t.name, "description": t.description} for t in tools]
 
 
-@app.post("/query")
-async def submit_query(request: QueryRequest):
-    print('yes')
-    if not request.query.strip():
-        raise HTTPException(status_code=400, detail="查询不能为空")
-
-    config = {"configurable": {"thread_id": request.thread_id}}
-
-    initial_state = AgentState(
-        messages=[],
-        query=request.query,
+def _build_initial_state(query: str) -> AgentState:
+    return AgentState(
+        messages=[HumanMessage(content=query)],
+        query=query,
         query_type="general",
         research_result={},
         analysis_result={},
@@ -130,6 +201,31 @@ async def submit_query(request: QueryRequest):
         current_agent="user"
     )
 
+
+def _approval_payload(thread_id: str, state_vals: dict) -> dict:
+    """流程暂停等待审批时返回给客户端的内容"""
+    return {
+        "thread_id": thread_id,
+        "status": "waiting_for_approval",
+        "message": "流程已暂停。请审核各智能体的输出结果：若满意请提交‘同意’以生成最终答案；若不满意请提交具体的‘修改意见’，系统将根据反馈重新生成内容。",
+        "query": state_vals.get("query"),
+        "current_agent": state_vals.get("current_agent"),
+        "query_types": state_vals.get("query_types") or [state_vals.get("query_type")],
+        "web_search_result": state_vals.get("web_search_result", {}),
+        "research_result": state_vals.get("research_result", {}),
+        "analysis_result": state_vals.get("analysis_result", {}),
+        "final_answer": state_vals.get("final_answer", ""),
+    }
+
+
+@app.post("/query")
+async def submit_query(request: QueryRequest):
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="查询不能为空")
+
+    config = {"configurable": {"thread_id": request.thread_id}}
+    initial_state = _build_initial_state(request.query)
+
     if WORKFLOW_GRAPH is None:
         raise HTTPException(status_code=503, detail="系统尚未初始化完成")
 
@@ -138,22 +234,74 @@ async def submit_query(request: QueryRequest):
         current_state  = await WORKFLOW_GRAPH.ainvoke(initial_state, config=config)
         state_vals = current_state
         print(state_vals)
-        return {
-            "thread_id": request.thread_id,
-            "status": "waiting_for_approval",
-            "message": "流程已暂停。请审核各智能体的输出结果：若满意请提交‘同意’以生成最终答案；若不满意请提交具体的‘修改意见’，系统将根据反馈重新生成内容。",
-            "query": state_vals.get("query"),
-            "current_agent": state_vals.get("current_agent"),
-            "web_search_result": state_vals.get("web_search_result", {}),
-            "research_result": state_vals.get("research_result", {}),
-            "analysis_result": state_vals.get("analysis_result", {})
-        }
+        return _approval_payload(request.thread_id, state_vals)
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"执行失败: {str(e)}")
 
 
+# 需要向客户端推送进度的图节点
+STREAM_NODES = {"analyze", "research", "analysis", "web_search", "integrate"}
+
+
+def _sse(event: str, data: dict) -> str:
+    """按 Server-Sent Events 格式编码一条事件"""
+    try:
+        payload = json.dumps(jsonable_encoder(data), ensure_ascii=False)
+    except (TypeError, ValueError):
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@app.post("/query/stream")
+async def submit_query_stream(request: QueryRequest):
+    """
+    流式版本的 /query：通过 SSE 推送节点开始/结束事件与整合阶段的 token 增量
+    事件类型：start / node_start / node_end / token / waiting_for_approval / error
+    """
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="查询不能为空")
+    if WORKFLOW_GRAPH is None:
+        raise HTTPException(status_code=503, detail="系统尚未初始化完成")
+
+    config = {"configurable": {"thread_id": request.thread_id}}
+    initial_state = _build_initial_state(request.query)
+
+    async def event_generator():
+        # 首包立即返回，降低用户感知的首字节延迟
+        yield _sse("start", {"thread_id": request.thread_id, "query": request.query})
+        try:
+            async for event in WORKFLOW_GRAPH.astream_events(initial_state, config=config, version="v2"):
+                kind = event["event"]
+                name = event.get("name")
+                node = event.get("metadata", {}).get("langgraph_node")
+                if kind == "on_chain_start" and name in STREAM_NODES and node == name:
+                    yield _sse("node_start", {"node": name})
+                elif kind == "on_chain_end" and name in STREAM_NODES and node == name:
+                    output = event["data"].get("output") or {}
+                    if isinstance(output, dict):
+                        output = {k: v for k, v in output.items() if k != "messages"}
+                    yield _sse("node_end", {"node": name, "output": output})
+                elif kind == "on_chat_model_stream" and node == "integrate":
+                    delta = event["data"]["chunk"].content
+                    if delta:
+                        yield _sse("token", {"delta": delta})
+
+            snapshot = await WORKFLOW_GRAPH.aget_state(config)
+            yield _sse("waiting_for_approval", _approval_payload(request.thread_id, snapshot.values))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield _sse("error", {"detail": f"执行失败: {str(e)}"})
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/approve/{thread_id}", response_model=ApprovalResponse)
 async def approve_and_continue(thread_id: str,request: ApprovalRequest):
     config = {"configurable": {"thread_id": thread_id}}
@@ -177,9 +325,12 @@ async def approve_and_continue(thread_id: str,request: ApprovalRequest):
                 status_code=400,
                 detail="当前流程未处于待审批状态（可能尚未开始或已完成）"
             )
-    WORKFLOW_GRAPH.update_state(config, {"user_feedback": request.feedback})
+    await WORKFLOW_GRAPH.aupdate_state(config, {"user_feedback": request.feedback})
     # 👉 关键：传入 None 表示“无新输入，继续执行”
     final_state = await WORKFLOW_GRAPH.ainvoke(None, config)
+    # 流程走到 END 后标记线程已完成，便于按较短 TTL 回收
+    if CHECKPOINTER is not None and not (await WORKFLOW_GRAPH.aget_state(config)).next:
+        await CHECKPOINTER.amark_finished(thread_id)
 
     return ApprovalResponse(
         thread_id=thread_id,
@@ -189,36 +340,78 @@ async def approve_and_continue(thread_id: str,request: ApprovalRequest):
     )
 
 
-@app.post("/upload")
-async def upload_document(
-        file: UploadFile = File(...),
-        source_name: str = Form(None)
-):
-    """上传 PDF/DOCX 文件到研究知识库"""
-    if not file.filename.lower().endswith((".pdf", ".docx")):
+async def _save_upload(file: UploadFile) -> Path:
+    """校验扩展名并分块流式落盘，避免大文件整体读入内存"""
+    if not file.filename.lower().endswith(SUPPORTED_SUFFIXES):
         raise HTTPException(status_code=400, detail="仅支持 .pdf 和 .docx 文件")
-
-    # 保存文件
     file_path = UPLOAD_DIR / f"{uuid4()}{Path(file.filename).suffix}"
     with open(file_path, "wb") as f:
-        f.write(await file.read())
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            f.write(chunk)
+    return file_path
 
+
+async def _run_ingest_job(job: IngestJob) -> dict:
+    """后台 worker 执行的入库逻辑：复用检索器池中的向量库与带缓存的嵌入"""
+    retriever = RETRIEVER_POOL.get(VECTORSTORE_PATH)
     try:
-        # 获取所有工具
-        all_tools = await get_tools()
-        ingest_tool = next((t for t in all_tools if t.name == "ingest_document"), None)
+        return await ingest_file(job.file_path, retriever.store, retriever.embeddings,
+                                 source_name=job.source_name or job.filename,
+                                 metadata_file=KB_META_FILE,
+                                 mode=job.mode, on_progress=job.update_progress)
+    finally:
+        # 失败的任务也可能已写入部分片段：BM25 索引立即增量同步，依赖知识库的缓存答案一律作废
+        await asyncio.to_thread(retriever.sparse_index.sync, retriever.store.collection,
+                                version=retriever.store.version())
+        if ANSWER_CACHE is not None:
+            ANSWER_CACHE.invalidate(["research", "integrate"])
 
-        if not ingest_tool:
-            raise HTTPException(status_code=500, detail="未找到 ingest_document 工具")
 
-        # 调用工具
-        result = await ingest_tool.ainvoke({"file_path":file_path, "source_name":source_name})
-        return {"message": result}
+def _require_ingest_queue() -> IngestJobQueue:
+    if INGEST_QUEUE is None:
+        raise HTTPException(status_code=503, detail="系统尚未初始化完成")
+    return INGEST_QUEUE
 
-    finally:
-        # 清理临时文件
-        if file_path.exists():
-            file_path.unlink()
+
+@app.post("/upload")
+async def upload_document(
+        file: UploadFile = File(...),
+        source_name: str = Form(None),
+        mode: str = Form("skip")
+):
+    """
+    上传 PDF/DOCX 文件到研究知识库：落盘后立即入队返回 job_id，通过 /upload/{job_id} 查询进度
+    mode=skip 跳过已存在片段；mode=upsert 用新版本替换同一来源的旧片段
+    """
+    queue = _require_ingest_queue()
+    if mode not in INGEST_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的入库模式: {mode}")
+    file_path = await _save_upload(file)
+    job = queue.submit(file_path, filename=file.filename, source_name=source_name, mode=mode)
+    return {"job_id": job.id, "status": job.status, "message": f"已加入入库队列: {file.filename}"}
+
+
+@app.post("/upload/batch")
+async def upload_documents(files: List[UploadFile] = File(...), mode: str = Form("skip")):
+    """批量上传（如整个文档文件夹），每个文件一个入库任务"""
+    queue = _require_ingest_queue()
+    if mode not in INGEST_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的入库模式: {mode}")
+    jobs = []
+    for file in files:
+        file_path = await _save_upload(file)
+        job = queue.submit(file_path, filename=file.filename, mode=mode)
+        jobs.append({"job_id": job.id, "filename": file.filename, "status": job.status})
+    return {"jobs": jobs}
+
+
+@app.get("/upload/{job_id}")
+async def get_upload_status(job_id: str):
+    """查询入库任务进度：已解析页数、已嵌入/已写入片段数、预计剩余时间"""
+    job = _require_ingest_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="未找到该入库任务")
+    return job.to_dict()
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -2,89 +2,31 @@
 MCP 计算器服务器（基于 FastMCP）
 提供数学计算、科学函数、统计分析和单位转换功能
 """
+import asyncio
 import math
-import statistics
-import ast
-import operator
-from typing import List, Dict, Any
+import os
+import sys
+from typing import List, Dict, Any, Optional
 from decimal import getcontext
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
 from fastmcp import FastMCP
+from mcp_tools.expression_engine import compile_expression, evaluate_bindings, evaluate_many
+from mcp_tools.stats_engine import compute_statistics, ANALYSIS_TYPES
+from mcp_tools.stats_stream import StatsSessionStore, push_chunk, stats_from_file
+from mcp_tools.unit_engine import CATEGORIES, convert_values, list_units
 
 # 设置高精度上下文（虽未直接使用 Decimal，但保留以备扩展）
 getcontext().prec = 30
 
 
 # ========== 安全表达式求值器 ==========
-def safe_eval_expr(expression: str) -> float:
-    """使用 AST 安全解析数学表达式，仅允许数字和基本运算符"""
-    # 允许的字符（防止注入）
-    allowed = set("0123456789+-*/().^ ")
-    if not all(c in allowed for c in expression):
-        raise ValueError("表达式包含非法字符")
+def safe_eval_expr(expression: str, variables: Optional[Dict[str, float]] = None) -> float:
+    """使用 AST 安全解析数学表达式（编译结果带 LRU 缓存），支持命名变量与常用数学函数"""
+    return compile_expression(expression).evaluate(variables)
 
-    expr = expression.replace("^", "**").strip()
-    if not expr:
-        raise ValueError("表达式不能为空")
-
-    try:
-        tree = ast.parse(expr, mode="eval")
-    except SyntaxError as e:
-        raise ValueError(f"表达式语法错误: {e}")
-
-    # 支持的操作符
-    ops = {
-        ast.Add: operator.add,
-        ast.Sub: operator.sub,
-        ast.Mult: operator.mul,
-        ast.Div: operator.truediv,
-        ast.Pow: operator.pow,
-        ast.USub: operator.neg,
-        ast.UAdd: operator.pos,
-    }
-
-    def _eval(node):
-        if isinstance(node, (ast.Constant, ast.Num)):  # Constant for Py>=3.8, Num for older
-            val = getattr(node, 'value', getattr(node, 'n', None))
-            if isinstance(val, (int, float)):
-                return float(val)
-            raise ValueError("仅支持数值字面量")
-        elif isinstance(node, ast.BinOp):
-            left = _eval(node.left)
-            right = _eval(node.right)
-            return ops[type(node.op)](left, right)
-        elif isinstance(node, ast.UnaryOp):
-            operand = _eval(node.operand)
-            return ops[type(node.op)](operand)
-        else:
-            raise ValueError(f"不支持的表达式类型: {type(node).__name__}")
-
-    result = _eval(tree.body)
-    if not math.isfinite(result):
-        raise ValueError("计算结果为无穷或 NaN")
-    return result
-
-
-# ========== 单位转换表 ==========
-CONVERSION_RATES = {
-    "length": {
-        "meter": 1.0,
-        "kilometer": 1000.0,
-        "centimeter": 0.01,
-        "millimeter": 0.001,
-        "mile": 1609.34,
-        "yard": 0.9144,
-        "foot": 0.3048,
-        "inch": 0.0254
-    },
-    "weight": {
-        "kilogram": 1.0,
-        "gram": 0.001,
-        "milligram": 1e-6,
-        "pound": 0.453592,
-        "ounce": 0.0283495
-    }
-}
 
 # ========== FastMCP 服务器 ==========
 mcp = FastMCP(
@@ -97,11 +39,13 @@ mcp = FastMCP(
 # --- 工具 1: 基本计算器 ---
 @mcp.tool(
     name="basic_calculator",
-    description="安全计算数学表达式（支持 + - * / ^ () 和小数）"
+    annotations={"readOnlyHint": True},
+    description="安全计算数学表达式（支持 + - * / ^ % () 、小数、pi/e、sqrt/sin/cos/tan/log/ln/exp/abs，"
+                "可通过 variables 传入命名变量，如 expression='x^2+y', variables={'x': 3, 'y': 1}）"
 )
-async def basic_calculator(expression: str, precision: int = 6) -> dict:
+async def basic_calculator(expression: str, precision: int = 6, variables: Optional[Dict[str, float]] = None) -> dict:
     try:
-        result = safe_eval_expr(expression)
+        result = safe_eval_expr(expression, variables)
         formatted = f"{result:.{precision}f}"
         return {
             "success": True,
@@ -118,9 +62,48 @@ async def basic_calculator(expression: str, precision: int = 6) -> dict:
         }
 
 
+# --- 工具 1.1: 批量计算器 ---
+@mcp.tool(
+    name="batch_calculator",
+    annotations={"readOnlyHint": True},
+    description="一次调用批量求值：传 expression + bindings（多组变量取值，向量化计算，适合生成数值表），"
+                "或传 expressions（多个表达式，共享 variables）"
+)
+async def batch_calculator(
+        expression: Optional[str] = None,
+        bindings: Optional[List[Dict[str, float]]] = None,
+        expressions: Optional[List[str]] = None,
+        variables: Optional[Dict[str, float]] = None,
+        precision: int = 6
+) -> dict:
+    try:
+        if expression is not None and bindings is not None:
+            results = evaluate_bindings(expression, bindings)
+        elif expressions:
+            results = evaluate_many(expressions, variables)
+        else:
+            raise ValueError("需要提供 expression + bindings，或 expressions")
+        for item in results:
+            if item["success"]:
+                item["formatted_result"] = f"{item['result']:.{precision}f}"
+        return {
+            "success": True,
+            "count": len(results),
+            "failed": sum(1 for item in results if not item["success"]),
+            "results": results
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"批量计算失败: {str(e)}",
+            "expression": expression
+        }
+
+
 # --- 工具 2: 科学计算器 ---
 @mcp.tool(
     name="scientific_calculator",
+    annotations={"readOnlyHint": True},
     description="执行科学函数计算（sin/cos/tan/log/ln/exp/sqrt）"
 )
 async def scientific_calculator(
@@ -175,38 +158,29 @@ async def scientific_calculator(
 # --- 工具 3: 统计分析 ---
 @mcp.tool(
     name="statistical_analysis",
-    description="对数值数组进行统计分析（均值、中位数、标准差等）"
+    annotations={"readOnlyHint": True},
+    description=("对数值数组进行统计分析。analysis_type 可选: " + ", ".join(ANALYSIS_TYPES) +
+                 "；percentiles 需 percentiles 列表（默认 25/50/75），histogram 需 bins，"
+                 "correlation/covariance 需 data_y，rolling 需 window，outliers 可选 outlier_method(iqr/zscore)")
 )
-async def statistical_analysis(data: List[float], analysis_type: str = "all") -> dict:
+async def statistical_analysis(
+        data: List[float],
+        analysis_type: str = "all",
+        data_y: Optional[List[float]] = None,
+        percentiles: Optional[List[float]] = None,
+        bins: int = 10,
+        window: Optional[int] = None,
+        outlier_method: str = "iqr",
+        outlier_threshold: Optional[float] = None
+) -> dict:
     try:
-        if not data:
-            raise ValueError("数据列表不能为空")
-        if not all(isinstance(x, (int, float)) for x in data):
-            raise ValueError("数据必须全部为数字")
-
-        n = len(data)
-        results = {}
-
-        if analysis_type in ("all", "mean"):
-            results["mean"] = statistics.mean(data)
-        if analysis_type in ("all", "median"):
-            results["median"] = statistics.median(data)
-        if analysis_type in ("all", "std"):
-            results["standard_deviation"] = statistics.stdev(data) if n > 1 else 0.0
-        if analysis_type in ("all", "variance"):
-            results["variance"] = statistics.variance(data) if n > 1 else 0.0
-        if analysis_type == "all":
-            results.update({
-                "min": min(data),
-                "max": max(data),
-                "sum": sum(data),
-                "count": n
-            })
-
+        results = compute_statistics(data, analysis_type, data_y=data_y, percentile_list=percentiles, bins=bins,
+                                     window=window, outlier_method=outlier_method,
+                                     outlier_threshold=outlier_threshold)
         return {
             "success": True,
             "analysis_type": analysis_type,
-            "data_count": n,
+            "data_count": len(data),
             "results": results
         }
     except Exception as e:
@@ -217,69 +191,92 @@ async def statistical_analysis(data: List[float], analysis_type: str = "all") ->
         }
 
 
-# --- 工具 4: 单位转换（暂不支持货币）---
+# --- 工具 3.1: 流式统计（大数据集分块推送，不需要一次性传完整列表）---
+stats_sessions = StatsSessionStore()
+
+
+@mcp.tool(
+    name="stats_session_start",
+    description="开启一个流式统计会话，返回 session_id；之后用 stats_session_push 分块推送数据"
+)
+async def stats_session_start() -> dict:
+    return {"success": True, "session_id": stats_sessions.start()}
+
+
+@mcp.tool(
+    name="stats_session_push",
+    description="向流式统计会话追加一块数值数据"
+)
+async def stats_session_push(session_id: str, data: List[float]) -> dict:
+    try:
+        count = push_chunk(stats_sessions.get(session_id), data)
+        return {"success": True, "session_id": session_id, "received": len(data), "total_count": count}
+    except Exception as e:
+        return {"success": False, "error": f"推送数据失败: {str(e)}", "session_id": session_id}
+
+
+@mcp.tool(
+    name="stats_session_result",
+    annotations={"readOnlyHint": True},
+    description="获取流式统计会话的结果（计数/和/均值/方差/极值/近似分位数），close=True 时同时关闭会话"
+)
+async def stats_session_result(session_id: str, percentiles: Optional[List[float]] = None,
+                               close: bool = True) -> dict:
+    try:
+        results = stats_sessions.get(session_id).result(percentiles)
+        if close:
+            stats_sessions.close(session_id)
+        return {"success": True, "session_id": session_id, "results": results}
+    except Exception as e:
+        return {"success": False, "error": f"获取统计结果失败: {str(e)}", "session_id": session_id}
+
+
+@mcp.tool(
+    name="statistical_analysis_file",
+    annotations={"readOnlyHint": True},
+    description="流式统计本地 CSV（可指定列名）或 NPY 文件中的数值，不把整个文件读入内存"
+)
+async def statistical_analysis_file(file_path: str, column: Optional[str] = None,
+                                    percentiles: Optional[List[float]] = None) -> dict:
+    try:
+        results = await asyncio.to_thread(stats_from_file, file_path, column, percentiles)
+        return {"success": True, "file_path": file_path, "column": column, "results": results}
+    except Exception as e:
+        return {"success": False, "error": f"文件统计失败: {str(e)}", "file_path": file_path}
+
+
+# --- 工具 4: 单位转换（表驱动，暂不支持货币）---
 @mcp.tool(
     name="unit_converter",
-    description="在长度、重量、温度单位之间转换（不支持货币）"
+    annotations={"readOnlyHint": True},
+    description=("单位换算（不支持货币）。类别: " + ", ".join(CATEGORIES) +
+                 "；单位可用英文名、缩写或中文（如 km、公里、mph、GB、千瓦时、摄氏度），"
+                 "category 缺省为 auto 自动推断；传 values 可一次换算多个数值")
 )
 async def unit_converter(
-        value: float,
         from_unit: str,
         to_unit: str,
-        category: str
+        value: Optional[float] = None,
+        category: str = "auto",
+        values: Optional[List[float]] = None
 ) -> dict:
     try:
-        # 温度特殊处理
-        if category == "temperature":
-            # 输入合法性检查
-            if from_unit == "kelvin" and value < 0:
-                raise ValueError("开尔文温度不能为负")
-            if from_unit == "celsius" and value < -273.15:
-                raise ValueError("摄氏温度不能低于 -273.15°C")
-            if from_unit == "fahrenheit" and value < -459.67:
-                raise ValueError("华氏温度不能低于 -459.67°F")
-
-            # 转换逻辑
-            if from_unit == to_unit:
-                result = value
-            elif from_unit == "celsius" and to_unit == "fahrenheit":
-                result = value * 9 / 5 + 32
-            elif from_unit == "fahrenheit" and to_unit == "celsius":
-                result = (value - 32) * 5 / 9
-            elif from_unit == "celsius" and to_unit == "kelvin":
-                result = value + 273.15
-            elif from_unit == "kelvin" and to_unit == "celsius":
-                result = value - 273.15
-            elif from_unit == "fahrenheit" and to_unit == "kelvin":
-                c = (value - 32) * 5 / 9
-                result = c + 273.15
-            elif from_unit == "kelvin" and to_unit == "fahrenheit":
-                c = value - 273.15
-                result = c * 9 / 5 + 32
-            else:
-                raise ValueError(f"不支持的温度转换: {from_unit} → {to_unit}")
-
-        else:
-            # 长度/重量
-            if category not in CONVERSION_RATES:
-                raise ValueError(f"不支持的类别: {category}")
-            rates = CONVERSION_RATES[category]
-            if from_unit not in rates:
-                raise ValueError(f"未知源单位: {from_unit}")
-            if to_unit not in rates:
-                raise ValueError(f"未知目标单位: {to_unit}")
-
-            base_val = value * rates[from_unit]
-            result = base_val / rates[to_unit]
-
-        return {
+        if value is None and not values:
+            raise ValueError("需要提供 value 或 values")
+        batch = values if values else [value]
+        category, from_name, to_name, converted = convert_values(batch, from_unit, to_unit, category)
+        result = {
             "success": True,
-            "original_value": value,
-            "original_unit": from_unit,
-            "converted_value": round(result, 10),
-            "converted_unit": to_unit,
+            "original_unit": from_name,
+            "converted_unit": to_name,
             "category": category
         }
+        if values:
+            result.update({"original_values": values,
+                           "converted_values": [round(v, 10) for v in converted]})
+        else:
+            result.update({"original_value": value, "converted_value": round(converted[0], 10)})
+        return result
     except Exception as e:
         return {
             "success": False,
@@ -291,8 +288,18 @@ async def unit_converter(
         }
 
 
+@mcp.tool(
+    name="list_units",
+    annotations={"readOnlyHint": True},
+    description="列出单位换算支持的全部类别与单位"
+)
+async def list_units_tool() -> dict:
+    return {"success": True, "units": list_units()}
+
+
 # ========== 启动入口 ==========
 if __name__ == "__main__":
     print("🧮 启动 FastMCP 计算器服务器...")
-    print("💡 支持工具: basic_calculator, scientific_calculator, statistical_analysis, unit_converter")
+    print("💡 支持工具: basic_calculator, batch_calculator, scientific_calculator, statistical_analysis, stats_session_*, "
+          "statistical_analysis_file, unit_converter, list_units")
     mcp.run()
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+表达式编译引擎
+- 校验 + AST 解析只做一次，编译结果（闭包树）按表达式文本放入 LRU 缓存
+- 支持命名变量、常量（pi/e）与常用数学函数
+- 同一个编译结果既可逐个标量求值，也可把变量绑定为 NumPy 数组一次性向量化求值
+"""
+import ast
+import math
+import operator
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ALLOWED_CHARS = set("0123456789+-*/().^ %,_") | set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+}
+UNARY_OPS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+CONSTANTS = {"pi": math.pi, "e": math.e}
+# 函数名 → （标量实现, 向量实现）
+FUNCTIONS = {
+    "sqrt": (math.sqrt, np.sqrt),
+    "sin": (math.sin, np.sin),
+    "cos": (math.cos, np.cos),
+    "tan": (math.tan, np.tan),
+    "log": (math.log10, np.log10),
+    "ln": (math.log, np.log),
+    "exp": (math.exp, np.exp),
+    "abs": (abs, np.abs),
+}
+
+# 闭包签名：(变量环境, 是否向量化) -> 值
+Evaluator = Callable[[Dict[str, object], bool], object]
+
+
+class CompiledExpression:
+    __slots__ = ("expression", "variables", "_evaluate")
+
+    def __init__(self, expression: str, variables: FrozenSet[str], evaluate: Evaluator):
+        self.expression = expression
+        self.variables = variables
+        self._evaluate = evaluate
+
+    def _check_bindings(self, bindings: Dict[str, object]):
+        missing = self.variables - set(bindings)
+        if missing:
+            raise ValueError(f"缺少变量: {', '.join(sorted(missing))}")
+
+    def evaluate(self, bindings: Optional[Dict[str, float]] = None) -> float:
+        bindings = bindings or {}
+        self._check_bindings(bindings)
+        result = self._evaluate({k: float(v) for k, v in bindings.items()}, False)
+        if isinstance(result, complex) or not math.isfinite(result):
+            raise ValueError("计算结果为无穷或 NaN")
+        return float(result)
+
+    def evaluate_vector(self, columns: Dict[str, Sequence[float]], size: int) -> np.ndarray:
+        """columns 中每个变量对应一列等长数值；不合法的结果（除零、定义域外）为 NaN"""
+        self._check_bindings(columns)
+        env = {k: np.asarray(v, dtype=np.float64) for k, v in columns.items()}
+        with np.errstate(all="ignore"):
+            result = self._evaluate(env, True)
+        result = np.broadcast_to(np.asarray(result, dtype=np.float64), (size,))
+        return np.where(np.isfinite(result), result, np.nan)
+
+
+def _compile_node(node) -> Tuple[Evaluator, set]:
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError("仅支持数值字面量")
+        value = float(node.value)
+        return (lambda env, vec: value), set()
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name in CONSTANTS:
+            value = CONSTANTS[name]
+            return (lambda env, vec: value), set()
+        if name in FUNCTIONS:
+            raise ValueError(f"{name} 是函数，需要参数")
+        return (lambda env, vec: env[name]), {name}
+    if isinstance(node, ast.BinOp):
+        if type(node.op) not in BIN_OPS:
+            raise ValueError(f"不支持的运算符: {type(node.op).__name__}")
+        op = BIN_OPS[type(node.op)]
+        left, left_vars = _compile_node(node.left)
+        right, right_vars = _compile_node(node.right)
+        return (lambda env, vec: op(left(env, vec), right(env, vec))), left_vars | right_vars
+    if isinstance(node, ast.UnaryOp):
+        if type(node.op) not in UNARY_OPS:
+            raise ValueError(f"不支持的运算符: {type(node.op).__name__}")
+        op = UNARY_OPS[type(node.op)]
+        operand, operand_vars = _compile_node(node.operand)
+        return (lambda env, vec: op(operand(env, vec))), operand_vars
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            raise ValueError("不支持的函数调用")
+        if len(node.args) != 1 or node.keywords:
+            raise ValueError(f"{node.func.id} 只接受一个参数")
+        scalar_fn, vector_fn = FUNCTIONS[node.func.id]
+        arg, arg_vars = _compile_node(node.args[0])
+        return (lambda env, vec: (vector_fn if vec else scalar_fn)(arg(env, vec))), arg_vars
+    raise ValueError(f"不支持的表达式类型: {type(node).__name__}")
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> CompiledExpression:
+    """校验、解析并编译表达式；相同文本直接命中缓存"""
+    if not all(c in ALLOWED_CHARS for c in expression):
+        raise ValueError("表达式包含非法字符")
+    expr = expression.replace("^", "**").strip()
+    if not expr:
+        raise ValueError("表达式不能为空")
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"表达式语法错误: {e}")
+    evaluate, variables = _compile_node(tree.body)
+    return CompiledExpression(expression, frozenset(variables), evaluate)
+
+
+def evaluate_bindings(expression: str, bindings: List[Dict[str, float]]) -> List[dict]:
+    """同一表达式在多组变量取值上求值；变量集合一致时整体向量化"""
+    compiled = compile_expression(expression)
+    if not bindings:
+        raise ValueError("bindings 不能为空")
+    names = sorted(compiled.variables)
+    try:
+        columns = {name: [float(b[name]) for b in bindings] for name in names}
+    except (KeyError, TypeError, ValueError):
+        columns = None
+    if columns is not None:
+        values = compiled.evaluate_vector(columns, len(bindings))
+        return [{"bindings": b, "success": True, "result": float(v)} if not np.isnan(v)
+                else {"bindings": b, "success": False, "error": "计算结果为无穷、NaN 或超出定义域"}
+                for b, v in zip(bindings, values)]
+    # 存在缺失/非数值变量时逐个求值，给出具体错误
+    results = []
+    for b in bindings:
+        try:
+            results.append({"bindings": b, "success": True, "result": compiled.evaluate(b)})
+        except Exception as e:
+            results.append({"bindings": b, "success": False, "error": str(e)})
+    return results
+
+
+def evaluate_many(expressions: List[str], variables: Optional[Dict[str, float]] = None) -> List[dict]:
+    """多个表达式共享同一组变量"""
+    results = []
+    for expression in expressions:
+        try:
+            results.append({"expression": expression, "success": True,
+                            "result": compile_expression(expression).evaluate(variables)})
+        except Exception as e:
+            results.append({"expression": expression, "success": False, "error": str(e)})
+    return results
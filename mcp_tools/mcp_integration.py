@@ -1,7 +1,17 @@
+import asyncio
+import importlib
 import os
 import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
 
+from fastmcp import Client as FastMCPClient
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+
+from config.env_utils import MCP_MAX_CONCURRENCY, MCP_HEALTH_INTERVAL, MCP_TRANSPORT
 
 TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
 MCP_SERVER_CONFIGS = {
@@ -21,8 +31,32 @@ MCP_SERVER_CONFIGS = {
         "transport": "stdio",
     },
 }
+# 进程内模式：服务名 → （模块, FastMCP 实例属性名）
+MCP_SERVER_MODULES: Dict[str, Tuple[str, str]] = {
+    "research_server": ("mcp_tools.research_tools", "mcp"),
+    "calculator_server": ("mcp_tools.calculator_server", "mcp"),
+    "web_tools_server": ("mcp_tools.web_tools", "server"),
+}
+MCP_TRANSPORTS = ("stdio", "inprocess")
+_mounted_servers: Dict[str, object] = {}
+
+
+async def load_inprocess_server(name: str):
+    """导入服务模块并取出 FastMCP 实例；模块级初始化（Chroma、嵌入缓存）与宿主进程共享，
+    模块提供 startup() 时在首次挂载时执行一次"""
+    if name not in _mounted_servers:
+        module_name, attr = MCP_SERVER_MODULES[name]
+        # 模块导入会建立 Chroma / SDK 客户端，放到线程中执行
+        module = await asyncio.to_thread(importlib.import_module, module_name)
+        startup = getattr(module, "startup", None)
+        if startup is not None:
+            await asyncio.to_thread(startup)
+        _mounted_servers[name] = getattr(module, attr)
+    return _mounted_servers[name]
+
+
 async def get_tools():
-    """获取所有MCP工具"""
+    """获取所有MCP工具（一次性客户端，每次工具调用都会重新拉起服务；服务进程内请使用 MCPSessionPool）"""
     try:
         # 1. 创建客户端
         client = MultiServerMCPClient(MCP_SERVER_CONFIGS)
@@ -33,3 +67,209 @@ async def get_tools():
     except Exception as e:
         print(f"工具加载失败: {e}")
         return []  # 返回空列表，系统仍可运行
+
+
+class _ServerHandle:
+    """单个 MCP 服务的长连接状态"""
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.session = None
+        self.tools: Dict[str, BaseTool] = {}
+        self.wrapped: Dict[str, BaseTool] = {}  # 对外暴露的包装工具，随每次（重新）连接同步
+        self.task: Optional[asyncio.Task] = None
+        self.stop_event = asyncio.Event()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.restart_lock = asyncio.Lock()
+        self.restarts = 0
+        self.generation = 0
+        self.calls = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.started_at: Optional[float] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self.task is not None and not self.task.done()
+
+
+class MCPSessionPool:
+    """
+    常驻 MCP 会话池（由 FastAPI lifespan 管理）
+    - 每个服务只启动一次，stdio 子进程与会话在整个进程生命周期内复用
+    - 定期 ping 做健康检查，会话失效或子进程崩溃时自动重启
+    - 每个服务独立的并发上限，避免单个慢服务被打满
+    """
+
+    def __init__(self, configs: Dict = None, max_concurrency: int = MCP_MAX_CONCURRENCY,
+                 health_interval: float = MCP_HEALTH_INTERVAL, transport: str = MCP_TRANSPORT):
+        if transport not in MCP_TRANSPORTS:
+            raise ValueError(f"不支持的 MCP 传输方式: {transport}，可选: {', '.join(MCP_TRANSPORTS)}")
+        self.configs = configs or MCP_SERVER_CONFIGS
+        self.client = MultiServerMCPClient(self.configs)
+        self.transport = transport
+        self.max_concurrency = max_concurrency
+        self.health_interval = health_interval
+        self._handles: Dict[str, _ServerHandle] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        for name in self.configs:
+            self._handles[name] = _ServerHandle(name, self.max_concurrency)
+        results = await asyncio.gather(*(self._connect(h) for h in self._handles.values()),
+                                       return_exceptions=True)
+        for handle, result in zip(self._handles.values(), results):
+            if isinstance(result, Exception):
+                print(f"❌ MCP 服务 {handle.name} 启动失败: {result}")
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    @asynccontextmanager
+    async def _open_session(self, name: str):
+        """stdio：拉起子进程并通过 JSON-RPC 管道通信；inprocess：FastMCP 内存传输，同一事件循环内直接分发"""
+        if self.transport == "inprocess":
+            async with FastMCPClient(await load_inprocess_server(name)) as client:
+                yield client.session
+        else:
+            async with self.client.session(name) as session:
+                yield session
+
+    async def _run_session(self, handle: _ServerHandle, ready: asyncio.Future):
+        # 会话在独立任务中进入/退出，保证 anyio 取消作用域始终在同一任务内关闭
+        try:
+            async with self._open_session(handle.name) as session:
+                tools = await load_mcp_tools(session)
+                handle.session = session
+                handle.tools = {t.name: t for t in tools}
+                self._sync_wrapped(handle)
+                handle.started_at = time.time()
+                handle.generation += 1
+                ready.set_result(True)
+                await handle.stop_event.wait()
+        except Exception as e:
+            handle.last_error = str(e)
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"⚠️ MCP 服务 {handle.name} 会话异常退出: {e}")
+        finally:
+            handle.session = None
+
+    async def _connect(self, handle: _ServerHandle):
+        handle.stop_event = asyncio.Event()
+        ready = asyncio.get_running_loop().create_future()
+        handle.task = asyncio.create_task(self._run_session(handle, ready))
+        await ready
+
+    async def _disconnect(self, handle: _ServerHandle):
+        handle.stop_event.set()
+        if handle.task is not None:
+            try:
+                await asyncio.wait_for(handle.task, timeout=10)
+            except Exception:
+                handle.task.cancel()
+        handle.session = None
+
+    async def restart(self, name: str, expected_generation: Optional[int] = None):
+        """重启服务；传入 expected_generation 时，若期间已被其他调用重启则跳过"""
+        handle = self._handles[name]
+        async with handle.restart_lock:
+            if expected_generation is not None and handle.generation != expected_generation and handle.alive:
+                return
+            print(f"🔄 重启 MCP 服务: {name}")
+            await self._disconnect(handle)
+            await self._connect(handle)
+            handle.restarts += 1
+
+    async def _ensure_alive(self, handle: _ServerHandle):
+        if not handle.alive:
+            await self.restart(handle.name, expected_generation=handle.generation)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for handle in self._handles.values():
+                try:
+                    if not handle.alive:
+                        raise RuntimeError("会话已断开")
+                    await asyncio.wait_for(handle.session.send_ping(), timeout=5)
+                except Exception as e:
+                    handle.last_error = str(e)
+                    try:
+                        await self.restart(handle.name)
+                    except Exception as restart_error:
+                        print(f"❌ MCP 服务 {handle.name} 重启失败: {restart_error}")
+
+    def _sync_wrapped(self, handle: _ServerHandle):
+        """按当前会话的工具列表同步包装工具：启动失败后由健康检查拉起、或重启后工具有增减时都能反映出来；
+        仍存在的工具沿用原包装对象，已绑定到智能体上的引用继续有效"""
+        wrapped = {name: handle.wrapped.get(name) or self._wrap_tool(handle, tool)
+                   for name, tool in handle.tools.items()}
+        added, removed = wrapped.keys() - handle.wrapped.keys(), handle.wrapped.keys() - wrapped.keys()
+        if handle.wrapped and (added or removed):
+            print(f"🔧 MCP 服务 {handle.name} 工具变化: 新增 {sorted(added)}，移除 {sorted(removed)}")
+        handle.wrapped = wrapped
+
+    def _wrap_tool(self, handle: _ServerHandle, tool: BaseTool) -> BaseTool:
+        """包装工具：调用时取当前会话的实现（重启后自动切换），并受服务级并发上限约束；
+        会话异常时重启服务，只有服务标注为只读或幂等（MCP readOnlyHint / idempotentHint）的工具才自动重试一次，
+        入库、推送统计数据等写操作可能在中断前已经生效，不重复执行"""
+        pool = self
+        tool_name = tool.name
+        metadata = tool.metadata or {}
+        retryable = bool(metadata.get("readOnlyHint") or metadata.get("idempotentHint"))
+
+        def _current() -> BaseTool:
+            if tool_name not in handle.tools:
+                raise ToolException(f"MCP 服务 {handle.name} 重启后不再提供工具 {tool_name}")
+            return handle.tools[tool_name]
+
+        async def _call(**kwargs):
+            async with handle.semaphore:
+                handle.calls += 1
+                await pool._ensure_alive(handle)
+                generation = handle.generation
+                try:
+                    return await _current().ainvoke(kwargs)
+                except ToolException:
+                    # 工具自身返回的错误，不代表会话异常
+                    raise
+                except Exception as e:
+                    # 会话/子进程异常：重启服务，只读或幂等的工具重试一次
+                    handle.failures += 1
+                    handle.last_error = str(e)
+                    await pool.restart(handle.name, expected_generation=generation)
+                    if not retryable:
+                        raise ToolException(f"MCP 服务 {handle.name} 在执行 {tool_name} 时会话中断（已重启），"
+                                            f"该操作可能已经生效，未自动重试: {e}")
+                    return await _current().ainvoke(kwargs)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            coroutine=_call,
+            metadata={**(tool.metadata or {}), "mcp_server": handle.name},
+        )
+
+    def get_tools(self) -> List[BaseTool]:
+        """当前已连接服务提供的全部工具"""
+        return [tool for handle in self._handles.values() for tool in handle.wrapped.values()]
+
+    def stats(self) -> list:
+        return [{
+            "server": h.name,
+            "transport": self.transport,
+            "alive": h.alive,
+            "tools": sorted(h.tools),
+            "calls": h.calls,
+            "failures": h.failures,
+            "restarts": h.restarts,
+            "in_flight": self.max_concurrency - h.semaphore._value,
+            "last_error": h.last_error,
+            "uptime_s": round(time.time() - h.started_at, 1) if h.started_at and h.alive else None,
+        } for h in self._handles.values()]
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+        await asyncio.gather(*(self._disconnect(h) for h in self._handles.values()), return_exceptions=True)
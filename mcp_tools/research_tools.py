@@ -1,93 +1,156 @@
 # research_tools.py (修正版)
 
+import asyncio
 import json
 from pathlib import Path
 from typing import Optional, List
 import sys
 import os
 from datetime import datetime
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
-from langchain_community.embeddings import DashScopeEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 from fastmcp import FastMCP
-from config.env_utils import ALi_API_KEY
+from config.env_utils import VECTORSTORE_PATH
+from RAG.sparse_index import fuse_documents
+from RAG.metadata_index import SourceIndex, build_where, index_fields, backfill_index_fields
+from config.env_utils import HYBRID_CANDIDATE_FACTOR
+from RAG.ingestion import ingest_file, update_kb_meta, chunk_id, SUPPORTED_SUFFIXES, INGEST_MODES
+from RAG.vectorstore import get_vectorstore
 
 mcp = FastMCP(name="research_server", instructions="检索查询mcp服务器")
 
-embeddings = DashScopeEmbeddings(model="text-embedding-v4", dashscope_api_key=ALi_API_KEY)
-
-vectorstore_path = "/root/autodl-tmp/research_vectorstore"
+vectorstore_path = VECTORSTORE_PATH
 os.makedirs(vectorstore_path, exist_ok=True)
 METADATA_FILE = Path(vectorstore_path) / "knowledge_meta.json"
 
-vectorstore = Chroma(persist_directory=vectorstore_path, embedding_function=embeddings)
+# 共享向量库门面：进程内挂载时与 FastAPI 的检索器共用同一个 Chroma 句柄与嵌入缓存；
+# stdio 子进程中是独立句柄：所有写入持有目录级写锁并递增版本号，任一进程发现版本号被对方推进后
+# 先重新打开 Chroma 客户端再检索/写入，BM25 与来源索引也据此刷新
+store = get_vectorstore(vectorstore_path)
+embeddings = store.embeddings
+# BM25 稀疏索引挂在门面上：进程内挂载时与检索器共用同一份，首次检索时全量加载，之后按向量库版本号增量同步
+sparse_index = store.sparse_index
+# 来源索引：知识库未变化时列出来源不再扫描集合
+source_index = SourceIndex()
+
+
+def startup():
+    """服务启动时执行一次（stdio 子进程启动或进程内挂载时）：旧片段补齐过滤字段，已补齐时不写入"""
+    backfilled = backfill_index_fields(store)
+    if backfilled:
+        print(f"🏷️ 已为 {backfilled} 个旧片段补齐过滤字段", file=sys.stderr)
+
 
 # ===== 工具定义 =====
-@mcp.tool(name="semantic_search", description="根据输入的查询内容，返回最相关的内容")
-async def semantic_search(query: str, top_k: int = 5) -> list:
+async def _hybrid_search(query: str, top_k: int, where: Optional[dict] = None) -> list:
+    candidates = top_k * HYBRID_CANDIDATE_FACTOR
+    await asyncio.to_thread(store.sync_sparse)
+    dense_docs, sparse_hits = await asyncio.gather(
+        asyncio.to_thread(store.similarity_search, query, k=candidates, filter=where),
+        asyncio.to_thread(sparse_index.search, query, candidates, where),
+    )
+    return fuse_documents(dense_docs, sparse_hits, sparse_index, top_n=top_k)
+
+
+def _to_result(rank: int, doc: Document) -> dict:
+    metadata = doc.metadata
+    return {
+        "rank": rank,
+        "id": doc.id,
+        "content": doc.page_content,
+        "source": metadata.get("source", "未知来源"),
+        "category": metadata.get("category"),
+        "tags": [t for t in str(metadata.get("tags") or "").split(",") if t],
+        "date": metadata.get("date") or metadata.get("added_at") or metadata.get("ingested_at"),
+        "page": metadata.get("page"),
+        "score": metadata.get("rrf_score"),
+    }
+
+
+@mcp.tool(name="semantic_search", annotations={"readOnlyHint": True},
+          description="根据输入的查询内容，返回最相关的内容（默认 BM25 + 向量混合检索，hybrid=False 时仅向量检索）。"
+                      "可按来源 source、类别 category、标签 tags（需全部命中）、入库日期范围 date_from/date_to"
+                      "（如 2024、2024-05、2024-05-01）过滤，过滤在检索阶段完成")
+async def semantic_search(query: str, top_k: int = 5, hybrid: bool = True,
+                          source: Optional[List[str]] = None, category: Optional[str] = None,
+                          tags: Optional[List[str]] = None, date_from: Optional[str] = None,
+                          date_to: Optional[str] = None) -> list:
+    try:
+        where = build_where(source=source, category=category, tags=tags, date_from=date_from, date_to=date_to)
+        if hybrid:
+            docs = await _hybrid_search(query, top_k, where)
+        else:
+            # Chroma 查询为同步调用，放到线程池执行，避免阻塞 MCP 服务事件循环
+            docs = await asyncio.to_thread(store.similarity_search, query, k=top_k, filter=where)
+        return [_to_result(i + 1, doc) for i, doc in enumerate(docs)]
+    except Exception as e:
+        return [{"error": f"搜索失败: {str(e)}"}]
+
+
+@mcp.tool(name="list_sources", annotations={"readOnlyHint": True},
+          description="列出知识库中的文档来源（片段数、类别、标签、入库时间范围），可按类别或标签筛选；"
+                      "用于确定 semantic_search 的 source 过滤值")
+async def list_sources(category: Optional[str] = None, tag: Optional[str] = None) -> list:
     try:
-        docs = vectorstore.similarity_search(query, k=top_k)
-        results = []
-        for i, doc in enumerate(docs):
-            metadata = doc.metadata
-            source = metadata.get('source', '未知来源')
-            date = metadata.get('date', metadata.get('added_at', '未知日期'))
-            results.append(
-                f"【结果 {i + 1}】\n"
-                f"来源: {source} | 日期: {date}\n"
-                f"内容: {doc.page_content[:300]}...\n"
-                f"{'-' * 50}"
-            )
-        return "\n".join(results)
+        await asyncio.to_thread(source_index.maybe_sync, store.collection, store.version())
+        return source_index.list(category=category, tag=tag)
     except Exception as e:
-        return [f"搜索失败: {str(e)}"]
+        return [{"error": f"获取来源失败: {str(e)}"}]
 
-@mcp.tool(name="add_to_knowledge_base", description="添加内容到语义搜索中")
-def add_to_knowledge_base(
+@mcp.tool(name="add_to_knowledge_base", description="添加内容到语义搜索中（相同来源的相同内容自动去重）")
+async def add_to_knowledge_base(
     text: str,
     source: str = "用户输入",
     category: str = "general",
-    tags: Optional[List[str]] = None
+    tags: Optional[List[str]] = None,
+    mode: str = "skip"
 ) -> str:
     """
     添加内容到语义搜索中
+    mode=skip：内容已存在则跳过；mode=upsert：内容已存在则刷新元数据
     """
-    global vectorstore
+    # 嵌入与写库都是同步调用，放到线程池执行（进程内挂载时不阻塞宿主事件循环）
+    return await asyncio.to_thread(_add_to_knowledge_base, text, source, category, tags, mode)
+
+
+def _add_to_knowledge_base(text: str, source: str, category: str, tags: Optional[List[str]], mode: str) -> str:
     try:
-        metadata = {
+        if mode not in INGEST_MODES:
+            return f"❌ 不支持的入库模式: {mode}"
+        doc_id = chunk_id(text, source)
+        exists = bool(store.existing_ids([doc_id]))
+        if exists and mode == "skip":
+            return f"♻️ 内容已存在，已跳过（去重）\n来源: {source}\n片段 id: {doc_id[:12]}"
+        # 标签展开为 tag:* 布尔键、时间补充数值时间戳 added_ts，供 semantic_search 过滤
+        metadata = index_fields({
             "source": source,
             "category": category,
             "tags": tags or [],
             "added_at": datetime.now().isoformat(),
             "text_length": len(text)
-        }
+        })
         doc = Document(page_content=text, metadata=metadata)
-        vectorstore.add_documents([doc])
-        vectorstore.persist()
+        if exists:
+            # 内容未变，只刷新元数据，无需重新嵌入
+            store.update([doc_id], [metadata])
+        else:
+            store.add_documents([doc], ids=[doc_id])
 
         # 更新元数据文件
-        current_count = vectorstore._collection.count()
-        meta_data = {
-            "last_updated": datetime.now().isoformat(),
-            "total_chunks": current_count
-        }
-        with open(METADATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(meta_data, f, ensure_ascii=False, indent=2)
-
-        return f"✅ 成功添加文档\n来源: {source}\n长度: {len(text)} 字符"
+        update_kb_meta(METADATA_FILE, store.count())
+
+        action = "更新" if exists else "添加"
+        return f"✅ 成功{action}文档\n来源: {source}\n长度: {len(text)} 字符"
     except Exception as e:
         return f"❌ 添加失败: {str(e)}"
 
-@mcp.tool(name="list_knowledge_base_stats", description="查看知识库统计信息")
+@mcp.tool(name="list_knowledge_base_stats", description="查看知识库统计信息", annotations={"readOnlyHint": True})
 def list_knowledge_base_stats() -> str:
     try:
-        count = vectorstore._collection.count()
+        count = store.count()
         last_updated = "未知"
         if METADATA_FILE.exists():
             with open(METADATA_FILE, "r", encoding="utf-8") as f:
@@ -97,64 +160,44 @@ def list_knowledge_base_stats() -> str:
             f"📊 知识库统计:\n"
             f"- 文档片段总数: {count}\n"
             f"- 最后更新时间: {last_updated}\n"
-            f"- 存储路径: {vectorstore_path}"
+            f"- 存储路径: {vectorstore_path}\n"
+            f"- 变更版本: {store.version()}\n"
+            f"- 向量索引: {store.index_config()}\n"
+            f"- 嵌入缓存: {embeddings.stats()}"
         )
     except Exception as e:
         return f"❌ 获取统计失败: {str(e)}"
 
-@mcp.tool(name="ingest_document", description="上传并解析 PDF 或 DOCX 文件，存入知识库")
-async def ingest_document(file_path: str, source_name: str = None) -> str:
+@mcp.tool(name="ingest_document",
+          description="上传并解析 PDF 或 DOCX 文件，存入知识库（mode=skip 跳过已存在片段，mode=upsert 替换同来源旧版本）")
+async def ingest_document(file_path: str, source_name: str = None, mode: str = "skip") -> str:
     try:
         file_path = Path(file_path).resolve()
         if not file_path.exists():
             return "❌ 文件不存在"
-        suffix = file_path.suffix.lower()
-        if suffix == ".pdf":
-            loader = PyPDFLoader(str(file_path))
-        elif suffix == ".docx":
-            loader = Docx2txtLoader(str(file_path))
-        else:
+        if file_path.suffix.lower() not in SUPPORTED_SUFFIXES:
             return "❌ 仅支持 .pdf 和 .docx 文件"
 
-        docs = loader.load()
-        if not docs:
+        # 逐页流式解析、分批嵌入与写入，结束时统一更新元数据文件
+        progress = await ingest_file(file_path, store, embeddings, source_name=source_name,
+                                     metadata_file=METADATA_FILE, mode=mode)
+        if not progress["chunks_split"]:
             return "⚠️ 文档内容为空"
 
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500, chunk_overlap=50,
-            separators=["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""]
-        )
-        split_docs = splitter.split_documents(docs)
-
-        metadata = {
-            "source": source_name or file_path.name,
-            "file_path": str(file_path),
-            "ingested_at": datetime.now().isoformat(),
-        }
-        for doc in split_docs:
-            doc.metadata.update(metadata)
-
-        global vectorstore
-        vectorstore.add_documents(split_docs)
-        vectorstore.persist()
-
-        # 更新元数据文件
-        current_count = vectorstore._collection.count()
-        meta_data = {
-            "last_updated": datetime.now().isoformat(),
-            "total_chunks": current_count
-        }
-        with open(METADATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(meta_data, f, ensure_ascii=False, indent=2)
-
-        return f"✅ 成功解析并添加 {len(split_docs)} 个文本片段（来源: {metadata['source']}）"
+        return (f"✅ 成功解析 {progress['pages_parsed']} 页（来源: {progress['source']}）\n"
+                f"- 新增片段: {progress['chunks_new']}\n"
+                f"- 去重跳过: {progress['chunks_deduplicated']}\n"
+                f"- 元数据更新: {progress['chunks_updated']}\n"
+                f"- 删除旧片段: {progress['chunks_removed']}")
     except Exception as e:
         import traceback
-        print(f"[ERROR] ingest_document failed: {e}")
+        print(f"[ERROR] ingest_document failed: {e}", file=sys.stderr)
         traceback.print_exc()
         return f"❌ 解析失败: {str(e)}"
 
 if __name__ == "__main__":
-    print("🚀 启动基于 Qwen Embedding 的研究服务器 (FastMCP)")
-    print("💡 请确保已设置 DASHSCOPE_API_KEY 环境变量")
+    # stdio 传输下 stdout 是 JSON-RPC 通道，提示信息只能写 stderr
+    print("🚀 启动基于 Qwen Embedding 的研究服务器 (FastMCP)", file=sys.stderr)
+    print("💡 请确保已设置 DASHSCOPE_API_KEY 环境变量", file=sys.stderr)
+    startup()
     mcp.run()
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""
+统计分析引擎（NumPy 向量化）
+- 数据先转换为连续的 float64 数组，类型校验一次完成，不再逐元素 isinstance
+- 小数据量（≤ EXACT_THRESHOLD）的基础统计沿用 statistics 模块，保证与原有结果逐位一致；
+  大数据量单遍分块扫描：和、极值、离差平方和在同一块内算完再合并，整条数组只从内存读取一次
+- 未知的分析类型与原实现一致：不报错，返回空结果
+- 扩展：百分位数、直方图、相关系数/协方差、滑动窗口聚合、离群点检测
+"""
+import math
+import statistics
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ANALYSIS_TYPES = ("all", "mean", "median", "std", "variance", "percentiles", "histogram",
+                  "correlation", "covariance", "rolling", "outliers")
+# 不超过该长度时基础统计使用 statistics 模块（精确有理数运算）
+EXACT_THRESHOLD = 1000
+# 列表类结果（滑动窗口、离群点下标）最多返回的元素个数，避免 MCP 响应过大
+MAX_RETURN_ITEMS = 1000
+# 单遍扫描的块大小：一块数据留在缓存中完成求和、极值与离差平方和
+MOMENT_CHUNK = 16384
+# 滑动窗口总元素数（窗口数 × 窗口大小）不超过该值时逐窗口精确计算均值/标准差
+ROLLING_EXACT_ELEMENTS = 5_000_000
+
+
+def to_array(data: Sequence[float], name: str = "data") -> np.ndarray:
+    if data is None or len(data) == 0:
+        raise ValueError(f"{name} 不能为空")
+    arr = np.asarray(data)
+    if arr.ndim != 1 or arr.dtype.kind not in "biuf":
+        raise ValueError(f"{name} 必须全部为数字")
+    return np.ascontiguousarray(arr, dtype=np.float64)
+
+
+def moments(arr: np.ndarray) -> Tuple[float, float, float, float, float]:
+    """单遍分块扫描，返回 (和, 均值, 离差平方和, 最小值, 最大值)；块间按 Chan 等人的并行方差公式合并"""
+    count, mean, m2, total = 0, 0.0, 0.0, 0.0
+    lo, hi = math.inf, -math.inf
+    for start in range(0, arr.size, MOMENT_CHUNK):
+        chunk = arr[start:start + MOMENT_CHUNK]
+        size = chunk.size
+        chunk_sum = float(chunk.sum())
+        chunk_mean = chunk_sum / size
+        centered = chunk - chunk_mean
+        lo, hi = min(lo, float(chunk.min())), max(hi, float(chunk.max()))
+        delta = chunk_mean - mean
+        merged = count + size
+        mean += delta * size / merged
+        m2 += float(centered @ centered) + delta * delta * count * size / merged
+        count, total = merged, total + chunk_sum
+    return total, mean, m2, lo, hi
+
+
+def basic_stats(data: Sequence[float], arr: np.ndarray, analysis_type: str) -> dict:
+    n = arr.size
+    results = {}
+    if n <= EXACT_THRESHOLD:
+        if analysis_type in ("all", "mean"):
+            results["mean"] = statistics.mean(data)
+        if analysis_type in ("all", "median"):
+            results["median"] = statistics.median(data)
+        if analysis_type in ("all", "std"):
+            results["standard_deviation"] = statistics.stdev(data) if n > 1 else 0.0
+        if analysis_type in ("all", "variance"):
+            results["variance"] = statistics.variance(data) if n > 1 else 0.0
+        if analysis_type == "all":
+            results.update({"min": min(data), "max": max(data), "sum": sum(data), "count": n})
+        return results
+
+    if analysis_type != "median":
+        total, mean, m2, lo, hi = moments(arr)
+        variance = m2 / (n - 1)
+    if analysis_type in ("all", "mean"):
+        results["mean"] = mean
+    if analysis_type in ("all", "median"):
+        results["median"] = float(np.median(arr))
+    if analysis_type in ("all", "std"):
+        results["standard_deviation"] = math.sqrt(variance)
+    if analysis_type in ("all", "variance"):
+        results["variance"] = variance
+    if analysis_type == "all":
+        results.update({"min": lo, "max": hi, "sum": total, "count": n})
+    return results
+
+
+def percentiles(arr: np.ndarray, qs: Optional[List[float]] = None) -> dict:
+    qs = qs or [25, 50, 75]
+    if any(q < 0 or q > 100 for q in qs):
+        raise ValueError("百分位必须在 0~100 之间")
+    values = np.percentile(arr, qs)
+    return {f"p{q:g}": float(v) for q, v in zip(qs, values)}
+
+
+def histogram(arr: np.ndarray, bins: int = 10) -> dict:
+    if bins < 1:
+        raise ValueError("bins 必须为正整数")
+    counts, edges = np.histogram(arr, bins=bins)
+    return {"counts": counts.tolist(), "bin_edges": edges.tolist()}
+
+
+def _paired(data_x: Sequence[float], arr: np.ndarray, data_y: Optional[Sequence[float]]):
+    if data_y is None:
+        raise ValueError("相关/协方差分析需要提供 data_y")
+    arr_y = to_array(data_y, "data_y")
+    if arr_y.size != arr.size:
+        raise ValueError("data 与 data_y 长度必须一致")
+    if arr.size < 2:
+        raise ValueError("至少需要 2 个数据点")
+    return arr_y
+
+
+def correlation(data_x, arr: np.ndarray, data_y) -> float:
+    arr_y = _paired(data_x, arr, data_y)
+    if arr.size <= EXACT_THRESHOLD:
+        return statistics.correlation(list(data_x), list(data_y))
+    if arr.std() == 0 or arr_y.std() == 0:
+        raise ValueError("至少有一个序列为常数，相关系数无定义")
+    return float(np.corrcoef(arr, arr_y)[0, 1])
+
+
+def covariance(data_x, arr: np.ndarray, data_y) -> float:
+    arr_y = _paired(data_x, arr, data_y)
+    if arr.size <= EXACT_THRESHOLD:
+        return statistics.covariance(list(data_x), list(data_y))
+    return float(np.cov(arr, arr_y, ddof=1)[0, 1])
+
+
+def rolling(arr: np.ndarray, window: Optional[int]) -> dict:
+    """滑动窗口均值/标准差/最小/最大；结果过长时只返回最后 MAX_RETURN_ITEMS 个"""
+    if not window or window < 1 or window > arr.size:
+        raise ValueError("window 必须在 1 与数据长度之间")
+    views = np.lib.stride_tricks.sliding_window_view(arr, window)
+    if views.size <= ROLLING_EXACT_ELEMENTS:
+        # 规模较小时直接在窗口视图上计算，结果精确
+        means = views.mean(axis=1)
+        stds = views.std(axis=1, ddof=1) if window > 1 else np.zeros(views.shape[0])
+    else:
+        # 前缀和求窗口均值与方差：O(n)，与窗口大小无关；先减去全局均值以减小相消误差
+        offset = arr.mean()
+        shifted = arr - offset
+        csum = np.concatenate(([0.0], np.cumsum(shifted)))
+        csum_sq = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+        sums = csum[window:] - csum[:-window]
+        means = sums / window
+        if window > 1:
+            variances = (csum_sq[window:] - csum_sq[:-window] - sums * means) / (window - 1)
+            stds = np.sqrt(np.clip(variances, 0.0, None))
+        else:
+            stds = np.zeros_like(means)
+        means = means + offset
+    mins, maxs = views.min(axis=1), views.max(axis=1)
+    total = means.size
+    tail = slice(max(total - MAX_RETURN_ITEMS, 0), total)
+    return {
+        "window": window,
+        "points": total,
+        "truncated": total > MAX_RETURN_ITEMS,
+        "mean": means[tail].tolist(),
+        "std": stds[tail].tolist(),
+        "min": mins[tail].tolist(),
+        "max": maxs[tail].tolist(),
+    }
+
+
+def outliers(arr: np.ndarray, method: str = "iqr", threshold: Optional[float] = None) -> dict:
+    """iqr：超出 [Q1 - k·IQR, Q3 + k·IQR]（默认 k=1.5）；zscore：|z| > k（默认 k=3）"""
+    if method == "iqr":
+        k = 1.5 if threshold is None else threshold
+        q1, q3 = np.percentile(arr, [25, 75])
+        lower, upper = q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+    elif method == "zscore":
+        k = 3.0 if threshold is None else threshold
+        mean = arr.mean()
+        std = arr.std(ddof=1) if arr.size > 1 else 0.0
+        if std == 0:
+            lower, upper = mean, mean
+        else:
+            lower, upper = mean - k * std, mean + k * std
+    else:
+        raise ValueError(f"不支持的离群点检测方法: {method}")
+    mask = (arr < lower) | (arr > upper)
+    indices = np.flatnonzero(mask)
+    return {
+        "method": method,
+        "threshold": k,
+        "lower_bound": float(lower),
+        "upper_bound": float(upper),
+        "count": int(indices.size),
+        "indices": indices[:MAX_RETURN_ITEMS].tolist(),
+        "values": arr[indices[:MAX_RETURN_ITEMS]].tolist(),
+    }
+
+
+def compute_statistics(data: Sequence[float], analysis_type: str = "all", data_y: Optional[Sequence[float]] = None,
+                       percentile_list: Optional[List[float]] = None, bins: int = 10,
+                       window: Optional[int] = None, outlier_method: str = "iqr",
+                       outlier_threshold: Optional[float] = None) -> dict:
+    arr = to_array(data)
+    if analysis_type not in ANALYSIS_TYPES:
+        return {}
+    if analysis_type in ("all", "mean", "median", "std", "variance"):
+        return basic_stats(data, arr, analysis_type)
+    if analysis_type == "percentiles":
+        return percentiles(arr, percentile_list)
+    if analysis_type == "histogram":
+        return histogram(arr, bins)
+    if analysis_type == "correlation":
+        return {"correlation": correlation(data, arr, data_y)}
+    if analysis_type == "covariance":
+        return {"covariance": covariance(data, arr, data_y)}
+    if analysis_type == "rolling":
+        return rolling(arr, window)
+    return outliers(arr, outlier_method, outlier_threshold)
@@ -0,0 +1,217 @@
+"""
+流式 / 分块统计
+数据分块推送（或直接读取本地 CSV/NPY 文件），只维护在线累加器，从不物化完整数据：
+- 计数、和、最小、最大
+- 均值/方差：块内向量化计算后按 Chan 并行公式与已有结果合并（Welford 的分块形式）
+- 分位数：KLL 风格的压缩草图，内存 O(k·log(n/k))
+"""
+import csv
+import math
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from config.env_utils import STATS_SESSION_TTL, STATS_SKETCH_K, STATS_FILE_CHUNK_ROWS
+from mcp_tools.stats_engine import to_array
+
+
+class QuantileSketch:
+    """KLL 风格分位数草图：第 h 层的元素权重为 2^h，越低的层容量越小"""
+
+    def __init__(self, k: int = STATS_SKETCH_K, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values: np.ndarray):
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += values.size
+        self._compress()
+
+    def _compress(self):
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self.levels)):
+                items = self.levels[level]
+                if items.size <= self._capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # 奇数个时留下一个，其余两两配对随机保留一个并提升到上一层
+                odd = items.size % 2
+                promoted = items[odd:][self._rng.integers(2)::2]
+                self.levels[level] = items[:odd]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                compacted = True
+
+    def quantiles(self, qs: Sequence[float]) -> List[float]:
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(items.size, 2.0 ** h) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        values, cumulative = values[order], np.cumsum(weights[order])
+        total = cumulative[-1]
+        return [float(values[min(np.searchsorted(cumulative, q * total), values.size - 1)]) for q in qs]
+
+    def size(self) -> int:
+        return sum(items.size for items in self.levels)
+
+
+class StreamingStats:
+    def __init__(self, sketch_k: int = STATS_SKETCH_K):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0  # 与均值偏差的平方和
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.sketch = QuantileSketch(sketch_k)
+
+    def push(self, chunk: np.ndarray):
+        n_b = chunk.size
+        if n_b == 0:
+            return
+        mean_b = float(chunk.mean())
+        centered = chunk - mean_b
+        m2_b = float(centered @ centered)
+        n_a = self.count
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        # Chan 等人的并行方差合并公式
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * n_a * n_b / n
+        self.count = n
+        self.total += float(chunk.sum())
+        self.minimum = min(self.minimum, float(chunk.min()))
+        self.maximum = max(self.maximum, float(chunk.max()))
+        self.sketch.update(chunk)
+
+    def result(self, percentiles: Optional[List[float]] = None) -> dict:
+        if self.count == 0:
+            raise ValueError("尚未推送任何数据")
+        percentiles = percentiles or [25, 50, 75]
+        if any(q < 0 or q > 100 for q in percentiles):
+            raise ValueError("百分位必须在 0~100 之间")
+        variance = self.m2 / (self.count - 1) if self.count > 1 else 0.0
+        approx = self.sketch.quantiles([q / 100 for q in percentiles])
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.mean,
+            "variance": variance,
+            "standard_deviation": math.sqrt(variance),
+            "min": self.minimum,
+            "max": self.maximum,
+            "median_approx": self.sketch.quantiles([0.5])[0],
+            "percentiles_approx": {f"p{q:g}": v for q, v in zip(percentiles, approx)},
+            "sketch_items": self.sketch.size(),
+        }
+
+
+class StatsSessionStore:
+    """按 session_id 保存累加器，空闲超过 ttl 的会话在每次访问时被清理"""
+
+    def __init__(self, ttl: float = STATS_SESSION_TTL):
+        self.ttl = ttl
+        self._sessions: Dict[str, StreamingStats] = {}
+        self._last_used: Dict[str, float] = {}
+
+    def _evict_expired(self):
+        now = time.time()
+        for session_id in [s for s, t in self._last_used.items() if now - t > self.ttl]:
+            self.close(session_id)
+
+    def start(self) -> str:
+        self._evict_expired()
+        session_id = uuid.uuid4().hex
+        self._sessions[session_id] = StreamingStats()
+        self._last_used[session_id] = time.time()
+        return session_id
+
+    def get(self, session_id: str) -> StreamingStats:
+        self._evict_expired()
+        if session_id not in self._sessions:
+            raise ValueError(f"统计会话不存在或已过期: {session_id}")
+        self._last_used[session_id] = time.time()
+        return self._sessions[session_id]
+
+    def close(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def _iter_csv_chunks(path: Path, column: Optional[str], chunk_rows: int) -> Iterator[np.ndarray]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        if column is None:
+            index = 0
+            # 首行不是数字时视为表头
+            try:
+                float(header[0])
+                pending = [float(header[0])]
+            except ValueError:
+                pending = []
+        else:
+            if column not in header:
+                raise ValueError(f"CSV 中不存在列: {column}")
+            index, pending = header.index(column), []
+        for row in reader:
+            if index >= len(row) or row[index].strip() == "":
+                continue
+            try:
+                pending.append(float(row[index]))
+            except ValueError:
+                raise ValueError(f"第 {reader.line_num} 行不是数字: {row[index]}")
+            if len(pending) >= chunk_rows:
+                yield np.asarray(pending, dtype=np.float64)
+                pending = []
+        if pending:
+            yield np.asarray(pending, dtype=np.float64)
+
+
+def _iter_npy_chunks(path: Path, chunk_rows: int) -> Iterator[np.ndarray]:
+    # 内存映射读取，每次只把一块数据加载进内存
+    array = np.load(path, mmap_mode="r")
+    flat = array.reshape(-1)
+    if flat.dtype.kind not in "biuf":
+        raise ValueError("NPY 文件必须是数值数组")
+    for start in range(0, flat.size, chunk_rows):
+        yield np.asarray(flat[start:start + chunk_rows], dtype=np.float64)
+
+
+def stats_from_file(file_path: str, column: Optional[str] = None, percentiles: Optional[List[float]] = None,
+                    chunk_rows: int = STATS_FILE_CHUNK_ROWS) -> dict:
+    path = Path(file_path).expanduser().resolve()
+    if not path.exists():
+        raise FileNotFoundError(f"文件不存在: {path}")
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        chunks = _iter_csv_chunks(path, column, chunk_rows)
+    elif suffix == ".npy":
+        chunks = _iter_npy_chunks(path, chunk_rows)
+    else:
+        raise ValueError("仅支持 .csv 与 .npy 文件")
+    stats = StreamingStats()
+    for chunk in chunks:
+        stats.push(chunk)
+    return stats.result(percentiles)
+
+
+def push_chunk(stats: StreamingStats, data: Sequence[float]) -> int:
+    stats.push(to_array(data))
+    return stats.count
@@ -0,0 +1,219 @@
+"""
+表驱动的单位换算引擎
+- 每个类别一张表：单位 → 换算到基准单位的系数；温度为仿射换算（基准为开尔文）
+- 别名解析：英文全称/复数/缩写/中文（"km"、"公里"、"千米" → kilometer），先区分大小写匹配，
+  再做不区分大小写匹配（大小写不同即含义不同的别名，如 Mb / MB，只能精确匹配）
+- 未指定类别时按单位自动推断
+- 两单位之间的（比例, 偏移）预先计算并缓存，批量换算只是一次乘加
+"""
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+# 类别 → 单位 → （到基准单位的系数, 别名）
+UNIT_TABLES: Dict[str, Dict[str, Tuple[float, Tuple[str, ...]]]] = {
+    "length": {
+        "meter": (1.0, ("m", "meters", "metre", "米", "公尺")),
+        "kilometer": (1000.0, ("km", "kilometers", "kilometre", "公里", "千米")),
+        "centimeter": (0.01, ("cm", "centimeters", "厘米")),
+        "millimeter": (0.001, ("mm", "millimeters", "毫米")),
+        "micrometer": (1e-6, ("um", "μm", "micron", "微米")),
+        "nanometer": (1e-9, ("nm", "nanometers", "纳米")),
+        "mile": (1609.344, ("mi", "miles", "英里")),
+        "yard": (0.9144, ("yd", "yards", "码")),
+        "foot": (0.3048, ("ft", "feet", "英尺")),
+        "inch": (0.0254, ("in", "inches", "英寸")),
+        "nautical_mile": (1852.0, ("nmi", "海里")),
+        "li": (500.0, ("市里", "里")),
+        "zhang": (10 / 3, ("丈",)),
+        "chi": (1 / 3, ("尺", "市尺")),
+        "cun": (1 / 30, ("寸", "市寸")),
+    },
+    "weight": {
+        "kilogram": (1.0, ("kg", "kilograms", "千克", "公斤")),
+        "gram": (0.001, ("g", "grams", "克")),
+        "milligram": (1e-6, ("mg", "milligrams", "毫克")),
+        "ton": (1000.0, ("t", "tonne", "tons", "吨")),
+        "pound": (0.45359237, ("lb", "lbs", "pounds", "磅")),
+        "ounce": (0.028349523125, ("oz", "ounces", "盎司")),
+        "jin": (0.5, ("斤", "市斤")),
+        "liang": (0.05, ("两",)),
+        "carat": (0.0002, ("ct", "克拉")),
+        "stone": (6.35029318, ("st", "英石")),
+    },
+    "area": {
+        "square_meter": (1.0, ("m2", "m²", "sqm", "平方米", "平米")),
+        "square_kilometer": (1e6, ("km2", "km²", "平方公里", "平方千米")),
+        "square_centimeter": (1e-4, ("cm2", "cm²", "平方厘米")),
+        "square_millimeter": (1e-6, ("mm2", "mm²", "平方毫米")),
+        "hectare": (1e4, ("ha", "hectares", "公顷")),
+        "acre": (4046.8564224, ("acres", "英亩")),
+        "square_mile": (2589988.110336, ("mi2", "mi²", "平方英里")),
+        "square_foot": (0.09290304, ("ft2", "ft²", "sqft", "平方英尺")),
+        "square_inch": (0.00064516, ("in2", "in²", "平方英寸")),
+        "square_yard": (0.83612736, ("yd2", "yd²", "平方码")),
+        "mu": (10000 / 15, ("亩",)),
+    },
+    "volume": {
+        "cubic_meter": (1.0, ("m3", "m³", "立方米")),
+        "liter": (1e-3, ("l", "L", "litre", "liters", "升", "公升")),
+        "milliliter": (1e-6, ("ml", "mL", "millilitre", "毫升")),
+        "cubic_centimeter": (1e-6, ("cm3", "cm³", "cc", "立方厘米")),
+        "gallon": (0.003785411784, ("gal", "gallons", "us_gallon", "加仑", "美制加仑")),
+        "imperial_gallon": (0.00454609, ("uk_gallon", "英制加仑")),
+        "quart": (0.000946352946, ("qt", "夸脱")),
+        "pint": (0.000473176473, ("pt", "品脱")),
+        "cup": (0.0002365882365, ("cups", "杯")),
+        "fluid_ounce": (2.95735295625e-5, ("fl_oz", "floz", "液量盎司")),
+        "cubic_foot": (0.028316846592, ("ft3", "ft³", "立方英尺")),
+        "cubic_inch": (1.6387064e-5, ("in3", "in³", "立方英寸")),
+    },
+    "speed": {
+        "meter_per_second": (1.0, ("m/s", "mps", "米每秒", "米/秒")),
+        "kilometer_per_hour": (1 / 3.6, ("km/h", "kmh", "kph", "公里每小时", "千米每小时", "公里/小时")),
+        "mile_per_hour": (0.44704, ("mph", "mi/h", "英里每小时")),
+        "knot": (1852 / 3600, ("kn", "kt", "knots", "节")),
+        "foot_per_second": (0.3048, ("ft/s", "fps", "英尺每秒")),
+    },
+    "time": {
+        "nanosecond": (1e-9, ("ns", "纳秒")),
+        "microsecond": (1e-6, ("us", "μs", "微秒")),
+        "millisecond": (1e-3, ("ms", "毫秒")),
+        "second": (1.0, ("s", "sec", "seconds", "秒")),
+        "minute": (60.0, ("min", "minutes", "分钟")),
+        "hour": (3600.0, ("h", "hr", "hours", "小时", "时")),
+        "day": (86400.0, ("d", "days", "天", "日")),
+        "week": (604800.0, ("wk", "weeks", "周", "星期")),
+        # 月、年按格里历平均长度
+        "month": (2629746.0, ("months", "月")),
+        "year": (31556952.0, ("yr", "years", "年")),
+    },
+    "data": {
+        "bit": (0.125, ("bits", "比特", "位")),
+        "byte": (1.0, ("B", "bytes", "字节")),
+        "kilobit": (125.0, ("kbit", "Kb", "千比特")),
+        "megabit": (125000.0, ("Mbit", "Mb", "兆比特")),
+        "gigabit": (1.25e8, ("Gbit", "Gb")),
+        "kilobyte": (1e3, ("KB", "kB")),
+        "megabyte": (1e6, ("MB", "兆字节")),
+        "gigabyte": (1e9, ("GB",)),
+        "terabyte": (1e12, ("TB",)),
+        "petabyte": (1e15, ("PB",)),
+        "kibibyte": (1024.0, ("KiB",)),
+        "mebibyte": (1024.0 ** 2, ("MiB",)),
+        "gibibyte": (1024.0 ** 3, ("GiB",)),
+        "tebibyte": (1024.0 ** 4, ("TiB",)),
+    },
+    "pressure": {
+        "pascal": (1.0, ("pa", "Pa", "帕", "帕斯卡")),
+        "kilopascal": (1e3, ("kpa", "kPa", "千帕")),
+        "megapascal": (1e6, ("mpa", "MPa", "兆帕")),
+        "bar": (1e5, ("巴",)),
+        "millibar": (100.0, ("mbar", "毫巴")),
+        "atmosphere": (101325.0, ("atm", "标准大气压", "大气压")),
+        "psi": (6894.757293168, ("磅力每平方英寸",)),
+        "mmhg": (133.322387415, ("mmHg", "毫米汞柱")),
+        "torr": (101325 / 760, ("托",)),
+    },
+    "energy": {
+        "joule": (1.0, ("j", "J", "焦", "焦耳")),
+        "kilojoule": (1e3, ("kj", "kJ", "千焦")),
+        "megajoule": (1e6, ("mj", "MJ", "兆焦")),
+        "calorie": (4.184, ("cal", "卡", "卡路里")),
+        "kilocalorie": (4184.0, ("kcal", "千卡", "大卡")),
+        "watt_hour": (3600.0, ("wh", "Wh", "瓦时")),
+        "kilowatt_hour": (3.6e6, ("kwh", "kWh", "千瓦时", "度电")),
+        "electronvolt": (1.602176634e-19, ("ev", "eV", "电子伏特")),
+        "btu": (1055.05585262, ("BTU", "英热单位")),
+    },
+}
+
+# 温度：基准 = 值 × 比例 + 偏移（基准单位为开尔文）
+TEMPERATURE_UNITS: Dict[str, Tuple[float, float, Tuple[str, ...]]] = {
+    "kelvin": (1.0, 0.0, ("k", "K", "开", "开尔文")),
+    "celsius": (1.0, 273.15, ("c", "°c", "℃", "摄氏度", "摄氏")),
+    "fahrenheit": (5 / 9, 459.67 * 5 / 9, ("f", "°f", "℉", "华氏度", "华氏")),
+    "rankine": (5 / 9, 0.0, ("r", "°r", "兰氏度")),
+}
+
+CATEGORIES = tuple(UNIT_TABLES) + ("temperature",)
+
+
+def _build_aliases():
+    exact: Dict[str, Tuple[str, str]] = {}
+    for category, units in UNIT_TABLES.items():
+        for unit, (_, aliases) in units.items():
+            for alias in (unit, unit.replace("_", " ")) + aliases:
+                exact[alias] = (category, unit)
+    for unit, (_, _, aliases) in TEMPERATURE_UNITS.items():
+        for alias in (unit,) + aliases:
+            exact[alias] = ("temperature", unit)
+    # 不区分大小写的映射：小写后指向多个单位的别名视为有歧义，不放入
+    folded: Dict[str, Tuple[str, str]] = {}
+    ambiguous = set()
+    for alias, target in exact.items():
+        key = alias.lower()
+        if key in folded and folded[key] != target:
+            ambiguous.add(key)
+        folded[key] = target
+    for key in ambiguous:
+        del folded[key]
+    return exact, folded
+
+
+EXACT_ALIASES, FOLDED_ALIASES = _build_aliases()
+
+
+def resolve_unit(name: str, category: str = "auto") -> Tuple[str, str]:
+    """别名 → （类别, 标准单位名）；指定类别时优先在该类别中查找"""
+    text = name.strip()
+    if category not in ("auto", "", None):
+        if category not in CATEGORIES:
+            raise ValueError(f"不支持的类别: {category}，可选: {', '.join(CATEGORIES)}")
+        units = TEMPERATURE_UNITS if category == "temperature" else UNIT_TABLES[category]
+        if text in units:
+            return category, text
+    target = EXACT_ALIASES.get(text) or FOLDED_ALIASES.get(text.lower())
+    if target is None:
+        raise ValueError(f"未知单位: {name}")
+    if category not in ("auto", "", None) and target[0] != category:
+        raise ValueError(f"单位 {name} 属于 {target[0]}，与指定类别 {category} 不符")
+    return target
+
+
+@lru_cache(maxsize=4096)
+def conversion(from_unit: str, to_unit: str, category: str = "auto") -> Tuple[str, str, str, float, float]:
+    """返回（类别, 源单位, 目标单位, 比例, 偏移），换算结果 = 值 × 比例 + 偏移"""
+    from_cat, from_name = resolve_unit(from_unit, category)
+    to_cat, to_name = resolve_unit(to_unit, category)
+    if from_cat != to_cat:
+        raise ValueError(f"无法在 {from_cat} 与 {to_cat} 之间换算")
+    if from_cat == "temperature":
+        fs, fo, _ = TEMPERATURE_UNITS[from_name]
+        ts, to, _ = TEMPERATURE_UNITS[to_name]
+        # base = v·fs + fo；result = (base - to) / ts
+        return from_cat, from_name, to_name, fs / ts, (fo - to) / ts
+    factor = UNIT_TABLES[from_cat][from_name][0] / UNIT_TABLES[to_cat][to_name][0]
+    return from_cat, from_name, to_name, factor, 0.0
+
+
+def _check_temperature(value: float, unit: str):
+    scale, offset, _ = TEMPERATURE_UNITS[unit]
+    if value * scale + offset < -1e-9:
+        raise ValueError(f"温度 {value} {unit} 低于绝对零度")
+
+
+def convert_values(values: List[float], from_unit: str, to_unit: str,
+                   category: str = "auto") -> Tuple[str, str, str, List[float]]:
+    category, from_name, to_name, scale, offset = conversion(from_unit, to_unit, category or "auto")
+    if category == "temperature":
+        for value in values:
+            _check_temperature(value, from_name)
+    if from_name == to_name:
+        return category, from_name, to_name, list(values)
+    return category, from_name, to_name, [value * scale + offset for value in values]
+
+
+def list_units() -> Dict[str, List[str]]:
+    units = {category: list(table) for category, table in UNIT_TABLES.items()}
+    units["temperature"] = list(TEMPERATURE_UNITS)
+    return units
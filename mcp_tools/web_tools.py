@@ -1,4 +1,5 @@
 # mcp_servers/zhipu_search_mcp.py
+import asyncio
 import sys
 import os
 
@@ -23,8 +24,8 @@ server = FastMCP(
 client=ZhipuAiClient(api_key=zhipu_API_KEY)
 
 
-@server.tool(name="zhiputool")
-def my_search(query: str) -> str:
+@server.tool(name="zhiputool", annotations={"readOnlyHint": True})
+async def my_search(query: str) -> str:
     """
     使用智谱AI高级搜索引擎（search_pro）查询最新网络信息。
     适用于：实时新闻、天气、股价、体育赛事、科技动态等。
@@ -33,7 +34,9 @@ def my_search(query: str) -> str:
     try:
         print(f"[MCP] 执行 zhiputool，查询: {query}")
 
-        response = client.web_search.web_search(
+        # SDK 为同步调用，放到线程池执行（进程内挂载时不阻塞宿主事件循环）
+        response = await asyncio.to_thread(
+            client.web_search.web_search,
             search_engine="search_pro",
             search_query=query
         )
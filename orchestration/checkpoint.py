@@ -0,0 +1,233 @@
+# app/orchestration/checkpoint.py
+"""
+可插拔、有界的图状态检查点
+- sqlite：本地 SQLite 持久化，进程重启后待审批的线程仍可继续
+- memory：进程内存储（仅用于开发/基准），同样带 TTL 淘汰与压缩
+两种后端都提供：线程活跃度跟踪、已完成/废弃线程的 TTL 淘汰、单线程旧检查点压缩、统计信息
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Tuple
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from config.env_utils import (CHECKPOINT_BACKEND, CHECKPOINT_DB_PATH, CHECKPOINT_FINISHED_TTL,
+                              CHECKPOINT_ABANDONED_TTL, CHECKPOINT_KEEP_PER_THREAD,
+                              CHECKPOINT_MAINTENANCE_INTERVAL)
+
+
+class BoundedMemorySaver(MemorySaver):
+    """带 TTL 淘汰与压缩的内存检查点"""
+
+    def __init__(self, finished_ttl: float = CHECKPOINT_FINISHED_TTL,
+                 abandoned_ttl: float = CHECKPOINT_ABANDONED_TTL,
+                 keep_per_thread: int = CHECKPOINT_KEEP_PER_THREAD):
+        super().__init__()
+        self.finished_ttl = finished_ttl
+        self.abandoned_ttl = abandoned_ttl
+        self.keep_per_thread = keep_per_thread
+        # thread_id -> (最后活跃时间, 是否已完成)
+        self._activity: Dict[str, Tuple[float, bool]] = {}
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        self._activity[config["configurable"]["thread_id"]] = (time.time(), False)
+        return result
+
+    async def amark_finished(self, thread_id: str):
+        self._activity[thread_id] = (time.time(), True)
+
+    def _drop_thread(self, thread_id: str):
+        self.storage.pop(thread_id, None)
+        for key in [k for k in self.writes if k[0] == thread_id]:
+            del self.writes[key]
+        for key in [k for k in self.blobs if k[0] == thread_id]:
+            del self.blobs[key]
+        self._activity.pop(thread_id, None)
+
+    def _compact_thread(self, thread_id: str) -> int:
+        removed = 0
+        for ns, checkpoints in self.storage.get(thread_id, {}).items():
+            # checkpoint_id 为时间有序的 uuid6，按字典序即可得到新旧顺序
+            stale = sorted(checkpoints, reverse=True)[self.keep_per_thread:]
+            for checkpoint_id in stale:
+                del checkpoints[checkpoint_id]
+                self.writes.pop((thread_id, ns, checkpoint_id), None)
+                removed += 1
+        return removed
+
+    def _prune_blobs(self, thread_ids) -> int:
+        """通道值按（线程, 命名空间, 通道, 版本）单独存放，压缩后删除不再被任何保留检查点引用的版本"""
+        thread_ids = set(thread_ids)
+        referenced = set()
+        for thread_id in thread_ids:
+            for ns, checkpoints in self.storage.get(thread_id, {}).items():
+                for saved in checkpoints.values():
+                    versions = self.serde.loads_typed(saved[0]).get("channel_versions", {})
+                    referenced.update((thread_id, ns, channel, version) for channel, version in versions.items())
+        stale = [key for key in self.blobs if key[0] in thread_ids and key not in referenced]
+        for key in stale:
+            del self.blobs[key]
+        return len(stale)
+
+    async def amaintain(self) -> dict:
+        now = time.time()
+        evicted = 0
+        for thread_id, (updated_at, finished) in list(self._activity.items()):
+            ttl = self.finished_ttl if finished else self.abandoned_ttl
+            if now - updated_at > ttl:
+                self._drop_thread(thread_id)
+                evicted += 1
+        compacted = {t: self._compact_thread(t) for t in list(self.storage)}
+        # 没有删除检查点的线程，其通道值版本都仍被引用
+        pruned = self._prune_blobs(t for t, removed in compacted.items() if removed)
+        return {"evicted_threads": evicted, "compacted_checkpoints": sum(compacted.values()), "pruned_blobs": pruned}
+
+    async def astats(self) -> dict:
+        checkpoints = sum(len(cps) for nss in self.storage.values() for cps in nss.values())
+        approx_bytes = sum(len(v[1]) for v in self.blobs.values() if isinstance(v, tuple) and len(v) > 1
+                           and isinstance(v[1], (bytes, bytearray)))
+        return {
+            "backend": "memory",
+            "threads": len(self.storage),
+            "finished_threads": sum(1 for _, finished in self._activity.values() if finished),
+            "checkpoint_rows": checkpoints,
+            "write_rows": sum(len(w) for w in self.writes.values()),
+            "approx_bytes": approx_bytes,
+        }
+
+    async def aclose(self):
+        return None
+
+
+try:
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+except ImportError:  # 未安装 langgraph-checkpoint-sqlite 时退回内存后端
+    aiosqlite = None
+    AsyncSqliteSaver = None
+
+
+if AsyncSqliteSaver is not None:
+    class BoundedSqliteSaver(AsyncSqliteSaver):
+        """SQLite 持久化检查点，额外维护 thread_activity 表用于 TTL 淘汰"""
+
+        def __init__(self, conn, db_path: str, finished_ttl: float = CHECKPOINT_FINISHED_TTL,
+                     abandoned_ttl: float = CHECKPOINT_ABANDONED_TTL,
+                     keep_per_thread: int = CHECKPOINT_KEEP_PER_THREAD):
+            super().__init__(conn)
+            self.db_path = db_path
+            self.finished_ttl = finished_ttl
+            self.abandoned_ttl = abandoned_ttl
+            self.keep_per_thread = keep_per_thread
+            self._activity_ready = False
+
+        async def setup(self) -> None:
+            await super().setup()
+            if self._activity_ready:
+                return
+            async with self.lock:
+                await self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS thread_activity ("
+                    "thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, finished INTEGER NOT NULL DEFAULT 0)"
+                )
+                await self.conn.commit()
+            self._activity_ready = True
+
+        async def _touch(self, thread_id: str, finished: bool = False):
+            async with self.lock:
+                await self.conn.execute(
+                    "INSERT INTO thread_activity (thread_id, updated_at, finished) VALUES (?, ?, ?) "
+                    "ON CONFLICT(thread_id) DO UPDATE SET updated_at=excluded.updated_at, finished=excluded.finished",
+                    (thread_id, time.time(), int(finished)),
+                )
+                await self.conn.commit()
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            result = await super().aput(config, checkpoint, metadata, new_versions)
+            await self._touch(config["configurable"]["thread_id"])
+            return result
+
+        async def amark_finished(self, thread_id: str):
+            await self.setup()
+            await self._touch(thread_id, finished=True)
+
+        async def amaintain(self) -> dict:
+            await self.setup()
+            now = time.time()
+            async with self.lock:
+                cursor = await self.conn.execute(
+                    "SELECT thread_id FROM thread_activity "
+                    "WHERE (finished = 1 AND updated_at < ?) OR (finished = 0 AND updated_at < ?)",
+                    (now - self.finished_ttl, now - self.abandoned_ttl),
+                )
+                expired = [row[0] for row in await cursor.fetchall()]
+                for thread_id in expired:
+                    await self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                    await self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+                    await self.conn.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+
+                # 压缩：每个线程/命名空间只保留最近 keep_per_thread 个检查点（checkpoint_id 时间有序）
+                cursor = await self.conn.execute(
+                    "DELETE FROM checkpoints WHERE rowid IN ("
+                    " SELECT rowid FROM ("
+                    "  SELECT rowid, ROW_NUMBER() OVER ("
+                    "   PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn"
+                    "  FROM checkpoints) WHERE rn > ?)",
+                    (self.keep_per_thread,),
+                )
+                compacted = cursor.rowcount
+                await self.conn.execute(
+                    "DELETE FROM writes WHERE NOT EXISTS ("
+                    " SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id"
+                    " AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id)"
+                )
+                await self.conn.commit()
+            return {"evicted_threads": len(expired), "compacted_checkpoints": compacted}
+
+        async def astats(self) -> dict:
+            await self.setup()
+            async with self.lock:
+                counts = {}
+                for key, sql in (
+                        ("threads", "SELECT COUNT(DISTINCT thread_id) FROM checkpoints"),
+                        ("finished_threads", "SELECT COUNT(*) FROM thread_activity WHERE finished = 1"),
+                        ("checkpoint_rows", "SELECT COUNT(*) FROM checkpoints"),
+                        ("write_rows", "SELECT COUNT(*) FROM writes")):
+                    cursor = await self.conn.execute(sql)
+                    counts[key] = (await cursor.fetchone())[0]
+            size = sum(os.path.getsize(p) for p in (self.db_path, self.db_path + "-wal")
+                       if os.path.exists(p))
+            return {"backend": "sqlite", "db_path": self.db_path, "db_bytes": size, **counts}
+
+        async def aclose(self):
+            await self.conn.close()
+
+
+async def open_checkpointer(backend: str = CHECKPOINT_BACKEND, db_path: str = CHECKPOINT_DB_PATH):
+    """按配置创建检查点后端；sqlite 依赖缺失时退回内存后端"""
+    if backend == "sqlite":
+        if AsyncSqliteSaver is None:
+            print("⚠️ 未安装 langgraph-checkpoint-sqlite，检查点退回内存后端")
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            conn = await aiosqlite.connect(db_path)
+            saver = BoundedSqliteSaver(conn, db_path=db_path)
+            await saver.setup()
+            return saver
+    elif backend != "memory":
+        raise ValueError(f"不支持的检查点后端: {backend}")
+    return BoundedMemorySaver()
+
+
+async def run_maintenance_loop(checkpointer, interval: float = CHECKPOINT_MAINTENANCE_INTERVAL):
+    """后台定期淘汰过期线程并压缩旧检查点"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await checkpointer.amaintain()
+            if result["evicted_threads"] or result["compacted_checkpoints"]:
+                print(f"🧹 检查点维护: {result}")
+        except Exception as e:
+            print(f"⚠️ 检查点维护失败: {e}")
@@ -1,26 +1,32 @@
 # app/orchestration/workflow.py
 from functools import partial
-from typing import Literal
+from typing import Literal, List
 
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, END, START
 
 from agents.nodes import AgentState, analysis_query,integrate_results, run_research_node, run_analysis_node, run_web_search_node
 # 创建图
-def build_agent_workflow(research_agent, analysis_agent, web_search_agent):
-    """注册函数 → 构建图 → 返回编译对象"""
+def build_agent_workflow(research_agent, analysis_agent, web_search_agent, retriever_pool=None, checkpointer=None,
+                         answer_cache=None, router=None, analysis_tools=None):
+    """注册函数 → 构建图 → 返回编译对象；checkpointer 由 orchestration.checkpoint.open_checkpointer 创建，
+    answer_cache 为跨线程共享的 agents.answer_cache.AnswerCache（None 表示不缓存），
+    router 为 agents.router.LocalRouter（None 表示每次都由大模型调度），
+    analysis_tools 供分析分支的快速通道直接调用（None 表示总是走智能体）"""
     builder = StateGraph(AgentState)
 
     # 1. 注册节点（**关键：把函数名传进去**）
-    builder.add_node("analyze", analysis_query)  # ← 注册函数
-    builder.add_node("research", partial(run_research_node, agent=research_agent))
-    builder.add_node("analysis", partial(run_analysis_node, agent=analysis_agent))
-    builder.add_node("web_search", partial(run_web_search_node, agent=web_search_agent))
-    builder.add_node("integrate", integrate_results)
+    builder.add_node("analyze", partial(analysis_query, router=router))  # ← 注册函数
+    builder.add_node("research", partial(run_research_node, agent=research_agent, retriever_pool=retriever_pool,
+                                                 answer_cache=answer_cache))
+    builder.add_node("analysis", partial(run_analysis_node, agent=analysis_agent, answer_cache=answer_cache,
+                                         tools=analysis_tools))
+    builder.add_node("web_search", partial(run_web_search_node, agent=web_search_agent, answer_cache=answer_cache))
+    builder.add_node("integrate", partial(integrate_results, answer_cache=answer_cache))
     builder.set_entry_point("analyze")
-    # 2. 条件路由
-    def route_by_type(state: AgentState) -> Literal["research", "analysis", "web_search", "integrate"]:
-        return state["query_type"]
+    # 2. 条件路由：返回多个节点名时 LangGraph 会在同一超步内并发执行这些分支
+    def route_by_type(state: AgentState) -> List[Literal["research", "analysis", "web_search", "integrate"]]:
+        return state.get("query_types") or [state["query_type"]]
 
     def route_after_approval(state: AgentState):
         feedback = state.get("user_feedback", "").strip()
@@ -35,6 +41,7 @@ def build_agent_workflow(research_agent, analysis_agent, web_search_agent):
     builder.add_conditional_edges("analyze", route_by_type,
                                   {"research": "research", "analysis": "analysis", "web_search": "web_search",
                                    "integrate": "integrate"})
+    # 汇合：同一超步内的并行分支全部结束后，integrate 只执行一次
     builder.add_edge("research", "integrate")
     builder.add_edge("analysis", "integrate")
     builder.add_edge("web_search", "integrate")
@@ -45,13 +52,17 @@ def build_agent_workflow(research_agent, analysis_agent, web_search_agent):
     )
     #设置入口
 
-    # 添加持久化检查点[citation:1][citation:9]
-    memory =MemorySaver()  # 生产环境用文件路径
+    # 添加持久化检查点：未注入时退回进程内 MemorySaver（仅适合开发调试）
+    memory = checkpointer if checkpointer is not None else MemorySaver()
 
     # 编译图
     graph = builder.compile(
         checkpointer=memory,
         interrupt_after=["integrate"]  # 在整合前可人工干预
     )
-    graph.get_graph().draw_png("workflow.png")
+    try:
+        graph.get_graph().draw_png("workflow.png")
+    except ImportError as e:
+        # 绘图依赖 pygraphviz，缺失时不影响工作流本身
+        print(f"⚠️ 跳过工作流图绘制: {e}")
     return graph
\ No newline at end of file
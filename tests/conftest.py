@@ -0,0 +1,10 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# config.llm_config 在导入时创建各模型客户端，测试不发起真实调用，缺少密钥时用占位值保证可以构造
+for _name in ("OPENAI_API_KEY", "MOONSHINE_API_KEY", "ALI_API_KEY"):
+    os.environ.setdefault(_name, "test-key")
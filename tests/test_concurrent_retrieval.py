@@ -0,0 +1,97 @@
+"""并发检索：AdaptiveRetrieval 的异步路径不阻塞事件循环，N 个并发查询的总耗时约等于单个查询"""
+import asyncio
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+import RAG.adaptive_retrival as adaptive_retrival
+from RAG.sparse_index import BM25Index
+from RAG.vectorstore import StoreRetriever
+
+DELAY = 0.2  # 桩模型 / 桩向量检索单次调用的耗时（模拟远程嵌入与大模型请求）
+CONCURRENCY = 10
+
+
+class _FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def get(self, ids=None, include=None, **kwargs):
+        docs = [d for d in self.docs if ids is None or d.id in ids]
+        return {"ids": [d.id for d in docs], "documents": [d.page_content for d in docs],
+                "metadatas": [d.metadata for d in docs]}
+
+    def count(self):
+        return len(self.docs)
+
+
+class SlowStore:
+    """替代共享向量库门面：向量检索异步等待 DELAY，同步检索则阻塞线程（若被误用会串行化）"""
+
+    def __init__(self):
+        self.embeddings = None
+        self.docs = [Document(id=f"d{i}", page_content=f"片段 {i} 检索增强生成", metadata={"source": f"s{i}.md"})
+                     for i in range(5)]
+        self.collection = _FakeCollection(self.docs)
+        self.sparse_index = BM25Index()
+
+    def version(self):
+        return 1
+
+    def sync_sparse(self):
+        return self.sparse_index.maybe_sync(self.collection, version=self.version())
+
+    def index_config(self):
+        return {"backend": "fake"}
+
+    def as_retriever(self, k=4):
+        return StoreRetriever(store=self, k=k)
+
+    def similarity_search(self, query, k=4, filter=None):
+        time.sleep(DELAY)
+        return self.docs[:k]
+
+    async def asimilarity_search(self, query, k=4, filter=None):
+        await asyncio.sleep(DELAY)
+        return self.docs[:k]
+
+
+async def _slow_condense(inputs):
+    await asyncio.sleep(DELAY)
+    return f"{inputs['input']}（独立问题）"
+
+
+@pytest.fixture
+def retrieval(monkeypatch):
+    monkeypatch.setattr(adaptive_retrival, "get_vectorstore", lambda path: SlowStore())
+    monkeypatch.setattr(adaptive_retrival, "RAG_DEFAULT_STRATEGY", "hybrid")
+    retrieval = adaptive_retrival.AdaptiveRetrieval("unused", search_k=3)
+    retrieval.condense_chain = RunnableLambda(lambda inputs: inputs["input"], afunc=_slow_condense)
+    return retrieval
+
+
+async def _timed(calls):
+    start = time.perf_counter()
+    results = await asyncio.gather(*calls)
+    return time.perf_counter() - start, results
+
+
+def test_concurrent_simple_retrieval_overlaps(retrieval):
+    elapsed, results = asyncio.run(_timed(
+        [retrieval.adaptive_retrieve(f"问题 {i}", strategy="simple") for i in range(CONCURRENCY)]))
+    assert all(len(r) == 3 for r in results)
+    # 串行需要 CONCURRENCY × DELAY；并发应接近一次调用的耗时
+    assert elapsed < 3 * DELAY
+
+
+def test_concurrent_history_aware_retrieval_overlaps(retrieval):
+    history = [HumanMessage(content="什么是 RAG"), AIMessage(content="检索增强生成")]
+    elapsed, results = asyncio.run(_timed(
+        [retrieval.adaptive_retrieve(f"它的流程 {i}", chat_history=history) for i in range(CONCURRENCY)]))
+    assert all(r and r[0]["metadata"]["source"].endswith(".md") for r in results)
+    assert retrieval.condense_stats()["misses"] == CONCURRENCY
+    # 每个查询依次经过改写模型与向量检索两次等待
+    assert elapsed < 2 * DELAY * 3
@@ -0,0 +1,54 @@
+"""本地路由：规则只在问题明确属于单一路由时生效，复合问题交给打分 / 大模型拆分"""
+import pytest
+
+import agents.router as router_module
+from agents.fast_path import parse_analysis_request
+from agents.router import LocalRouter
+
+COMPOUND_QUERIES = [
+    "分析特斯拉的股票趋势并查找相关新闻",
+    "今天的新闻里提到的GDP增长率是多少，帮我计算一下",
+    "介绍一下最新的量子计算论文",
+]
+
+
+@pytest.fixture(params=[True, False], ids=["multi_route", "single_route"])
+def router(request, monkeypatch):
+    monkeypatch.setattr(router_module, "MULTI_ROUTE", request.param)
+    return LocalRouter()
+
+
+@pytest.mark.parametrize("query", COMPOUND_QUERIES)
+def test_compound_queries_are_not_claimed_by_realtime_rule(router, query):
+    assert router.route(query) is None
+    assert router.stats()["rule"] == 0
+
+
+@pytest.mark.parametrize("query", ["今天北京天气怎么样", "最新新闻", "美元兑人民币实时汇率"])
+def test_realtime_only_queries_go_to_web_search(router, query):
+    decision = router.route(query)
+    assert decision.routes == ["web_search"]
+    assert decision.source == "rule"
+
+
+@pytest.mark.parametrize("query", ["123*456", "(3+4)×5=?", "计算 12/25", "12/25=?", "计算 2^10", "5英里等于多少公里"])
+def test_arithmetic_only_queries_go_to_analysis(router, query):
+    decision = router.route(query)
+    assert decision.routes == ["analysis"]
+    assert decision.source == "rule"
+    # 规则判为分析的算式，快速通道也必须能直接执行，否则仍会落到大模型
+    assert parse_analysis_request(query) is not None
+
+
+@pytest.mark.parametrize("query", ["12/25", "2024-05-01"])
+def test_bare_dates_are_not_claimed_as_arithmetic(router, query):
+    assert parse_analysis_request(query) is None
+    decision = router.route(query)
+    assert decision is None or decision.source != "rule"
+
+
+def test_rule_decision_is_cached(router):
+    router.route("123*456")
+    decision = router.route("123*456")
+    assert decision.source == "cache"
+    assert decision.routes == ["analysis"]